@@ -0,0 +1,236 @@
+"""Замеры извлечения на синтетических скриптах (см. script_generator).
+
+Для каждого размера замеряются:
+  script         — extract_script без кэша;
+  script-cached  — extract_script с прогретым кэшем разбора;
+  stream         — iter_dialogues без записи результата;
+и для папок из многих файлов:
+  batch          — extract_directory в workers процессах;
+  batch-cached   — то же с прогретым кэшем.
+
+Каждый замер идёт в отдельном процессе, чтобы пиковая память (ru_maxrss)
+относилась только к нему. Если процесс упал, не выдав результата
+(исключение, нехватка памяти на 1 ГБ), замер записывается как сбой с
+кодом выхода. Результаты пишутся в JSON; с --baseline рядом печатается
+изменение относительно прошлого прогона.
+
+Запуск: python benchmarks/bench_extraction.py --sizes 1M,10M,100M --tree 100M:200 -o bench.json
+        python benchmarks/bench_extraction.py --sizes 1G --cases script,stream --baseline bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from script_generator import parse_size, write_script, write_tree
+
+SCRIPT_CASES = ("script", "script-cached", "stream")
+TREE_CASES = ("batch", "batch-cached")
+# Как часто проверять, жив ли процесс замера (секунды)
+RESULT_POLL_INTERVAL = 1.0
+
+try:
+    import resource
+except ImportError:
+    # На Windows пиковую память не замеряем
+    resource = None
+
+
+def _peak_rss_mb(who) -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_case(case: str, input_path: str, work_dir: str, workers: int, results):
+    """Тело замера в отдельном процессе; результат уходит через очередь"""
+    from main import RenPyParser
+    from script_cache import ExtractionCache
+
+    parser = RenPyParser()
+    output = Path(work_dir) / "out.txt"
+    if case.endswith("-cached"):
+        parser.cache = ExtractionCache(Path(work_dir) / "cache")
+        # Прогрев: первый проход заполняет кэш и в замер не входит
+        if case.startswith("batch"):
+            parser.extract_directory(Path(input_path), output, workers=workers)
+        else:
+            parser.extract_script(Path(input_path), output)
+
+    start = time.perf_counter()
+    if case == "stream":
+        replicas = sum(1 for _ in parser.iter_dialogues(Path(input_path)))
+    elif case.startswith("batch"):
+        replicas = parser.extract_directory(Path(input_path), output, workers=workers)['total_replicas']
+    else:
+        replicas = parser.extract_script(Path(input_path), output)['total_replicas']
+    seconds = time.perf_counter() - start
+    results.put({
+        "seconds": seconds,
+        "replicas": replicas,
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        # Самый большой из рабочих процессов пакетного режима
+        "workers_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    })
+
+
+def measure(case: str, input_path: Path, size: int, files: int, work_dir: Path, workers: int) -> Dict:
+    case_dir = Path(tempfile.mkdtemp(prefix=f"{case}-", dir=work_dir))
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(case, str(input_path), str(case_dir), workers, results))
+    process.start()
+    row = None
+    try:
+        while row is None:
+            try:
+                row = results.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+        if row is None:
+            # Результат мог прийти между последним ожиданием и выходом процесса
+            try:
+                row = results.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+    finally:
+        process.join()
+        shutil.rmtree(case_dir, ignore_errors=True)
+    key = {
+        "case": case,
+        "bytes": size,
+        "files": files,
+        "workers": workers if case.startswith("batch") else 1,
+    }
+    if row is None:
+        return {**key, "failed": True, "exitcode": process.exitcode}
+    return {
+        **key,
+        **row,
+        "mb_per_sec": size / (1024 * 1024) / row["seconds"],
+        "replicas_per_sec": row["replicas"] / row["seconds"],
+    }
+
+
+def _prepare(work_dir: Path, name: str, make) -> Path:
+    """Сгенерированный вход переиспользуется между прогонами: генератор детерминирован"""
+    path = work_dir / name
+    done = work_dir / f"{name}.done"
+    if not done.exists():
+        if path.is_dir():
+            shutil.rmtree(path)
+        print(f"генерация {name}...", file=sys.stderr)
+        size = make(path)
+        done.write_text(str(size))
+    return path
+
+
+def _total_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*.rpy"))
+    return path.stat().st_size
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(row: Dict) -> tuple:
+    return row["case"], row["bytes"], row["files"], row["workers"]
+
+
+def print_row(row: Dict, baseline: Optional[Dict] = None):
+    if row.get("failed"):
+        print(f"{row['case']:<14} {row['bytes'] / (1024 * 1024):>8.1f} МБ {row['files']:>5} ф. "
+              f"сбой: процесс завершился с кодом {row['exitcode']}")
+        return
+    peak = f"{row['peak_rss_mb']:.0f} МБ" if row['peak_rss_mb'] is not None else "—"
+    line = (f"{row['case']:<14} {row['bytes'] / (1024 * 1024):>8.1f} МБ {row['files']:>5} ф. "
+            f"{row['seconds']:>8.2f} с {row['mb_per_sec']:>7.1f} МБ/с {peak:>8}")
+    if baseline is not None and not baseline.get("failed"):
+        line += f"  ({(baseline['seconds'] / row['seconds'] - 1) * 100:+.0f}% скорости)"
+    print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Замеры извлечения на синтетических скриптах")
+    parser.add_argument("--sizes", default="1M,10M,100M",
+                        help="размеры одиночных скриптов через запятую (до 1G)")
+    parser.add_argument("--tree", action="append", default=[], metavar="РАЗМЕР:ФАЙЛОВ",
+                        help="папка игры, например 100M:200 (можно несколько раз)")
+    parser.add_argument("--cases", default=",".join(SCRIPT_CASES + TREE_CASES),
+                        help="какие замеры делать")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="процессов для пакетного режима")
+    parser.add_argument("--work-dir", type=Path, default=Path(tempfile.gettempdir()) / "alice-bench",
+                        help="где хранить сгенерированные скрипты между прогонами")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", type=Path, help="записать результаты в JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {_key(row): row for row in json.load(f)["results"]}
+
+    inputs = []
+    for text in filter(None, args.sizes.split(",")):
+        size = parse_size(text)
+        path = _prepare(args.work_dir, f"script-{size}-{args.seed}.rpy",
+                        lambda path, size=size: write_script(path, size, args.seed))
+        inputs.append((path, 1, [case for case in cases if case in SCRIPT_CASES]))
+    for text in args.tree:
+        size, _, files = text.partition(":")
+        size, files = parse_size(size), int(files or 100)
+        path = _prepare(args.work_dir, f"tree-{size}-{files}-{args.seed}",
+                        lambda path, size=size, files=files: write_tree(path, size, files, args.seed))
+        inputs.append((path, files, [case for case in cases if case in TREE_CASES]))
+
+    rows = []
+    for path, files, input_cases in inputs:
+        size = _total_size(path)
+        for case in input_cases:
+            row = measure(case, path, size, files, args.work_dir, args.workers)
+            rows.append(row)
+            print_row(row, baseline.get(_key(row)))
+
+    if args.output:
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "results": rows,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if any(row.get("failed") for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
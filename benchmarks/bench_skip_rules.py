@@ -0,0 +1,73 @@
+"""Замер скорости проверки правил пропуска: старый список re.search против SkipRules.
+
+Запуск: python benchmarks/bench_skip_rules.py [число строк]
+"""
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from main import SkipRules
+
+
+def legacy_should_skip_line(text: str) -> bool:
+    """Прежняя реализация RenPyParser._should_skip_line"""
+    skip_patterns = [
+        r'\.(png|jpg|jpeg|mp3|ogg|wav)',
+        "persistent.", "MatrixColor", "mods/",
+        r'^show\s+', r'^hide\s+', r'^scene\s+',
+        r'^play\s+', r'^stop\s+', r'^queue\s+',
+        r'^with\s+', r'^pause\s+'
+    ]
+    text_lower = text.lower()
+    return any(re.search(pattern, text_lower, re.IGNORECASE) for pattern in skip_patterns)
+
+
+def make_lines(count: int):
+    rnd = random.Random(42)
+    samples = [
+        "Привет! Ты сегодня рано встала.",
+        "Я не знаю, что на это ответить... Может, потом поговорим?",
+        "Somewhere in the distance a bus horn sounded twice.",
+        "images/bg/ext_camp_entrance_day.png",
+        "show dv smile pioneer at center",
+        "play music music_list[\"everlasting_summer\"] fadein 3",
+        "mods/my_mod/sounds/step.ogg",
+        "persistent.sprite_time = \"day\"",
+        "Ну и жара сегодня, даже купаться не хочется.",
+        "with dissolve",
+    ]
+    return [rnd.choice(samples) + (" " * rnd.randint(0, 3)) for _ in range(count)]
+
+
+def bench(check, lines, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            check(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    lines = make_lines(count)
+    rules = SkipRules.default()
+
+    # Проверяем, что правила дают тот же ответ (кроме "persistent." — теперь это строка, а не шаблон)
+    mismatches = sum(1 for line in lines if legacy_should_skip_line(line) != (rules.search(line) is not None))
+
+    before = bench(legacy_should_skip_line, lines)
+    after = bench(lambda text: rules.search(text) is not None, lines)
+    print(f"строк: {count}, расхождений: {mismatches}")
+    print(f"было:  {before:,.0f} строк/с")
+    print(f"стало: {after:,.0f} строк/с  (x{after / before:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Детерминированный генератор Ren'Py скриптов для замеров.
+
+Скрипт похож на настоящую визуальную новеллу: определения Character,
+метки с репликами и повествованием, show/scene/play с путями к
+ресурсам, extend, реплики на несколько строк, меню и переходы. При
+одинаковых seed и размере получается байт в байт тот же файл.
+
+Запуск: python benchmarks/script_generator.py файл.rpy 10M
+        python benchmarks/script_generator.py папка/ 100M --files 200
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+from typing import List
+
+CHARACTERS = [
+    ("dv", "Алиса"), ("sl", "Славя"), ("un", "Лена"), ("us", "Ульяна"), ("mt", "Ольга Дмитриевна"),
+    ("el", "Электроник"), ("sh", "Шурик"), ("mz", "Женя"), ("e", "Eileen"), ("m", "Mary"),
+    ("k", "Kenji"), ("yu", "Юки"),
+]
+# Персонажи, определённые в отдельном файле дерева, — как 00defs.rpy у многих модов
+SHARED_CHARACTERS = CHARACTERS[:6]
+
+_WORDS = (
+    "лагерь автобус пионер вожатая солнце речка столовая музыка клуб ключ библиотека вечер "
+    "утро дорога лес костёр концерт гитара письмо секрет море небо звезда страница "
+    "bus camp river summer night letter secret guitar morning forest station "
+    "window door garden song dream memory promise").split()
+_OPENERS = ("Слушай,", "Ну", "А", "Знаешь,", "Кажется,", "Hey,", "Well,", "So", "Honestly,", "Опять", "")
+_ENDINGS = (".", "!", "?", "...", "!?", ", правда?", ", right?")
+_BACKGROUNDS = ("ext_camp_entrance_day", "int_dining_hall_day", "ext_beach_sunset", "int_library_night",
+                "ext_square_night", "int_clubs_day")
+_SPRITES = ("smile", "normal", "angry", "shy", "sad", "laugh", "surprise")
+_TRANSITIONS = ("dissolve", "fade", "vpunch", "flash")
+
+
+def _sentence(rnd: random.Random, low: int = 3, high: int = 14) -> str:
+    words = " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(low, high)))
+    opener = rnd.choice(_OPENERS)
+    text = f"{opener} {words}" if opener else words.capitalize()
+    return text + rnd.choice(_ENDINGS)
+
+
+def _characters_block(characters) -> str:
+    return "".join(f'define {tag} = Character("{name}", color="#{(i * 0x3f1a2b) % 0xffffff:06x}")\n'
+                   for i, (tag, name) in enumerate(characters))
+
+
+def _scene(rnd: random.Random, label: str, labels: List[str], speakers) -> List[str]:
+    """Одна сцена: метка, фон, музыка, реплики вперемешку с командами"""
+    lines = [f"label {label}:\n",
+             f"    scene bg {rnd.choice(_BACKGROUNDS)} with {rnd.choice(_TRANSITIONS)}\n",
+             f'    play music "music/{rnd.choice(_WORDS)}_theme.ogg" fadein 2\n']
+    for _ in range(rnd.randint(20, 60)):
+        roll = rnd.random()
+        tag = rnd.choice(speakers)
+        if roll < 0.55:
+            lines.append(f'    {tag} "{_sentence(rnd)}"\n')
+        elif roll < 0.68:
+            lines.append(f'    "{_sentence(rnd, 6, 20)}"\n')
+        elif roll < 0.75:
+            lines.append(f"    show {tag} {rnd.choice(_SPRITES)} at center\n")
+        elif roll < 0.79:
+            lines.append(f'    play sound "sfx/{rnd.choice(_WORDS)}_{rnd.randint(1, 9)}.ogg"\n')
+        elif roll < 0.83:
+            # Реплика, которая продолжается extend
+            lines.append(f'    {tag} "{_sentence(rnd)}"\n')
+            lines.append(f'    extend " {_sentence(rnd, 2, 8)}"\n')
+        elif roll < 0.87:
+            # Строка на несколько строк файла
+            lines.append(f'    {tag} "{_sentence(rnd)}\n        {_sentence(rnd)}"\n')
+        elif roll < 0.90:
+            lines.append(f'    "images/cg/{rnd.choice(_WORDS)}_{rnd.randint(1, 20)}.png"\n')
+        elif roll < 0.93:
+            lines.append(f"    with {rnd.choice(_TRANSITIONS)}\n")
+        elif roll < 0.95:
+            lines.append(f"    $ persistent.{rnd.choice(_WORDS)}_seen = True\n")
+        elif roll < 0.97:
+            lines.append(f"    # {_sentence(rnd)}\n")
+        else:
+            lines.append("\n")
+    if labels and rnd.random() < 0.3:
+        lines += ["    menu:\n",
+                  f'        "{_sentence(rnd, 2, 5)}":\n', f"            jump {rnd.choice(labels)}\n",
+                  f'        "{_sentence(rnd, 2, 5)}":\n', f'            {rnd.choice(speakers)} "{_sentence(rnd)}"\n']
+    lines.append("    return\n\n" if rnd.random() < 0.2 else "\n")
+    return lines
+
+
+def write_script(path: Path, size: int, seed: int = 0, characters=tuple(CHARACTERS), prefix: str = "s") -> int:
+    """Пишет скрипт не меньше size байт с определениями characters в начале; возвращает настоящий размер"""
+    rnd = random.Random(seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    labels: List[str] = []
+    speakers = [tag for tag, _ in CHARACTERS]
+    with open(path, "w", encoding="utf-8", newline="\n", buffering=1024 * 1024) as f:
+        chunk = _characters_block(characters)
+        f.write(chunk)
+        written += len(chunk.encode("utf-8"))
+        while written < size:
+            label = f"{prefix}_{len(labels)}"
+            chunk = "".join(_scene(rnd, label, labels[-50:], speakers))
+            labels.append(label)
+            f.write(chunk)
+            written += len(chunk.encode("utf-8"))
+    return written
+
+
+def write_tree(root: Path, size: int, files: int, seed: int = 0) -> int:
+    """Папка игры: 00defs.rpy с общими персонажами и files скриптов по подпапкам глав.
+
+    Размер файлов неравный, как в настоящих играх. Возвращает общий размер.
+    """
+    root = Path(root)
+    rnd = random.Random(seed)
+    defs = root / "00defs.rpy"
+    defs.parent.mkdir(parents=True, exist_ok=True)
+    defs.write_text(_characters_block(SHARED_CHARACTERS), encoding="utf-8")
+    total = defs.stat().st_size
+    weights = [rnd.uniform(0.2, 1.8) for _ in range(files)]
+    scale = size / sum(weights)
+    # Остальные персонажи определены в первом скрипте главы и нужны всей игре
+    local_characters = CHARACTERS[len(SHARED_CHARACTERS):]
+    for i, weight in enumerate(weights):
+        path = root / f"chapter{i // 50:02d}" / f"part{i:04d}.rpy"
+        total += write_script(path, int(weight * scale), seed + i + 1,
+                              local_characters if i % 50 == 0 else (), prefix=f"c{i}")
+    return total
+
+
+def parse_size(text: str) -> int:
+    """«512K», «10M», «1G» или просто байты"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генератор Ren'Py скриптов для замеров")
+    parser.add_argument("output", type=Path, help="файл .rpy или папка (с --files)")
+    parser.add_argument("size", type=parse_size, help="размер: 1M, 100M, 1G")
+    parser.add_argument("--files", type=int, help="сделать папку из стольких скриптов")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.files:
+        total = write_tree(args.output, args.size, args.files, args.seed)
+    else:
+        total = write_script(args.output, args.size, args.seed)
+    print(f"{args.output}: {total / (1024 * 1024):.1f} МБ", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Сравнение реплик двух версий игры или мода.
+
+Реплики сравниваются по ключу из тега говорящего и нормализованного
+текста (пробелы схлопнуты), так что правка отступов или переносов
+строк в скрипте изменением не считается. Выравнивание — алгоритм
+Хекеля: реплики, которые встречаются ровно один раз в обеих версиях,
+становятся опорными, а совпадения расширяются от них к соседям. Всё
+делается несколькими линейными проходами по словарям, поэтому даже
+полные игры сравниваются за секунды.
+"""
+import json
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Форматы отчёта
+REPORT_FORMATS = ("text", "json")
+
+# Поля реплики в отчёте JSON
+_FIELDS = ("file", "line", "label", "tag", "name", "text")
+
+# Значки видов изменений в текстовом отчёте
+MARKS = {"added": "+", "removed": "-", "changed": "~", "moved": ">"}
+
+
+class DiffRecord(NamedTuple):
+    """Реплика версии в том виде, в каком её пишут структурированные форматы"""
+    file: str
+    line: int
+    label: Optional[str]
+    tag: Optional[str]
+    name: Optional[str]
+    text: str
+
+    def key(self) -> str:
+        # Строка, а не кортеж: строки запоминают свой хэш, и словари работают быстрее
+        return f"{self.tag or ''}\0{' '.join(self.text.split())}"
+
+    def format(self) -> str:
+        label = f" [{self.label}]" if self.label else ""
+        speaker = f"{self.name or self.tag}: " if self.tag else ""
+        return f"{self.file}:{self.line}{label} {speaker}{self.text}"
+
+
+class Change(NamedTuple):
+    """Одно изменение: added — только new, removed — только old, changed и moved — обе"""
+    kind: str
+    old: Optional[DiffRecord]
+    new: Optional[DiffRecord]
+
+
+def _match(old_keys: Sequence, new_keys: Sequence) -> Tuple[List[Optional[int]], List[Optional[int]]]:
+    """Алгоритм Хекеля: для каждой реплики — номер парной в другой версии или None"""
+    old_counts = Counter(old_keys)
+    new_counts = Counter(new_keys)
+    # Для уникальных ключей это и есть их единственное место
+    old_index = {key: i for i, key in enumerate(old_keys)}
+
+    old_pair: List[Optional[int]] = [None] * len(old_keys)
+    new_pair: List[Optional[int]] = [None] * len(new_keys)
+    for j, key in enumerate(new_keys):
+        if new_counts[key] == 1 and old_counts.get(key) == 1:
+            i = old_index[key]
+            old_pair[i] = j
+            new_pair[j] = i
+
+    # Расширяем совпадения вперёд; начало файлов — воображаемая общая опора
+    previous = -1
+    for j in range(len(new_keys)):
+        i = new_pair[j]
+        if i is not None:
+            previous = i
+            continue
+        if previous is not None and previous + 1 < len(old_keys) and old_pair[previous + 1] is None \
+                and old_keys[previous + 1] == new_keys[j]:
+            previous += 1
+            old_pair[previous] = j
+            new_pair[j] = previous
+        else:
+            previous = None
+
+    # И назад; конец — тоже общая опора
+    following = len(old_keys)
+    for j in range(len(new_keys) - 1, -1, -1):
+        i = new_pair[j]
+        if i is not None:
+            following = i
+            continue
+        if following is not None and following > 0 and old_pair[following - 1] is None \
+                and old_keys[following - 1] == new_keys[j]:
+            following -= 1
+            old_pair[following] = j
+            new_pair[j] = following
+        else:
+            following = None
+    return old_pair, new_pair
+
+
+def _in_order(new_pair: List[Optional[int]]) -> List[bool]:
+    """Какие совпавшие реплики стоят на своих местах, а какие перенесены.
+
+    Совпадения собираются в блоки подряд идущих реплик, и из блоков
+    выбирается возрастающая по старой версии цепочка наибольшей общей
+    длины (дерево Фенвика по максимуму). Всё, что в неё не вошло, —
+    перенесено.
+    """
+    blocks = []           # [начало в new, начало в old, длина]
+    for j, i in enumerate(new_pair):
+        if i is None:
+            continue
+        if blocks and blocks[-1][0] + blocks[-1][2] == j and blocks[-1][1] + blocks[-1][2] == i:
+            blocks[-1][2] += 1
+        else:
+            blocks.append([j, i, 1])
+
+    size = len(blocks)
+    rank = {start: r + 1 for r, start in enumerate(sorted(block[1] for block in blocks))}
+    tree = [(0, -1)] * (size + 1)      # (лучшая длина цепочки, номер её последнего блока)
+    best = [0] * size
+    parent = [-1] * size
+    for b, (_, old_start, length) in enumerate(blocks):
+        r = rank[old_start] - 1
+        top = (0, -1)
+        while r > 0:
+            if tree[r] > top:
+                top = tree[r]
+            r -= r & -r
+        best[b] = top[0] + length
+        parent[b] = top[1]
+        r = rank[old_start]
+        while r <= size:
+            if (best[b], b) > tree[r]:
+                tree[r] = (best[b], b)
+            r += r & -r
+
+    kept = [False] * len(new_pair)
+    b = max(range(size), key=best.__getitem__) if size else -1
+    while b >= 0:
+        start, _, length = blocks[b]
+        for j in range(start, start + length):
+            kept[j] = True
+        b = parent[b]
+    return kept
+
+
+def _pair_gap(removed: List[DiffRecord], added: List[DiffRecord]) -> Iterable[Change]:
+    """Удалённые и добавленные между двумя опорами: реплики одного говорящего по порядку считаются изменёнными"""
+    # Очереди, а не списки: pop(0) у списка сделал бы проход квадратичным по размеру разрыва
+    by_tag: Dict[Optional[str], deque] = {}
+    for record in removed:
+        by_tag.setdefault(record.tag, deque()).append(record)
+    replaced = {}
+    for record in added:
+        candidates = by_tag.get(record.tag)
+        if candidates:
+            replaced[id(record)] = candidates.popleft()
+    changed_old = {id(old) for old in replaced.values()}
+    for record in removed:
+        if id(record) not in changed_old:
+            yield Change("removed", record, None)
+    for record in added:
+        old = replaced.get(id(record))
+        yield Change("changed", old, record) if old is not None else Change("added", None, record)
+
+
+def diff_records(old: Sequence[DiffRecord], new: Sequence[DiffRecord]) -> List[Change]:
+    """Изменения от old к new в порядке новой версии"""
+    old_pair, new_pair = _match([record.key() for record in old], [record.key() for record in new])
+    kept = _in_order(new_pair)
+    changes = []
+    removed: List[DiffRecord] = []
+    added: List[DiffRecord] = []
+    i = 0
+    for j, record in enumerate(new):
+        if not kept[j]:
+            if new_pair[j] is None:
+                added.append(record)
+            else:
+                changes.append(Change("moved", old[new_pair[j]], record))
+            continue
+        # Опора: всё несовпавшее в старой версии до неё удалено или изменено
+        for k in range(i, new_pair[j]):
+            if old_pair[k] is None:
+                removed.append(old[k])
+        if removed or added:
+            changes.extend(_pair_gap(removed, added))
+            removed, added = [], []
+        i = new_pair[j] + 1
+    for k in range(i, len(old)):
+        if old_pair[k] is None:
+            removed.append(old[k])
+    changes.extend(_pair_gap(removed, added))
+    return changes
+
+
+def summarize(changes: Iterable[Change]) -> Dict[str, int]:
+    counts = dict.fromkeys(MARKS, 0)
+    for change in changes:
+        counts[change.kind] += 1
+    return counts
+
+
+def write_report(changes: List[Change], path: Path, report_format: str = "text",
+                 old_total: int = 0, new_total: int = 0) -> Dict[str, int]:
+    """Пишет отчёт об изменениях и возвращает число изменений каждого вида"""
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчёта: {report_format}")
+    counts = summarize(changes)
+    if report_format == "json":
+        def row(record):
+            return dict(zip(_FIELDS, record)) if record is not None else None
+
+        report = {"old_total": old_total, "new_total": new_total, "summary": counts,
+                  "changes": [{"kind": change.kind, "old": row(change.old), "new": row(change.new)}
+                              for change in changes]}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        return counts
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Было реплик: {old_total}, стало: {new_total}\n")
+        f.write(f"Добавлено: {counts['added']}, удалено: {counts['removed']}, "
+                f"изменено: {counts['changed']}, перенесено: {counts['moved']}\n")
+        for change in changes:
+            mark = MARKS[change.kind]
+            if change.kind == "removed":
+                f.write(f"\n{mark} {change.old.format()}\n")
+            elif change.kind == "added":
+                f.write(f"\n{mark} {change.new.format()}\n")
+            elif change.kind == "changed":
+                f.write(f"\n{mark} {change.new.format()}\n  было: {change.old.text}\n")
+            else:
+                f.write(f"\n{mark} {change.new.format()}\n  было в {change.old.file}:{change.old.line}\n")
+    return counts
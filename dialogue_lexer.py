@@ -0,0 +1,304 @@
+"""Лексер реплик Ren'Py.
+
+DialogueLexer читает строки скрипта и отдаёт реплики, пункты меню и
+определения персонажей. Разбор одной реплики (кто, атрибуты, строка,
+остаток) и склейка многострочных строк в логические строки доступны
+отдельно: ими пользуется сопоставление с переводом (translation).
+"""
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+
+class ScriptToken(NamedTuple):
+    """Лексема скрипта: реплика (say/extend/choice) или определение персонажа (character)"""
+    kind: str
+    speaker: Optional[str]
+    text: str
+    line: int
+    label: Optional[str] = None
+
+
+class SayStatement(NamedTuple):
+    """Реплика или пункт меню из одной логической строки"""
+    kind: str                  # say, extend или choice
+    who: Optional[str]         # тег или имя в кавычках — как в исходнике
+    attributes: List[str]
+    raw: str                   # строка реплики без кавычек, как в исходнике
+    rest: str                  # всё после строки: with, id, двоеточие пункта меню
+    quote: str
+
+
+# Ключевые слова, после которых идёт строка, но это не реплика
+NOT_SPEAKERS = frozenset((
+    "play", "queue", "voice", "sound", "music", "image", "define", "default", "show", "scene", "hide",
+    "call", "jump", "menu", "label", "with", "window", "nvl", "pause", "stop", "return", "python",
+    "init", "screen", "style", "transform", "translate", "old", "new", "text", "textbutton",
+    "imagebutton", "add", "use", "key", "action", "tooltip", "font", "renpy", "if", "elif",
+    "else", "while", "for", "at", "as", "camera", "layeredimage", "attribute", "group",
+))
+
+# Кавычка или начало комментария
+_QUOTE_OR_COMMENT = re.compile(r'["\'#]')
+
+
+class DialogueLexer:
+    """Однопроходный лексер реплик Ren'Py на конечном автомате.
+
+    Между строками помнит, открыта ли строковая константа (обычная или
+    тройная, в одинарных или двойных кавычках) и в какой метке мы
+    находимся по отступам. Понимает экранированные кавычки, реплики вида
+    `who attr @ temp "text"`, `"who" "text"`, `extend "text"` и пункты меню.
+    """
+
+    # Строки, которые стоит читать: с кавычками, метки и меню (именованное меню — тоже метка)
+    candidate_markers = (b'"', b"'", b'label', b'menu')
+    menu_pattern = re.compile(r'menu\s+([A-Za-z_]\w*)\s*[:(]')
+    char_pattern = re.compile(r'(?:define\s+(?:-?\d+\s+)?|\$\s*)?(\w+)\s*=\s*Character\s*\(\s*(?:_\(\s*)?[uU]?[\'"]([^\'"]+)[\'"]')
+
+    def tokens(self, lines: Iterator[Tuple[int, int, bytes]], encoding: str = "utf-8") -> Iterator[ScriptToken]:
+        """Лексемы из строк (номер, смещение, байты); декодируются только нужные строки"""
+        self.in_string = False
+        labels = []           # стек (отступ, имя метки)
+        global_label = None   # последняя глобальная метка, к ней цепляются локальные (.name)
+        label = None          # текущая метка (вершина стека)
+        quote = None          # закрывающая кавычка открытой строки
+        parts = []            # куски открытой строки
+        speaker = None
+        kind = 'say'
+        start_line = 0
+        first_quote, say_words, say_from = self._first_quote, self._say_words, self._say_from
+
+        for lineno, offset, raw in lines:
+            if quote is None and b'"' not in raw and b"'" not in raw:
+                # Без кавычек важны только метки и строки, закрывающие блок метки
+                if (b'label' not in raw and b'menu' not in raw
+                        and not (labels and raw[:1] not in b' \t\r\n#')):
+                    continue
+            line = raw.decode(encoding, "ignore")
+            if quote is not None:
+                # Продолжение многострочной строки
+                end = self.find_close(line, 0, quote)
+                if end < 0:
+                    parts.append(line.rstrip().rstrip('\\'))
+                    continue
+                parts.append(line[:end])
+                yield from self._finish(kind, speaker, parts, quote, start_line, labels)
+                quote = None
+                self.in_string = False
+                continue
+
+            stripped = line.lstrip()
+            if not stripped:
+                continue
+            c = stripped[0]
+            if c == '#':
+                continue
+            if labels:
+                indent = len(line) - len(stripped)
+                if indent <= labels[-1][0]:
+                    while labels and indent <= labels[-1][0]:
+                        labels.pop()
+                    label = labels[-1][1] if labels else None
+
+            if c == 'l' and (stripped.startswith('label ') or stripped.startswith('label\t')):
+                name = stripped[6:].strip().split('(')[0].rstrip(':').strip()
+                if name.startswith('.'):
+                    name = (global_label or '') + name
+                else:
+                    global_label = name.split('.')[0]
+                labels.append((len(line) - len(stripped), name))
+                label = name
+                continue
+            if c == 'm' and labels:
+                m = self.menu_pattern.match(stripped)
+                if m:
+                    # menu имя: — метка внутри метки, как в rpyc_reader.iter_tokens
+                    labels.append((len(line) - len(stripped), m.group(1)))
+                    label = m.group(1)
+                    continue
+
+            # Быстрый отсев: без кавычек нет ни реплики, ни Character("...")
+            pos = first_quote(stripped)
+            if pos < 0:
+                continue
+            words = say_words(stripped, pos) if pos else []
+            if words is None:
+                if 'Character' in stripped:
+                    m = self.char_pattern.match(stripped)
+                    if m:
+                        yield ScriptToken('character', m.group(1), m.group(2), lineno)
+                continue
+
+            say = say_from(stripped, pos, words)
+            if say is None:
+                # Строка продолжается на следующих строках файла
+                start_line = lineno
+                speaker = words[0] if words else None
+                kind = 'extend' if speaker == 'extend' else 'say'
+                quote = self.open_quote(stripped, pos)
+                parts = [stripped[pos + len(quote):].rstrip().rstrip('\\')]
+                self.in_string = True
+                continue
+
+            who = say.who
+            if who and who[0] in '"\'':
+                who = self.unescape(who[1:-1])
+            if len(say.quote) == 1:
+                text = self.unescape(say.raw)
+                yield ScriptToken(say.kind, who, text, lineno, label)
+            else:
+                yield from self._finish(say.kind, who, [say.raw], say.quote, lineno, labels)
+
+        if quote is not None and parts:
+            # Незакрытая строка в конце файла — отдаём то, что есть
+            yield from self._finish(kind, speaker, parts, quote, start_line, labels)
+
+    def statements(self, lines: Iterator[Tuple[int, int, bytes]], encoding: str = "utf-8"
+                   ) -> Iterator[Tuple[int, int, str]]:
+        """Логические строки (номер, отступ, текст) по тем же правилам строк, что и tokens.
+
+        Строка, открытая и не закрытая на строке файла, продолжается на
+        следующих: они склеиваются через перевод строки как есть. Пустые
+        строки и комментарии пропускаются.
+        """
+        pending = None
+        quote = None
+        for lineno, _, raw in lines:
+            line = raw.decode(encoding, "ignore").rstrip("\r\n")
+            if pending is not None:
+                pending[2] += "\n" + line
+                end = self.find_close(line, 0, quote)
+                if end >= 0:
+                    quote = self._unclosed(line, end + len(quote))
+                    if quote is None:
+                        yield tuple(pending)
+                        pending = None
+                continue
+            stripped = line.lstrip()
+            if not stripped or stripped[0] == '#':
+                continue
+            indent = len(line) - len(stripped)
+            stripped = stripped.rstrip()
+            quote = self._unclosed(stripped, 0)
+            if quote is not None:
+                pending = [lineno, indent, stripped]
+                continue
+            yield lineno, indent, stripped
+        if pending is not None:
+            yield tuple(pending)
+
+    @classmethod
+    def parse_say(cls, text: str) -> Optional[SayStatement]:
+        """Реплика или пункт меню из логической строки; None, если это не они"""
+        pos = cls._first_quote(text)
+        if pos < 0:
+            return None
+        words = cls._say_words(text, pos) if pos else []
+        if words is None:
+            return None
+        return cls._say_from(text, pos, words)
+
+    @staticmethod
+    def _first_quote(s: str) -> int:
+        pos = s.find('"')
+        single = s.find("'", 0, pos) if pos > 0 else s.find("'")
+        if single >= 0 and (pos < 0 or single < pos):
+            pos = single
+        return pos
+
+    @staticmethod
+    def _say_words(s: str, pos: int) -> Optional[List[str]]:
+        """who [атрибуты] [@ временные] перед строкой; None, если до кавычки не только они"""
+        words = s[:pos].split()
+        if len(words) > 5:
+            return None
+        speaker = words[0]
+        if not speaker.isidentifier() or speaker in NOT_SPEAKERS:
+            return None
+        for word in words[1:]:
+            if word != '@' and not word.lstrip('@').lstrip('-').isidentifier():
+                return None
+        return words
+
+    @classmethod
+    def _say_from(cls, s: str, pos: int, words: List[str]) -> Optional[SayStatement]:
+        """Реплика со строкой, начинающейся в pos; None, если строка не закрыта в s"""
+        quote = cls.open_quote(s, pos)
+        body = pos + len(quote)
+        end = s.find(quote, body)
+        if end > 0 and s[end - 1] == '\\':
+            end = cls.find_close(s, body, quote)
+        if end < 0:
+            return None
+        raw = s[body:end]
+        rest = s[end + len(quote):].lstrip()
+        who = words[0] if words else None
+        kind = 'extend' if who == 'extend' else 'say'
+        if who is None and rest:
+            if rest[0] in '"\'' and len(quote) == 1:
+                # "Имя" "Реплика"
+                second = cls.find_close(rest, 1, rest[0])
+                if second > 0:
+                    who = s[pos:end + 1]
+                    quote = rest[0]
+                    raw = rest[1:second]
+                    rest = rest[second + 1:].lstrip()
+            if who is None and rest.rstrip().endswith(':'):
+                kind = 'choice'
+        return SayStatement(kind, who, words[1:], raw, rest, quote)
+
+    @classmethod
+    def _unclosed(cls, s: str, start: int) -> Optional[str]:
+        """Кавычка строки, оставшейся открытой в конце s, или None"""
+        while True:
+            m = _QUOTE_OR_COMMENT.search(s, start)
+            if m is None or m.group() == '#':
+                return None
+            quote = cls.open_quote(s, m.start())
+            end = cls.find_close(s, m.start() + len(quote), quote)
+            if end < 0:
+                return quote
+            start = end + len(quote)
+
+    @staticmethod
+    def open_quote(s: str, pos: int) -> str:
+        """Кавычка строки, начинающейся в pos: одиночная или тройная"""
+        q = s[pos]
+        return q * 3 if s.startswith(q * 3, pos) else q
+
+    @staticmethod
+    def find_close(s: str, start: int, quote: str) -> int:
+        """Позиция закрывающей кавычки с учётом экранирования или -1"""
+        while True:
+            j = s.find(quote, start)
+            if j < 0:
+                return -1
+            k = j
+            while k > start and s[k - 1] == '\\':
+                k -= 1
+            if (j - k) % 2 == 0:
+                return j
+            start = j + 1
+
+    @staticmethod
+    def unescape(text: str) -> str:
+        if '\\' not in text:
+            return text
+        return text.replace('\\\\', '\0').replace('\\"', '"').replace("\\'", "'").replace('\0', '\\')
+
+    def _finish(self, kind, speaker, parts, quote, start_line, labels) -> Iterator[ScriptToken]:
+        label = labels[-1][1] if labels else None
+        if len(quote) == 3:
+            # Тройные кавычки: каждый абзац — отдельная реплика
+            paragraphs = "\n".join(parts).split("\n\n")
+            for paragraph in paragraphs:
+                text = " ".join(paragraph.split())
+                if text:
+                    yield ScriptToken(kind, speaker, self.unescape(text), start_line, label)
+            return
+        if len(parts) == 1:
+            text = parts[0]
+        else:
+            # Перенос внутри строки схлопывается в один пробел, как в Ren'Py
+            text = " ".join(" ".join(parts).split())
+        yield ScriptToken(kind, speaker, self.unescape(text), start_line, label)
@@ -0,0 +1,183 @@
+"""Статистика по персонажам: считается в том же проходе, что и извлечение.
+
+Реплики не хранятся — на каждую область (вся игра, файл, метка) только
+счётчики: строк и слов всего, строк и слов повествования и по паре
+[строк, слов] на каждого персонажа. Персонажи области идут в порядке
+первой реплики (порядок вставки словаря), это и есть порядок, в котором
+они заговорили. Реплики вне меток в разрезе меток не считаются.
+
+Словом считается всё, что разделено пробелами; текстовые теги Ren'Py
+({w}, {b}...) считаются частью слова.
+"""
+import csv
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+STATS_FORMATS = ("json", "csv")
+# Порядок полей в CSV; у строки повествования пустые tag и name, order = 0
+CSV_FIELDS = ("scope", "key", "order", "tag", "name", "lines", "words", "share")
+
+
+class _Tally:
+    """Счётчики одной области"""
+
+    __slots__ = ("lines", "words", "narration_lines", "narration_words", "characters")
+
+    def __init__(self):
+        self.lines = 0
+        self.words = 0
+        self.narration_lines = 0
+        self.narration_words = 0
+        # Тег → [строк, слов]; порядок — порядок первой реплики
+        self.characters: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "_Tally":
+        tally = cls()
+        tally.lines = data["lines"]
+        tally.words = data["words"]
+        tally.narration_lines = data["narration_lines"]
+        tally.narration_words = data["narration_words"]
+        tally.characters = {row["tag"]: [row["lines"], row["words"]] for row in data["characters"]}
+        return tally
+
+    def merge(self, other: "_Tally"):
+        self.lines += other.lines
+        self.words += other.words
+        self.narration_lines += other.narration_lines
+        self.narration_words += other.narration_words
+        characters = self.characters
+        for tag, (lines, words) in other.characters.items():
+            counts = characters.get(tag)
+            if counts is None:
+                characters[tag] = [lines, words]
+            else:
+                counts[0] += lines
+                counts[1] += words
+
+    def to_dict(self, names: Dict[str, str]) -> Dict:
+        lines = self.lines
+        return {
+            "lines": lines,
+            "words": self.words,
+            "narration_lines": self.narration_lines,
+            "narration_words": self.narration_words,
+            "narration_share": self.narration_lines / lines if lines else 0.0,
+            "characters": [{"tag": tag, "name": names.get(tag, tag), "lines": count, "words": words,
+                            "share": count / lines}
+                           for tag, (count, words) in self.characters.items()],
+        }
+
+
+class DialogueStats:
+    """Статистика одного извлечения; статистика файлов складывается через merge.
+
+    Реплика учитывается один раз — в счётчиках своего участка (файл,
+    метка). Реплики метки идут подряд, так что участок меняется редко, а
+    области файла, метки и всей игры собираются из участков в to_dict.
+    """
+
+    def __init__(self):
+        self.total = _Tally()
+        self.files: Dict[str, _Tally] = {}
+        self.labels: Dict[str, _Tally] = {}
+        # Тег → имя (Character может найтись ниже по файлу, поэтому имя обновляется)
+        self.names: Dict[str, str] = {}
+        # (файл, метка) → счётчики ещё не разнесённых по областям реплик
+        self._parts: Dict[tuple, _Tally] = {}
+        self._part_key = None
+        self._part = None
+
+    def add(self, record, source: str):
+        """Учитывает реплику (DialogueRecord) из файла source"""
+        key = (source, record.label)
+        if key != self._part_key:
+            self._part_key = key
+            self._part = self._parts.get(key)
+            if self._part is None:
+                self._part = self._parts[key] = _Tally()
+        part = self._part
+        words = len(record.text.split())
+        part.lines += 1
+        part.words += words
+        tag = record.speaker
+        if not tag:
+            part.narration_lines += 1
+            part.narration_words += words
+            return
+        counts = part.characters.get(tag)
+        if counts is None:
+            part.characters[tag] = [1, words]
+            self.names[tag] = record.name
+        else:
+            counts[0] += 1
+            counts[1] += words
+
+    def _fold(self):
+        """Разносит участки по областям файла, метки и всей игры"""
+        for (source, label), part in self._parts.items():
+            self.total.merge(part)
+            self._scope(self.files, source).merge(part)
+            if label is not None:
+                self._scope(self.labels, label).merge(part)
+        self._parts.clear()
+        self._part_key = self._part = None
+
+    @staticmethod
+    def _scope(tallies: Dict[str, _Tally], key: str) -> _Tally:
+        tally = tallies.get(key)
+        if tally is None:
+            tally = tallies[key] = _Tally()
+        return tally
+
+    def merge(self, other: Optional[Dict]):
+        """Добавляет статистику из to_dict (например, от рабочего процесса)"""
+        if not other:
+            return
+        self._fold()
+        self.total.merge(_Tally.from_dict(other["total"]))
+        for data, tallies in ((other["files"], self.files), (other["labels"], self.labels)):
+            for key, tally in data.items():
+                self._scope(tallies, key).merge(_Tally.from_dict(tally))
+        for row in other["total"]["characters"]:
+            self.names[row["tag"]] = row["name"]
+
+    def to_dict(self) -> Dict:
+        self._fold()
+        names = self.names
+        return {
+            "total": self.total.to_dict(names),
+            "files": {source: tally.to_dict(names) for source, tally in self.files.items()},
+            "labels": {label: tally.to_dict(names) for label, tally in self.labels.items()},
+        }
+
+
+def _csv_rows(stats: Dict):
+    scopes = [("total", {"": stats["total"]}), ("file", stats["files"]), ("label", stats["labels"])]
+    for scope, tallies in scopes:
+        for key, tally in tallies.items():
+            if tally["narration_lines"]:
+                yield (scope, key, 0, "", "", tally["narration_lines"], tally["narration_words"],
+                       round(tally["narration_share"], 4))
+            for order, row in enumerate(tally["characters"], 1):
+                yield scope, key, order, row["tag"], row["name"], row["lines"], row["words"], round(row["share"], 4)
+
+
+def write_stats(stats: Dict, path: Path, fmt: Optional[str] = None):
+    """Пишет статистику (DialogueStats.to_dict) в JSON или CSV; формат по умолчанию — по расширению"""
+    path = Path(path)
+    if fmt is None:
+        fmt = "csv" if path.suffix.lower() == ".csv" else "json"
+    if fmt not in STATS_FORMATS:
+        raise ValueError(f"Неизвестный формат статистики: {fmt}")
+    if fmt == "json":
+        with open(path, "w", encoding="utf-8") as f:
+            # Одной строкой: у большой игры тысячи меток, а json.dump с отступами в разы медленнее
+            f.write(json.dumps(stats, ensure_ascii=False))
+        return
+    # BOM — чтобы Excel узнал UTF-8, как у CSV с репликами
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        writer.writerows(_csv_rows(stats))
@@ -0,0 +1,113 @@
+"""Замеры извлечения: время по этапам и счётчики строк.
+
+Профиль создаётся, только если у парсера включено profiling; иначе
+функции разбора получают None и не делают ничего лишнего. Этапы:
+read — поиск строк-кандидатов по байтам (или чтение записи кэша),
+characters — отдельный поиск Character(...), dialogues — лексер и
+склейка реплик, write — запись результата.
+"""
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+STAGES = ("read", "characters", "dialogues", "write")
+
+_clock = time.perf_counter
+
+
+class ExtractionProfile:
+    """Время этапов и счётчики одного извлечения; профили файлов складываются через merge"""
+
+    def __init__(self):
+        self.started = _clock()
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.files = 0
+        # Файлы, реплики которых взяты из кэша разбора
+        self.cached_files = 0
+        self.bytes = 0
+        # Строки-кандидаты, дошедшие до разбора
+        self.lines = 0
+        # Строки, разобранные как реплика или её продолжение
+        self.matched = 0
+        # Продолжения (extend, строки с \), приклеенные к предыдущей реплике
+        self.merged = 0
+        self.replicas = 0
+        # Правило пропуска → сколько раз сработало
+        self.skipped: Dict[str, int] = {}
+
+    def timed(self, iterator: Iterator, stage: str, count_lines: bool = False) -> Iterator:
+        """Пропускает элементы насквозь, складывая в stage время, проведённое внутри iterator"""
+        iterator = iter(iterator)
+        stages = self.stages
+        spent = 0.0
+        count = 0
+        try:
+            while True:
+                start = _clock()
+                try:
+                    item = next(iterator)
+                except StopIteration as stop:
+                    spent += _clock() - start
+                    # Значение генератора (например, персонажи из записи кэша) не теряется
+                    return stop.value
+                spent += _clock() - start
+                count += 1
+                yield item
+        finally:
+            stages[stage] += spent
+            if count_lines:
+                self.lines += count
+
+    def timed_call(self, func: Callable, stage: str) -> Callable:
+        """func, время вызовов которой складывается в stage"""
+        stages = self.stages
+
+        def call(*args):
+            start = _clock()
+            try:
+                return func(*args)
+            finally:
+                stages[stage] += _clock() - start
+
+        return call
+
+    def counting_skip(self, search: Callable, rule_name: Callable) -> Callable:
+        """Проверка правил пропуска, которая считает срабатывания каждого правила"""
+        skipped = self.skipped
+
+        def skip(text):
+            m = search(text)
+            if m is not None:
+                rule = rule_name(m)
+                skipped[rule] = skipped.get(rule, 0) + 1
+            return m
+
+        return skip
+
+    def merge(self, other: Optional[Dict]):
+        """Добавляет профиль из to_dict (например, от рабочего процесса)"""
+        if not other:
+            return
+        for stage, seconds in other["stages"].items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        for field in ("files", "cached_files", "bytes", "lines", "matched", "merged", "replicas"):
+            setattr(self, field, getattr(self, field) + other[field])
+        for rule, count in other["skipped"].items():
+            self.skipped[rule] = self.skipped.get(rule, 0) + count
+
+    def to_dict(self) -> Dict:
+        wall = _clock() - self.started
+        return {
+            "wall": wall,
+            "stages": dict(self.stages),
+            "files": self.files,
+            "cached_files": self.cached_files,
+            "bytes": self.bytes,
+            "lines": self.lines,
+            "lines_per_sec": self.lines / wall if wall else 0.0,
+            "bytes_per_sec": self.bytes / wall if wall else 0.0,
+            "matched": self.matched,
+            "merged": self.merged,
+            "replicas": self.replicas,
+            "skipped": dict(sorted(self.skipped.items(), key=lambda item: -item[1])),
+            "skipped_total": sum(self.skipped.values()),
+        }
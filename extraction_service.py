@@ -0,0 +1,439 @@
+"""Локальная служба извлечения: разборщик настраивается один раз и ждёт запросов.
+
+Служба держит в памяти настроенный RenPyParser: правила пропуска, свои
+теги, прочитанные наборы тегов и кэш разбора. Каждое задание идёт на его
+копии в пуле потоков, так что несколько запросов выполняются сразу;
+папки и архивы внутри задания, как и в CLI, разбираются пулом процессов.
+
+Протокол — строки JSON (один объект на строку) через Unix-сокет или,
+где их нет, через порт на 127.0.0.1. В ответах стоит "id" запроса,
+поэтому по одному соединению можно слать запросы, не дожидаясь ответов:
+
+  {"id": 1, "op": "extract", "input": "game/", "output": "out.jsonl", "format": "jsonl"}
+      → {"id": 1, "ok": true, "result": {...}}        results как у RenPyParser.extract
+  {"id": 2, "op": "stream", "input": "game/"}
+      → {"id": 2, "records": [{"file": ..., "line": ..., "label": ..., "tag": ..., "name": ..., "text": ...}]}
+      → ... → {"id": 2, "ok": true, "result": {"total_replicas": ..., "files": ..., "failed": [...]}}
+  {"id": 3, "op": "cancel", "target": 2}
+  {"id": 4, "op": "ping"}
+  {"id": 5, "op": "shutdown"}
+
+Необязательные поля extract и stream: with_names, pack (id, "auto" или
+null), mapping ({тег: имя} поверх тегов службы); только у extract:
+format, merge, workers, labels, reachable, stats (статистика по
+персонажам в result["stats"]) и progress — тогда по ходу приходят
+{"id": ..., "progress": 0.42, "text": ...}. Ошибка —
+{"id": ..., "ok": false, "error": ...}; у отменённого задания ещё
+"cancelled": true.
+
+Unix-сокет доступен только владельцу (права 0600). У порта таких прав
+нет, поэтому служба на порту при запуске пишет случайный ключ в файл
+token_path(), читать который может только пользователь, и каждый запрос
+должен нести его в поле "token"; запрос без верного ключа получает
+ошибку, и соединение закрывается. Клиент request() берёт ключ из файла сам.
+"""
+import asyncio
+import concurrent.futures
+import copy
+import hmac
+import json
+import os
+import secrets
+import signal
+import socket
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import mapping_packs
+from output_writers import FIELDS, WRITERS
+
+# Порт на 127.0.0.1, если Unix-сокетов нет
+DEFAULT_PORT = 47610
+# Сколько заданий выполняется одновременно
+DEFAULT_JOBS = 2
+# Реплик в одном сообщении stream
+STREAM_BATCH = 500
+# Сколько неотправленных сообщений stream копится, прежде чем разбор встанет и подождёт клиента
+STREAM_QUEUE = 8
+# Как часто поток задания, ждущий клиента, проверяет отмену (секунды)
+CANCEL_POLL_INTERVAL = 0.2
+# Наибольшая длина строки запроса
+MAX_REQUEST = 1024 * 1024
+
+
+class ServiceError(Exception):
+    """Неверный запрос; текст уходит клиенту в поле error"""
+
+
+def default_socket_path() -> Optional[Path]:
+    """Путь Unix-сокета по умолчанию или None, если Unix-сокетов нет (Windows)"""
+    if sys.platform == "win32" or not hasattr(socket, "AF_UNIX"):
+        return None
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "alice-alchemy-table.sock"
+    # Общая временная папка: в имени uid, чтобы службы разных пользователей не мешали друг другу
+    return Path(tempfile.gettempdir()) / f"alice-alchemy-table-{os.getuid()}.sock"
+
+
+def token_path() -> Path:
+    """Файл с ключом службы на порту, в папке настроек пользователя"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(base) / "alice-alchemy-table" / "service-token"
+
+
+def _write_token(path: Path, token: str):
+    """Ключ в файл, доступный только пользователю"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Старый файл удаляется: O_CREAT не меняет права уже существующего
+    path.unlink(missing_ok=True)
+    # На Windows права задаёт папка LOCALAPPDATA, она и так доступна только пользователю
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with open(fd, "w", encoding="ascii") as f:
+        f.write(token)
+
+
+class ExtractionService:
+    """Сервер: соединения, разбор запросов и задания в пуле потоков"""
+
+    def __init__(self, parser, jobs: int = DEFAULT_JOBS):
+        self.parser = parser
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        self.running = 0
+        self.stopped = None
+        # Ключ, который должен быть в каждом запросе; None — проверка не нужна (Unix-сокет)
+        self.token: Optional[str] = None
+        # Открытые соединения: задача соединения и флаги отмены его заданий
+        self._connections: Dict[asyncio.StreamWriter, Tuple[asyncio.Task, Dict[object, threading.Event]]] = {}
+
+    def job_parser(self, request: Dict):
+        """Копия разборщика службы с настройками запроса"""
+        parser = copy.deepcopy(self.parser)
+        output_format = request.get("format", parser.output_format)
+        if output_format not in WRITERS:
+            raise ServiceError(f"Неизвестный формат вывода: {output_format}")
+        parser.output_format = output_format
+        if "stats" in request:
+            parser.analytics = bool(request["stats"])
+        if "pack" in request:
+            pack = request["pack"]
+            if pack == "none":
+                pack = None
+            if pack not in ("auto", None) and pack not in mapping_packs.available():
+                raise ServiceError(f"Неизвестный набор тегов: {pack}")
+            parser.mapping_pack = pack
+        mapping = request.get("mapping")
+        if mapping is not None:
+            if not isinstance(mapping, dict):
+                raise ServiceError("mapping должен быть объектом {тег: имя}")
+            parser.custom_mapping = {**parser.custom_mapping, **mapping}
+        return parser
+
+    @staticmethod
+    def _path(request: Dict, field: str, must_exist: bool = False) -> Path:
+        value = request.get(field)
+        if not isinstance(value, str) or not value:
+            raise ServiceError(f"Не указан {field}")
+        path = Path(value)
+        if must_exist and not path.exists():
+            raise ServiceError(f"Файл не существует: {path}")
+        return path
+
+    async def extract(self, request: Dict, send, cancel_token: threading.Event) -> Dict:
+        parser = self.job_parser(request)
+        input_path = self._path(request, "input", must_exist=True)
+        output_path = self._path(request, "output")
+        labels = request.get("labels")
+        if labels is not None and not isinstance(labels, list):
+            raise ServiceError("labels должен быть списком меток")
+        loop = asyncio.get_running_loop()
+        request_id = request["id"]
+
+        def report_progress(value, text):
+            # Вызывается из потока задания: сообщение отправляет цикл событий
+            asyncio.run_coroutine_threadsafe(
+                send({"id": request_id, "progress": round(value, 3), "text": text}), loop)
+
+        progress_callback = report_progress if request.get("progress") else None
+
+        def run():
+            return parser.extract(input_path, output_path, with_names=bool(request.get("with_names", True)),
+                                  merge=bool(request.get("merge", True)), workers=request.get("workers"),
+                                  progress_callback=progress_callback, cancel_token=cancel_token,
+                                  labels=labels, reachable=bool(request.get("reachable", False)))
+
+        result = await loop.run_in_executor(self.pool, run)
+        message = {"id": request_id, "ok": result['success'], "result": result}
+        if result.get('cancelled'):
+            message.update(cancelled=True, error="Задание отменено")
+        elif not result['success']:
+            failed = result.get('failed')
+            if result.get('error'):
+                message["error"] = result['error']
+            elif failed:
+                message["error"] = "Не удалось прочитать: " + ", ".join(failed[:5])
+            else:
+                message["error"] = "Не удалось извлечь диалоги"
+        return message
+
+    async def stream(self, request: Dict, send, cancel_token: threading.Event) -> Dict:
+        """Реплики уходят клиенту пачками по мере разбора, без итогового файла.
+
+        Очередь между потоком разбора и соединением ограничена: если клиент
+        читает медленно, разбор ждёт его, а не копит реплики в памяти.
+        """
+        parser = self.job_parser(request)
+        input_path = self._path(request, "input", must_exist=True)
+        with_names = bool(request.get("with_names", True))
+        loop = asyncio.get_running_loop()
+        request_id = request["id"]
+        batches = asyncio.Queue(maxsize=STREAM_QUEUE)
+
+        def put(batch):
+            pending = asyncio.run_coroutine_threadsafe(batches.put(batch), loop)
+            while True:
+                try:
+                    return pending.result(timeout=CANCEL_POLL_INTERVAL)
+                except concurrent.futures.TimeoutError:
+                    if cancel_token.is_set():
+                        # Клиента больше нет: пачку не ждут, разбор прервётся на следующей реплике
+                        pending.cancel()
+                        return
+
+        def produce():
+            records = parser.iter_game(input_path, with_names, cancel_token)
+            batch = []
+            total = 0
+            try:
+                while True:
+                    try:
+                        source, record = next(records)
+                    except StopIteration as stop:
+                        summary = stop.value
+                        break
+                    name = record.name if with_names and record.speaker else None
+                    batch.append(dict(zip(FIELDS, (source, record.line, record.label, record.speaker, name,
+                                                   record.text))))
+                    if len(batch) >= STREAM_BATCH:
+                        total += len(batch)
+                        put(batch)
+                        batch = []
+                if batch:
+                    total += len(batch)
+                    put(batch)
+                return {**summary, 'total_replicas': total}
+            finally:
+                put(None)
+
+        produced = loop.run_in_executor(self.pool, produce)
+        try:
+            while True:
+                batch = await batches.get()
+                if batch is None:
+                    break
+                await send({"id": request_id, "records": batch})
+        finally:
+            if not produced.done():
+                cancel_token.set()
+        try:
+            result = await produced
+        except Exception:
+            if cancel_token.is_set():
+                return {"id": request_id, "ok": False, "cancelled": True, "error": "Задание отменено"}
+            raise
+        return {"id": request_id, "ok": True, "result": result}
+
+    async def dispatch(self, request: Dict, send, jobs: Dict[object, threading.Event]):
+        request_id = request.get("id")
+        op = request.get("op")
+        try:
+            if op in ("extract", "stream"):
+                if request_id is None or request_id in jobs:
+                    raise ServiceError("Заданию нужен id, не занятый другим заданием этого соединения")
+                jobs[request_id] = cancel_token = threading.Event()
+                self.running += 1
+                try:
+                    run = self.extract if op == "extract" else self.stream
+                    message = await run(request, send, cancel_token)
+                finally:
+                    self.running -= 1
+                    del jobs[request_id]
+            elif op == "cancel":
+                cancel_token = jobs.get(request.get("target"))
+                if cancel_token is None:
+                    raise ServiceError(f"Нет задания {request.get('target')!r}")
+                cancel_token.set()
+                message = {"id": request_id, "ok": True, "result": {}}
+            elif op == "ping":
+                message = {"id": request_id, "ok": True,
+                           "result": {"running": self.running, "packs": sorted(mapping_packs.available())}}
+            elif op == "shutdown":
+                self.stopped.set()
+                message = {"id": request_id, "ok": True, "result": {}}
+            else:
+                raise ServiceError(f"Неизвестная операция: {op}")
+        except ServiceError as e:
+            message = {"id": request_id, "ok": False, "error": str(e)}
+        except ConnectionError:
+            # Клиент ушёл, отвечать некому
+            return
+        except Exception as e:
+            message = {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        try:
+            await send(message)
+        except ConnectionError:
+            pass
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Одно соединение: запросы читаются построчно, каждый выполняется отдельной задачей"""
+        lock = asyncio.Lock()
+        jobs = {}
+        tasks = set()
+
+        async def send(message: Dict):
+            data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+            # Одно сообщение — одна запись: ответы разных заданий не перемешиваются
+            async with lock:
+                writer.write(data)
+                await writer.drain()
+
+        self._connections[writer] = asyncio.current_task(), jobs
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await send({"id": None, "ok": False, "error": f"Запрос длиннее {MAX_REQUEST} байт"})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    await send({"id": None, "ok": False, "error": "Запрос должен быть объектом JSON"})
+                    continue
+                if self.token is not None and not self._authorized(request):
+                    await send({"id": request.get("id"), "ok": False,
+                                "error": f"Нет доступа: в запросе нужен token из {token_path()}"})
+                    break
+                task = asyncio.create_task(self.dispatch(request, send, jobs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # Клиент закончил слать запросы, но ответы на уже начатые ещё нужны
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for cancel_token in jobs.values():
+                cancel_token.set()
+            self._connections.pop(writer, None)
+            writer.close()
+
+    def _authorized(self, request: Dict) -> bool:
+        token = request.get("token")
+        return isinstance(token, str) and hmac.compare_digest(token.encode("utf-8"), self.token.encode("ascii"))
+
+    async def serve(self, socket_path: Optional[Path] = None, port: int = DEFAULT_PORT, ready=None):
+        """Слушает socket_path (или 127.0.0.1:port без него) до запроса shutdown или сигнала"""
+        self.stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if socket_path is not None:
+            socket_path = Path(socket_path)
+            _remove_stale_socket(socket_path)
+            server = await asyncio.start_unix_server(self.handle, str(socket_path), limit=MAX_REQUEST)
+            # Сокет открывает доступ к файлам пользователя — только ему самому
+            os.chmod(socket_path, 0o600)
+            address = str(socket_path)
+        else:
+            # К порту может подключиться любой процесс машины — пускаем только со своим ключом.
+            # Файл пишется после того, как порт занят: иначе вторая служба затёрла бы ключ первой
+            self.token = secrets.token_hex(32)
+            server = await asyncio.start_server(self.handle, "127.0.0.1", port, limit=MAX_REQUEST)
+            address = f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        if sys.platform != "win32":
+            loop.add_signal_handler(signal.SIGTERM, self.stopped.set)
+        try:
+            if self.token is not None:
+                _write_token(token_path(), self.token)
+            if ready is not None:
+                ready(address)
+            await self.stopped.wait()
+        finally:
+            server.close()
+            # Незаконченные задания отменяются, соединения закрываются
+            connections = list(self._connections.items())
+            for writer, (_, jobs) in connections:
+                for cancel_token in jobs.values():
+                    cancel_token.set()
+                writer.close()
+            await asyncio.gather(*(task for _, (task, _) in connections), return_exceptions=True)
+            await server.wait_closed()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            if socket_path is not None:
+                socket_path.unlink(missing_ok=True)
+            else:
+                token_path().unlink(missing_ok=True)
+
+
+def _remove_stale_socket(path: Path):
+    """Удаляет сокет от прошлого запуска; если на нём ещё кто-то слушает — ошибка"""
+    if not path.exists():
+        return
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+        probe.connect(str(path))
+    except OSError:
+        path.unlink()
+    else:
+        raise OSError(f"Служба уже запущена: {path}")
+    finally:
+        probe.close()
+
+
+def serve_forever(parser, socket_path: Optional[Path] = None, port: int = DEFAULT_PORT,
+                  jobs: int = DEFAULT_JOBS, ready=None):
+    """Запускает службу в текущем потоке; возвращается после shutdown, SIGTERM или Ctrl+C"""
+    # Все наборы тегов читаются сразу, чтобы первый запрос не ждал диска
+    for pack_id in mapping_packs.available():
+        try:
+            mapping_packs.load(pack_id)
+        except (OSError, ValueError, KeyError):
+            pass
+    service = ExtractionService(parser, jobs)
+    try:
+        asyncio.run(service.serve(socket_path, port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def request(message: Dict, socket_path: Optional[Path] = None, port: int = DEFAULT_PORT) -> Iterator[Dict]:
+    """Клиент: шлёт один запрос и выдаёт ответы на него до последнего (с полем ok).
+
+    Для службы на порту ключ берётся из token_path(), если его нет в запросе.
+    """
+    if socket_path is not None:
+        sock = socket.socket(socket.AF_UNIX)
+        sock.connect(str(socket_path))
+    else:
+        if "token" not in message:
+            message = {**message, "token": token_path().read_text(encoding="ascii").strip()}
+        sock = socket.create_connection(("127.0.0.1", port))
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        stream.flush()
+        for line in stream:
+            reply = json.loads(line)
+            yield reply
+            if "ok" in reply:
+                return
@@ -0,0 +1,282 @@
+"""Указатель меток скрипта для выборочного извлечения.
+
+Для каждой метки хранится диапазон байтов её блока, номер первой строки,
+цели jump/call и метка, в которую блок «проваливается», если не
+заканчивается jump или return. По указателю можно извлечь только
+нужные метки или всё, что достижимо из заданной (например, рут одного
+персонажа), читая лишь эти диапазоны файла.
+
+Меню хранятся внутри своей метки (смещение, строка, имя). Меню с именем
+(`menu имя:`) в Ren'Py — тоже метка: на него можно перейти jump, и его
+можно выбрать для извлечения, как обычную метку.
+
+Указатель строится одним проходом регулярного выражения по байтам и
+хранится в кэше разбора рядом с репликами. Строковые константы (в том
+числе многострочные и в тройных кавычках) и комментарии проходятся
+целиком, так что label, jump или строка без отступа внутри открытой
+строки ничего не значат — как и в DialogueLexer. Строка, продолжающая
+предыдущую через обратную косую черту, блок тоже не закрывает.
+"""
+import bisect
+import re
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+# Меняется при любом изменении построения указателя
+LABEL_INDEX_VERSION = "2"
+
+# Строки с label/menu/jump/call/return на любом отступе и начала строк без отступа (последние
+# закрывают блоки меток верхнего уровня), кроме продолжений после \ в конце строки
+_LINE = re.compile(rb'''
+    ^(?<!\\\n)(?<!\\\r\n)(?P<indent>[ \t]*)(?P<keyword>label|menu|jump|call|return)\b[ \t]*(?P<rest>[^\r\n#"']*)
+  | ^(?<!\\\n)(?<!\\\r\n)(?=[^ \t\r\n#])
+''', re.M | re.X)
+# Строка, открывающая многострочную константу: закрытые на той же строке константы проходятся
+# в head, long — сама константа вместе со строками внутри неё. Строки без таких констант
+# отсеиваются внутри регулярного выражения и до цикла в Python не доходят. head взят в
+# опережающую проверку со ссылкой назад: так в него не возвращается перебор (атомарная группа)
+_OPENS_STRING = rb'''
+    ^(?=(?P<head>[^"'\r\n\#]*(?:(?:"[^"\\\r\n]*(?:\\[^\r\n][^"\\\r\n]*)*"(?!")
+                                 |'[^'\\\r\n]*(?:\\[^\r\n][^'\\\r\n]*)*'(?!'))[^"'\r\n\#]*)*))(?P=head)
+    (?P<long>"""(?:[^\\]|\\.)*?"""|\'\'\'(?:[^\\]|\\.)*?\'\'\'
+      |"[^"\\\r\n]*(?:\\[^\r\n][^"\\\r\n]*)*\\?\r?\n(?:[^"\\]|\\.)*"
+      |'[^'\\\r\n]*(?:\\[^\r\n][^'\\\r\n]*)*\\?\r?\n(?:[^'\\]|\\.)*')
+'''
+_STATEMENT = re.compile(_OPENS_STRING + rb'|' + _LINE.pattern, re.M | re.S | re.X)
+_NAME = re.compile(rb'[\w.]+')
+# Имя меню: `menu имя:` или `menu имя(аргументы):`
+_MENU_NAME = re.compile(rb'([A-Za-z_]\w*)[ \t]*[:(]')
+
+
+class LabelSelection(NamedTuple):
+    """Что читать из одного файла: имена меток и их диапазоны (начало, конец, номер строки)"""
+    names: FrozenSet[str]
+    ranges: Tuple[Tuple[int, int, int], ...] = ()
+    # Номера строк меню внутри выбранных меток
+    menus: Tuple[int, ...] = ()
+
+
+def _full_name(name: str, global_label: Optional[str]) -> str:
+    # Локальная метка (.name) принадлежит последней глобальной
+    if name.startswith('.'):
+        return (global_label or '') + name
+    return name
+
+
+def _target(rest: bytes) -> Optional[bytes]:
+    """Имя цели jump/call; None для jump expression и call screen"""
+    m = _NAME.match(rest)
+    if not m or m.group() in (b'expression', b'screen'):
+        return None
+    return m.group()
+
+
+class LabelIndex:
+    """Метки одного скрипта в порядке файла"""
+
+    def __init__(self, labels: List[list] = (), edges: Dict[str, List[str]] = None,
+                 falls: Dict[str, str] = None, menus: Dict[str, List[list]] = None):
+        # [имя, начало, конец, строка]; у .rpyc начала и конца нет (None)
+        self.labels = [list(label) for label in labels]
+        self.edges = edges or {}
+        self.falls = falls or {}
+        # метка -> [[смещение, строка, имя меню или None], ...]
+        self.menus = menus or {}
+
+    @classmethod
+    def build(cls, data, encoding: str = "utf-8") -> "LabelIndex":
+        """Указатель по байтам скрипта (bytes или mmap, как ScriptSource._data)"""
+        index = cls()
+        labels = index.labels
+        stack = []            # (отступ, номер метки в labels)
+        parents = {}          # номер именованного меню -> номер его метки
+        starts = []           # начала многострочных констант по порядку файла
+        ends = []             # и их концы
+        global_label = None
+        lineno = 1
+        last = 0
+        for m in _STATEMENT.finditer(data):
+            if m.group('long') is not None:
+                starts.append(m.start('long'))
+                ends.append(m.end('long'))
+                # Строка, открывающая константу, может и сама быть инструкцией или концом блока
+                m = _LINE.match(data, m.start())
+                if m is None:
+                    continue
+            pos = m.start()
+            # У mmap нет count, поэтому считаем по срезу
+            lineno += data[last:pos].count(b"\n")
+            last = pos
+            indent = len(m.group('indent') or b"")
+            while stack and indent <= stack[-1][0]:
+                labels[stack.pop()[1]][2] = pos
+            keyword = m.group('keyword')
+            if keyword is None:
+                continue
+            current = labels[stack[-1][1]][0] if stack else None
+            rest = m.group('rest')
+            if keyword == b'label':
+                name = _NAME.match(rest)
+                if not name:
+                    continue
+                name = name.group().decode(encoding, "ignore")
+                if not name.startswith('.'):
+                    global_label = name.split('.')[0]
+                stack.append((indent, len(labels)))
+                labels.append([_full_name(name, global_label), pos, None, lineno])
+            elif keyword == b'menu' and current is not None:
+                name = _MENU_NAME.match(rest)
+                name = name.group(1).decode(encoding, "ignore") if name else None
+                index.menus.setdefault(current, []).append([pos, lineno, name])
+                if name:
+                    # Именованное меню — метка внутри метки: на него переходят jump,
+                    # а из метки оно достижимо всегда
+                    parents[len(labels)] = stack[-1][1]
+                    index.edges.setdefault(current, []).append(name)
+                    stack.append((indent, len(labels)))
+                    labels.append([name, pos, None, lineno])
+            elif keyword in (b'jump', b'call') and current is not None:
+                target = _target(rest)
+                if target:
+                    index.edges.setdefault(current, []).append(
+                        _full_name(target.decode(encoding, "ignore"), global_label))
+        for _, i in stack:
+            labels[i][2] = len(data)
+
+        for i, (name, start, end, _) in enumerate(labels):
+            if i in parents:
+                # После выбора пункта выполнение продолжается в метке с меню
+                index.falls[name] = labels[parents[i]][0]
+                continue
+            following = next((j for j in range(i + 1, len(labels)) if j not in parents), None)
+            if following is not None and _falls_through(data, start, end, starts, ends):
+                index.falls[name] = labels[following][0]
+        return index
+
+    @classmethod
+    def from_flow(cls, flow: Iterable[Tuple[str, List[str], bool, int, List[list]]]) -> "LabelIndex":
+        """Указатель без смещений из (метка, цели jump/call, проваливается ли, строка, меню) — для .rpyc"""
+        index = cls()
+        flow = list(flow)
+        # Именованное меню проваливается в свою метку, а не в следующую по файлу
+        parents = {menu[2]: entry[0] for entry in flow for menu in entry[4] if menu[2]}
+        for i, (name, targets, falls, line, menus) in enumerate(flow):
+            index.labels.append([name, None, None, line])
+            if targets:
+                index.edges[name] = list(targets)
+            if menus:
+                index.menus[name] = [list(menu) for menu in menus]
+                named = [menu[2] for menu in menus if menu[2]]
+                if named:
+                    index.edges[name] = index.edges.get(name, []) + named
+            if name in parents:
+                index.falls[name] = parents[name]
+            elif falls:
+                following = next((entry[0] for entry in flow[i + 1:] if entry[0] not in parents), None)
+                if following is not None:
+                    index.falls[name] = following
+        return index
+
+    def to_dict(self) -> Dict:
+        return {"version": LABEL_INDEX_VERSION, "labels": self.labels, "edges": self.edges,
+                "falls": self.falls, "menus": self.menus}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> Optional["LabelIndex"]:
+        if not isinstance(data, dict) or data.get("version") != LABEL_INDEX_VERSION:
+            return None
+        return cls(data["labels"], data["edges"], data["falls"], data["menus"])
+
+    def names(self) -> List[str]:
+        return [label[0] for label in self.labels]
+
+    def selection(self, names: Iterable[str]) -> LabelSelection:
+        """Диапазоны выбранных меток, слитые и упорядоченные по файлу"""
+        names = frozenset(names)
+        spans = sorted((start, end, line) for name, start, end, line in self.labels
+                       if name in names and start is not None)
+        ranges = []
+        for start, end, line in spans:
+            if ranges and start <= ranges[-1][1]:
+                # Вложенные и соседние блоки читаются одним куском
+                if end > ranges[-1][1]:
+                    ranges[-1] = (ranges[-1][0], end, ranges[-1][2])
+                continue
+            ranges.append((start, end, line))
+        menus = sorted({line for owner, menus in self.menus.items()
+                        for _, line, name in menus if owner in names or name in names})
+        return LabelSelection(names & frozenset(self.names()), tuple(ranges), tuple(menus))
+
+
+def _falls_through(data, start: int, end: int, starts: List[int] = (), ends: List[int] = ()) -> bool:
+    """Продолжается ли выполнение за концом блока метки.
+
+    Блок не проваливается, только если его последняя инструкция —
+    jump или return на отступе тела метки. В остальных случаях (в том
+    числе когда все ветви меню заканчиваются jump) считаем, что
+    проваливается: лишняя метка в выборке лучше потерянной. Строки,
+    начинающиеся внутри многострочной константы (starts/ends по порядку
+    файла), пропускаются.
+    """
+    def meaningful(line_start: int, line: bytes) -> bool:
+        stripped = line.strip()
+        if not stripped or stripped.startswith(b"#"):
+            return False
+        i = bisect.bisect_left(starts, line_start) - 1
+        return i < 0 or line_start >= ends[i]
+
+    # Отступ тела — по первой значимой строке после строки label
+    pos = data.find(b"\n", start, end) + 1
+    body_indent = None
+    while 0 < pos < end:
+        nl = data.find(b"\n", pos, end)
+        line = data[pos:nl if nl >= 0 else end]
+        if meaningful(pos, line):
+            body_indent = len(line) - len(line.lstrip())
+            break
+        pos = nl + 1 if nl >= 0 else end
+    if body_indent is None:
+        return True
+    # Последняя значимая строка блока
+    pos = end
+    while pos > start:
+        line_start = data.rfind(b"\n", start, pos - 1) + 1 or start
+        line = data[line_start:pos]
+        if meaningful(line_start, line):
+            stripped = line.lstrip()
+            indent = len(line) - len(stripped)
+            return not (indent == body_indent and re.match(rb'(jump|return)\b', stripped))
+        if line_start <= start:
+            break
+        pos = line_start
+    return True
+
+
+def select_labels(indexes: List[LabelIndex], labels: Iterable[str],
+                  reachable: bool = False) -> Tuple[List[LabelSelection], List[str]]:
+    """Выборка меток по указателям нескольких файлов.
+
+    При reachable=True к заданным меткам добавляется всё, куда из них
+    можно попасть через jump, call и проваливание, в том числе в других
+    файлах. Возвращает выборку для каждого файла и неизвестные метки.
+    """
+    labels = list(labels)
+    known = set()
+    for index in indexes:
+        known.update(index.names())
+    missing = [name for name in labels if name not in known]
+    chosen = {name for name in labels if name in known}
+    if reachable:
+        targets = {}
+        for index in indexes:
+            for name, edges in index.edges.items():
+                targets.setdefault(name, []).extend(edges)
+            for name, following in index.falls.items():
+                targets.setdefault(name, []).append(following)
+        queue = deque(chosen)
+        while queue:
+            for target in targets.get(queue.popleft(), ()):
+                if target in known and target not in chosen:
+                    chosen.add(target)
+                    queue.append(target)
+    return [index.selection(chosen) for index in indexes], missing
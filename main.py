@@ -1,23 +1,65 @@
 import re
+import argparse
+import copy
+import itertools
 import json
+import queue
+import shutil
+import sqlite3
+import tempfile
 import threading
 import time
+from collections import deque
 from pathlib import Path
-from typing import Dict, List
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 import os
 import sys
 
-# словарь для тегов из Бесконечного лета и Ren'Py
-static_mapping = {
-    "th": "Мысли", "me": "Семён", "dv": "Алиса", "sl": "Славя", 
-    "un": "Лена", "us": "Ульяна", "mz": "Мику", "mt": "Ольга Дмитриевна",
-    "sh": "Шурик", "el": "Электроник", "al": "Алиса", "cs": "Крысёнок",
-    "mi": "Мику", "uv": "Виола", "zh": "Женя", "pi": "Пионер",
-    "pn": "Пионерка", "sq": "Сова", "bus": "Водитель автобуса",
-    "ba": "Борисыч", "sa": "Саша",
-}
+from script_cache import ExtractionCache, default_cache_dir, mapping_digest
+from script_source import ScriptSource
+from rpa_archive import ArchiveMember, script_members
+import rpyc_reader
+from output_writers import WRITERS, get_writer
+from search_index import SearchIndex, default_index_path
+from label_index import LABEL_INDEX_VERSION, LabelIndex, LabelSelection, select_labels
+from dialogue_lexer import NOT_SPEAKERS, DialogueLexer
+import translation
+import dialogue_diff
+from extraction_profile import ExtractionProfile
+from dialogue_stats import DialogueStats, write_stats
+from result_file import open_results
+import mapping_packs
+
+# tkinter загружается только при запуске окна (см. _load_tkinter), чтобы CLI стартовал быстро
+tk = ttk = filedialog = messagebox = scrolledtext = tkfont = None
+
+
+def _load_tkinter():
+    global tk, ttk, filedialog, messagebox, scrolledtext, tkfont
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext
+    from tkinter import font as tkfont
+
+
+# Версия разбора: меняется при любом изменении логики, влияющем на результат
+PARSER_VERSION = "7"
+
+# Сколько первых реплик возвращать в results['dialogues'] для предпросмотра
+PREVIEW_SIZE = 5
+# Как часто разбор сообщает о прогрессе (секунды) и окно забирает сообщения (мс)
+PROGRESS_INTERVAL = 0.1
+PROGRESS_POLL_MS = 50
+# Как часто пакетный режим проверяет отмену, пока файлы обрабатываются (секунды)
+CANCEL_POLL_INTERVAL = 0.2
+# Сколько заданий из очереди окна выполняется одновременно
+JOB_WORKERS = 2
+# Сколько найденных реплик показывать в окне
+SEARCH_LIMIT = 200
+# Пункт выбора игры в поиске, означающий «искать везде»
+ALL_GAMES = "все игры"
+# Сколько скриптов игры и байт из начала каждого читать для определения набора тегов
+PACK_SAMPLE_FILES = 12
+PACK_SAMPLE_BYTES = 256 * 1024
 
 class AliceDvacheskayaTheme:
     """Цветовая палитра в стиле Алисы Двачевской"""
@@ -35,11 +77,142 @@ class AliceDvacheskayaTheme:
         'border_gold': '#daa520',
     }
 
+class DialogueRecord(NamedTuple):
+    """Одна реплика из скрипта"""
+    speaker: Optional[str]
+    name: Optional[str]
+    text: str
+    line: int
+    label: Optional[str] = None
+
+    def format(self, with_names: bool = True) -> str:
+        if with_names and self.speaker:
+            return f"{self.name}: {self.text}"
+        return self.text
+
+
+# Правила пропуска по умолчанию: пути к ресурсам, служебный код и команды сцены
+DEFAULT_SKIP_RULES = {
+    "contains": [".png", ".jpg", ".jpeg", ".mp3", ".ogg", ".wav",
+                 "persistent.", "matrixcolor", "mods/"],
+    "prefixes": ["show", "hide", "scene", "play", "stop", "queue", "with", "pause"],
+}
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """Собирает из слов регулярное выражение с общими префиксами (по сути — бор)"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        end = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 and not end else '(?:' + '|'.join(branches) + ')'
+        return body + '?' if end else body
+
+    return build(trie)
+
+
+class SkipRules:
+    """Правила пропуска строк, скомпилированные в одно регулярное выражение.
+
+    Подстроки ищутся одним проходом по бору из всех подстрок, команды
+    (show, play, ...) — одной якорной альтернативой в начале текста.
+    """
+
+    def __init__(self, contains: List[str] = (), prefixes: List[str] = ()):
+        self.contains = list(dict.fromkeys(s.lower() for s in contains if s))
+        self.prefixes = list(dict.fromkeys(s.lower() for s in prefixes if s))
+        self._compile()
+
+    @classmethod
+    def default(cls) -> "SkipRules":
+        return cls(DEFAULT_SKIP_RULES["contains"], DEFAULT_SKIP_RULES["prefixes"])
+
+    def _compile(self):
+        # Текст приводится к нижнему регистру один раз: поиск без IGNORECASE
+        # заметно быстрее, особенно на кириллице
+        prefix = re.compile(r'(?P<prefix>' + _trie_pattern(self.prefixes) + r')\s').match if self.prefixes else None
+        contains = re.compile(r'(?P<contains>' + _trie_pattern(self.contains) + ')').search if self.contains else None
+
+        def search(text):
+            low = text.lower()
+            return (prefix and prefix(low)) or (contains and contains(low)) or None
+
+        self.search = search
+
+    def __getstate__(self):
+        return {"contains": self.contains, "prefixes": self.prefixes}
+
+    def __setstate__(self, state):
+        self.contains = state["contains"]
+        self.prefixes = state["prefixes"]
+        self._compile()
+
+    def match(self, text: str) -> Optional[str]:
+        """Возвращает сработавшее правило или None"""
+        m = self.search(text)
+        if m is None:
+            return None
+        return self.rule_name(m)
+
+    @staticmethod
+    def rule_name(m) -> str:
+        """Правило по результату search: «prefix:show», «contains:renpy.»"""
+        return f"{m.lastgroup}:{m.group(m.lastgroup).lower()}"
+
+    def add(self, contains: List[str] = (), prefixes: List[str] = ()):
+        self.contains = list(dict.fromkeys(self.contains + [s.lower() for s in contains if s]))
+        self.prefixes = list(dict.fromkeys(self.prefixes + [s.lower() for s in prefixes if s]))
+        self._compile()
+
+    def remove(self, rules: List[str]):
+        rules = {s.lower() for s in rules}
+        self.contains = [s for s in self.contains if s not in rules]
+        self.prefixes = [s for s in self.prefixes if s not in rules]
+        self._compile()
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {"contains": list(self.contains), "prefixes": list(self.prefixes)}
+
+    def digest(self) -> str:
+        return mapping_digest(self.to_dict())
+
+
+class ExtractionCancelled(Exception):
+    """Извлечение остановлено через cancel_token"""
+
+
 class RenPyParser:
     def __init__(self):
         self.char_pattern = re.compile(r'^\s*\$?\s*(\w+)\s*=\s*Character\s*\(\s*u?[\'"]([^\'"]+)[\'"]')
         self.dialogue_pattern = re.compile(r'^\s*(?:(\w+)\s*)?"(.+)"')
         self.custom_mapping = {}
+        # Сколько реплик можно держать в ожидании имени говорящего
+        self.pending_limit = 10000
+        # Кэш разбора (ExtractionCache) или None
+        self.cache = None
+        self.skip_rules = SkipRules.default()
+        # Лексер на конечном автомате; False — прежний построчный разбор регулярками
+        self.use_lexer = True
+        # Кодировка скриптов; None — определять по BOM и образцу
+        self.encoding = None
+        # Формат итогового файла: text, jsonl, csv, sqlite (см. output_writers)
+        self.output_format = "text"
+        # Замеры этапов и счётчики строк в results['profile'] (см. extraction_profile)
+        self.profiling = False
+        # Статистика по персонажам, файлам и меткам в results['stats'] (см. dialogue_stats)
+        self.analytics = False
+        # Набор тегов известной игры (см. mapping_packs): его id, "auto" — определить по скриптам, None — без набора
+        self.mapping_pack = "auto"
+        # Теги выбранного для текущей игры набора; None — ещё не выбирали
+        self.pack_mapping = None
         
     def load_custom_mapping(self, filepath: Path):
         try:
@@ -60,130 +233,1363 @@ class RenPyParser:
     
     def add_custom_tag(self, tag: str, name: str):
         self.custom_mapping[tag] = name
+
+    def select_mapping_pack(self, files: List[Union[Path, ArchiveMember]]) -> Optional[str]:
+        """Выбирает набор тегов для игры из files; возвращает id набора или None.
+
+        При mapping_pack="auto" читается только выборка скриптов
+        (см. sample_tags), а загружается лишь подошедший набор.
+        """
+        pack_id, self.pack_mapping = self._find_pack(files)
+        return pack_id
+
+    def _find_pack(self, files: List[Union[Path, ArchiveMember]]) -> Tuple[Optional[str], Dict[str, str]]:
+        pack_id = self.mapping_pack
+        if pack_id == "auto":
+            pack_id = mapping_packs.detect(self.sample_tags(files))
+        return pack_id, (mapping_packs.load(pack_id) if pack_id else {})
+
+    def sample_tags(self, files: List[Union[Path, ArchiveMember]]) -> Dict[str, int]:
+        """Частоты тегов в репликах PACK_SAMPLE_FILES равномерно выбранных скриптов.
+
+        Из .rpy и скриптов в архиве берутся первые PACK_SAMPLE_BYTES байт,
+        .rpyc разбирается целиком.
+        """
+        counts = {}
+        if not files:
+            return counts
+        step = max(1, len(files) / PACK_SAMPLE_FILES)
+        for path in dict.fromkeys(files[int(i * step)] for i in range(min(len(files), PACK_SAMPLE_FILES))):
+            try:
+                if _is_compiled(path):
+                    found = {}
+                    for kind, speaker, *_ in rpyc_reader.iter_tokens(self._load_compiled(path)):
+                        if kind == 'say' and speaker:
+                            found[speaker] = found.get(speaker, 0) + 1
+                else:
+                    if isinstance(path, ArchiveMember):
+                        data = path.read()[:PACK_SAMPLE_BYTES]
+                    else:
+                        with open(path, 'rb') as f:
+                            data = f.read(PACK_SAMPLE_BYTES)
+                    found = mapping_packs.fingerprint_tags(data, NOT_SPEAKERS)
+            except Exception:
+                continue
+            for tag, count in found.items():
+                counts[tag] = counts.get(tag, 0) + count
+        return counts
+
+    def load_skip_rules(self, filepath: Path):
+        """Загружает правила пропуска: {"contains": [...], "prefixes": [...], "remove": [...]}
+
+        Новые правила добавляются к стандартным, а перечисленные в remove убираются.
+        """
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            rules = SkipRules.default()
+            rules.add(data.get("contains", []), data.get("prefixes", []))
+            rules.remove(data.get("remove", []))
+            self.skip_rules = rules
+            return True
+        except:
+            self.skip_rules = SkipRules.default()
+            return False
+
+    def save_skip_rules(self, filepath: Path):
+        try:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(self.skip_rules.to_dict(), f, ensure_ascii=False, indent=2)
+            return True
+        except:
+            return False
         
-    def extract_script(self, input_path: Path, output_path: Path, with_names: bool = True, progress_callback=None) -> Dict:
-        dynamic_mapping = {}
+    def iter_dialogues(self, input_path: Union[Path, ArchiveMember], with_names: bool = True,
+                       characters: Optional[Dict[str, str]] = None, progress_callback=None,
+                       selection: Optional[LabelSelection] = None,
+                       profile: Optional[ExtractionProfile] = None) -> Iterator[DialogueRecord]:
+        """Однопроходный генератор реплик.
+
+        Файл читается один раз. Определения Character(...) попадают в
+        characters по мере чтения, а реплики с ещё неизвестным именем
+        ждут в небольшом буфере, пока имя не найдётся ниже по файлу.
+        Теги из набора тегов известны сразу и в буфере не ждут.
+        С selection читаются только диапазоны выбранных меток.
+        """
+        if characters is None:
+            characters = {}
+        custom = self.custom_mapping
+        pack = self.pack_mapping
+        if pack is None:
+            # Вызов в обход extract_*: набор определяется по этому же файлу
+            pack = self._find_pack([input_path])[1]
+        pending = deque()
+
+        def resolve(speaker):
+            if speaker in custom:
+                return custom[speaker]
+            if speaker in characters:
+                return characters[speaker]
+            return pack.get(speaker, speaker)
+
+        def is_ready(speaker):
+            # Тег из набора уже известен — реплика не ждёт Character ниже по файлу
+            return not with_names or not speaker or speaker in custom or speaker in characters or speaker in pack
+
+        def drain(force=False):
+            # Отдаём реплики строго по порядку: буфер освобождается с головы
+            ready = []
+            while pending and (force or len(pending) > self.pending_limit or is_ready(pending[0][0])):
+                speaker, text, line_no, label = pending.popleft()
+                ready.append(DialogueRecord(speaker, resolve(speaker) if speaker else None, text, line_no, label))
+            return ready
+
+        for kind, speaker, text, line_no, label in self._statements(input_path, progress_callback, selection, profile):
+            if kind == 'character':
+                characters[speaker] = text
+                if not pending:
+                    continue
+            elif not pending and is_ready(speaker):
+                yield DialogueRecord(speaker, resolve(speaker) if speaker else None, text, line_no, label)
+                continue
+            else:
+                pending.append((speaker, text, line_no, label))
+            yield from drain()
+        yield from drain(force=True)
+
+    def _statements(self, input_path: Union[Path, ArchiveMember], progress_callback=None,
+                    selection: Optional[LabelSelection] = None, profile: Optional[ExtractionProfile] = None
+                    ) -> Iterator[Tuple[str, Optional[str], str, int, Optional[str]]]:
+        """Реплики и персонажи файла: .rpyc читается из дерева разбора, .rpy — лексером или регулярками"""
+        if _is_compiled(input_path):
+            load = self._load_compiled if profile is None else profile.timed_call(self._load_compiled, "read")
+            tokens = rpyc_reader.iter_tokens(load(input_path))
+            if selection is not None:
+                # В .rpyc нет смещений: дерево загружается целиком, лишние метки отсеиваются
+                names = selection.names
+                tokens = (token for token in tokens if token[0] == 'character' or token[4] in names)
+            yield from self._merge_tokens(tokens, profile)
+            return
+        with self._open_source(input_path) as source:
+            if self.use_lexer:
+                yield from self._lexer_statements(source, progress_callback, selection, profile)
+            else:
+                lines = self._candidate_lines(source, (b'"', b'Character'), selection=selection)
+                if profile is not None:
+                    lines = profile.timed(lines, "read", count_lines=True)
+                if progress_callback:
+                    lines = self._with_progress(lines, source, progress_callback)
+                yield from self._regex_statements(lines, source.line_encoding, profile)
+
+    def _candidate_lines(self, source: ScriptSource, markers: Tuple[bytes, ...], need_all=None,
+                         selection: Optional[LabelSelection] = None) -> Iterator[Tuple[int, int, bytes]]:
+        """Строки-кандидаты всего файла или только диапазонов выбранных меток"""
+        if selection is None:
+            return source.iter_candidate_lines(markers, need_all)
+        return itertools.chain.from_iterable(
+            source.iter_candidate_lines(markers, need_all, start, line, end)
+            for start, end, line in selection.ranges)
+
+    def label_index(self, input_path: Union[Path, ArchiveMember]) -> LabelIndex:
+        """Указатель меток файла; с кэшем строится один раз на каждую версию файла"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self._source_digest(input_path), LABEL_INDEX_VERSION, "labels",
+                                      self.encoding)
+            index = LabelIndex.from_dict(self.cache.get_label_index(key))
+            if index is not None:
+                return index
+        if _is_compiled(input_path):
+            index = LabelIndex.from_flow(rpyc_reader.label_flow(self._load_compiled(input_path)))
+        else:
+            with self._open_source(input_path) as source:
+                index = LabelIndex.build(source.data, source.line_encoding)
+        if key is not None:
+            self.cache.put_label_index(key, index.to_dict())
+        return index
+
+    def _select_labels(self, files: List[Union[Path, ArchiveMember]], labels: List[str],
+                       reachable: bool) -> Tuple[List[LabelSelection], List[str]]:
+        """Выборка меток по всем файлам игры: переходы между файлами тоже учитываются"""
+        indexes = []
+        for path in files:
+            try:
+                indexes.append(self.label_index(path))
+            except Exception:
+                # Нечитаемый файл просто не даёт меток; ошибку покажет само извлечение
+                indexes.append(LabelIndex())
+        return select_labels(indexes, labels, reachable)
+
+    def _load_compiled(self, input_path: Union[Path, ArchiveMember]) -> List:
+        data = input_path.read() if isinstance(input_path, ArchiveMember) else Path(input_path).read_bytes()
+        return rpyc_reader.load_statements(data)
+
+    def _open_source(self, input_path: Union[Path, ArchiveMember]) -> ScriptSource:
+        """Источник строк для файла на диске или для скрипта внутри .rpa архива"""
+        if isinstance(input_path, ArchiveMember):
+            return ScriptSource(input_path.read(), str(input_path), self.encoding)
+        return ScriptSource.open(input_path, self.encoding)
+
+    def _source_digest(self, input_path: Union[Path, ArchiveMember]) -> str:
+        """Хэш содержимого для ключа кэша; у скрипта из архива — хэш архива и имя внутри него"""
+        if isinstance(input_path, ArchiveMember):
+            return f"{self.cache.digest(input_path.archive)}/{input_path.name}"
+        return self.cache.digest(input_path)
+
+    def _with_progress(self, lines: Iterator[Tuple[int, int, bytes]], source: ScriptSource,
+                       progress_callback) -> Iterator[Tuple[int, int, bytes]]:
+        """Пропускает строки насквозь, сообщая прогресс по смещению в источнике.
+
+        Сообщения идут не чаще раза в PROGRESS_INTERVAL секунд; часы
+        проверяются раз в 256 строк, чтобы не тратить время на каждой.
+        """
+        total_bytes = source.size or 1
+        total_mb = total_bytes / (1024 * 1024)
+        clock = time.monotonic
+        next_report = clock() + PROGRESS_INTERVAL
+        countdown = 256
+        for line in lines:
+            yield line
+            countdown -= 1
+            if countdown:
+                continue
+            countdown = 256
+            now = clock()
+            if now >= next_report:
+                next_report = now + PROGRESS_INTERVAL
+                done_mb = line[1] / (1024 * 1024)
+                progress_callback(line[1] / total_bytes,
+                                  f"📖 Обработка строк... {line[0]} ({done_mb:.1f} из {total_mb:.1f} МБ)")
+
+    def _lexer_statements(self, source: ScriptSource, progress_callback=None,
+                          selection: Optional[LabelSelection] = None, profile: Optional[ExtractionProfile] = None
+                          ) -> Iterator[Tuple[str, Optional[str], str, int, Optional[str]]]:
+        """Реплики и персонажи через DialogueLexer.
+
+        Лексер получает только строки-кандидаты: остальные пропускаются
+        поиском по байтам, пока не открыта многострочная строка. Каждый
+        диапазон выбранных меток лексер проходит заново: строка, не
+        закрытая к концу одного блока, не поглощает начало следующего.
+        """
+        lexer = DialogueLexer()
+        ranges = selection.ranges if selection is not None else [(0, None, 1)]
+        parts = [source.iter_candidate_lines(lexer.candidate_markers, lambda: lexer.in_string, start, line, end)
+                 for start, end, line in ranges]
+
+        def tokens(lines):
+            if profile is not None:
+                lines = profile.timed(lines, "read", count_lines=True)
+            if progress_callback:
+                lines = self._with_progress(lines, source, progress_callback)
+            return lexer.tokens(lines, source.line_encoding)
+
+        yield from self._merge_tokens(itertools.chain.from_iterable(map(tokens, parts)), profile)
+
+    def _merge_tokens(self, tokens: Iterator[Tuple], profile: Optional[ExtractionProfile] = None
+                      ) -> Iterator[Tuple[str, Optional[str], str, int, Optional[str]]]:
+        """Реплики из лексем: extend приклеивается к предыдущей реплике, лишнее отсеивается"""
+        skip = self.skip_rules.search
+        if profile is not None:
+            skip = profile.counting_skip(skip, SkipRules.rule_name)
+        last = None
+        matched = merged = 0
+        for kind, speaker, text, line_no, label in tokens:
+            if kind == 'character':
+                yield kind, speaker, text, line_no, label
+                continue
+            matched += 1
+            if kind == 'extend':
+                if last is not None:
+                    if not skip(text):
+                        # Ren'Py склеивает extend с репликой как есть, без пробела
+                        last = (last[0], (last[1] + text).strip(), last[2], last[3])
+                        merged += 1
+                    continue
+                speaker = None
+            if last is not None:
+                yield 'say', last[0], last[1], last[2], last[3]
+                last = None
+            text = text.strip()
+            if text and not skip(text):
+                last = (speaker, text, line_no, label)
+        if last is not None:
+            yield 'say', last[0], last[1], last[2], last[3]
+        if profile is not None:
+            profile.matched += matched
+            profile.merged += merged
+
+    def _regex_statements(self, lines: Iterator[Tuple[int, int, bytes]], encoding: str = "utf-8",
+                          profile: Optional[ExtractionProfile] = None
+                          ) -> Iterator[Tuple[str, Optional[str], str, int, Optional[str]]]:
+        """Прежний построчный разбор регулярными выражениями (для сравнения и как запасной путь)"""
+        skip = self.skip_rules.search
+        if profile is not None:
+            skip = profile.counting_skip(skip, SkipRules.rule_name)
+        matched = merged = 0
+        current_speaker = None
+        current_text = []
+        current_line = 0
+
+        for i, offset, raw in lines:
+            if b'"' not in raw and b'Character' not in raw:
+                continue
+            line = raw.decode(encoding, "ignore")
+            m = self.char_pattern.match(line)
+            if m:
+                tag, name = m.groups()
+                yield 'character', tag, name, i, None
+
+            m = self.dialogue_pattern.match(line)
+            if m:
+                speaker, text = m.groups()
+                matched += 1
+
+                if skip(text):
+                    continue
+
+                # Если сменился говорящий или закончилась многострочная реплика
+                if speaker != current_speaker and current_text:
+                    full_text = " ".join(current_text).strip()
+                    if full_text and not skip(full_text):
+                        yield 'say', current_speaker, full_text, current_line, None
+                    current_text = []
+
+                if not current_text:
+                    current_line = i
+                else:
+                    merged += 1
+                current_speaker = speaker
+
+                # Обработка многострочных реплик
+                if line.rstrip().endswith('\\'):
+                    current_text.append(text.rstrip('\\').strip())
+                else:
+                    current_text.append(text)
+                    full_text = " ".join(current_text).strip()
+                    # Одиночную строку без лишних пробелов уже проверили выше
+                    if full_text and (full_text == text or not skip(full_text)):
+                        yield 'say', current_speaker, full_text, current_line, None
+                    current_text = []
+                    current_speaker = None
+
+        # Последняя реплика
+        if current_text:
+            full_text = " ".join(current_text).strip()
+            if full_text and not skip(full_text):
+                yield 'say', current_speaker, full_text, current_line, None
+        if profile is not None:
+            profile.matched += matched
+            profile.merged += merged
+
+    def extract_script(self, input_path: Path, output_path: Path, with_names: bool = True, progress_callback=None,
+                       characters: Optional[Dict[str, str]] = None, keep_dialogues: bool = False,
+                       cancel_token: Optional[threading.Event] = None, labels: Optional[List[str]] = None,
+                       reachable: bool = False) -> Dict:
+        """Извлекает реплики файла в output_path.
+
+        Реплики пишутся в файл по мере разбора. В results['dialogues']
+        остаются только первые PREVIEW_SIZE; все реплики в памяти — только
+        при keep_dialogues=True. Если cancel_token выставлен, разбор
+        прерывается, недописанный файл удаляется, а results['cancelled']
+        становится True.
+
+        С labels извлекаются только эти метки (с reachable=True — и всё,
+        куда из них ведут jump, call и проваливание), а из файла читаются
+        только их диапазоны байтов.
+
+        При включённом profiling в results['profile'] попадают время
+        этапов и счётчики строк (см. ExtractionProfile.to_dict), при
+        analytics в results['stats'] — строки и слова по персонажам
+        (см. DialogueStats.to_dict).
+
+        Набор тегов выбирается по self.mapping_pack, его id — в
+        results['mapping_pack']; свои теги и Character(...) из скриптов
+        перекрывают теги набора.
+        """
+        profile = ExtractionProfile() if self.profiling else None
+        select_pack = self.select_mapping_pack
+        if profile is not None:
+            select_pack = profile.timed_call(select_pack, "characters")
+        pack_id = select_pack([input_path])
+        selection = None
+        if labels:
+            select_labels = self._select_labels
+            scan_characters = self.scan_characters
+            if profile is not None:
+                select_labels = profile.timed_call(select_labels, "read")
+                scan_characters = profile.timed_call(scan_characters, "characters")
+            selections, missing = select_labels([input_path], labels, reachable)
+            selection = selections[0]
+            if not selection.names:
+                # Ни одной метки нет — пустой результат не должен заменять прежний файл
+                return {'dialogues': [], 'characters_found': {}, 'total_replicas': 0, 'success': False,
+                        'cancelled': False, 'mapping_pack': pack_id, 'labels': [], 'missing_labels': missing,
+                        'error': f"Метки не найдены: {', '.join(missing)}"}
+            if characters is None:
+                # Персонажи обычно определены вне нужных меток
+                characters = scan_characters(input_path)
+        results = self._extract_one(input_path, output_path, with_names, progress_callback, characters,
+                                    keep_dialogues, cancel_token, selection=selection, profile=profile)
+        results['mapping_pack'] = pack_id
+        if labels:
+            results['labels'] = sorted(selection.names)
+            results['menus'] = len(selection.menus)
+            results['missing_labels'] = missing
+        if self.cache is not None:
+            self._maintain_cache()
+        return results
+
+    def _maintain_cache(self):
+        """Сохраняет индекс кэша и вытесняет лишние записи"""
+        try:
+            self.cache.save_index()
+            self.cache.evict()
+        except OSError:
+            pass
+
+    def _iter_records(self, input_path: Union[Path, ArchiveMember], with_names: bool, characters: Dict[str, str],
+                      progress_callback=None, selection: Optional[LabelSelection] = None,
+                      profile: Optional[ExtractionProfile] = None) -> Iterator[DialogueRecord]:
+        """Реплики файла: из кэша, если файл не менялся, иначе разбором с записью в кэш"""
+        if self.cache is None or selection is not None:
+            # Выборка меток читает малую часть файла, в кэше хранятся только файлы целиком
+            yield from self.iter_dialogues(input_path, with_names, characters, progress_callback, selection, profile)
+            return
+
+        mapping = {**self.pack_mapping, **characters, **self.custom_mapping}
+        key = self.cache.make_key(self._source_digest(input_path), PARSER_VERSION, with_names, mapping_digest(mapping),
+                                  self.skip_rules.digest(), self.use_lexer, self.encoding)
+        if self.cache.has_records(key):
+            rows = self.cache.iter_records(key)
+            if profile is not None:
+                profile.cached_files += 1
+                rows = profile.timed(rows, "read")
+            while True:
+                try:
+                    row = next(rows)
+                except StopIteration as stop:
+                    characters.update(stop.value)
+                    return
+                yield DialogueRecord(*row)
+
+        known = dict(characters)
+        writer = self.cache.record_writer(key)
+        try:
+            for record in self.iter_dialogues(input_path, with_names, characters, progress_callback,
+                                              profile=profile):
+                writer.add(list(record))
+                yield record
+        except BaseException:
+            writer.abort()
+            raise
+        # В запись попадают только персонажи, определённые в самом файле
+        writer.finish({tag: name for tag, name in characters.items() if known.get(tag) != name})
+
+    def _extract_one(self, input_path: Union[Path, ArchiveMember], output_path: Path, with_names: bool = True, progress_callback=None,
+                     characters: Optional[Dict[str, str]] = None, keep_dialogues: bool = False,
+                     cancel_token: Optional[threading.Event] = None, source_name: Optional[str] = None,
+                     selection: Optional[LabelSelection] = None,
+                     profile: Optional[ExtractionProfile] = None) -> Dict:
+        if profile is None and self.profiling:
+            profile = ExtractionProfile()
+        if source_name is None:
+            source_name = input_path.name if isinstance(input_path, ArchiveMember) else Path(input_path).name
+        if characters is None:
+            characters = {}
         results = {
             'dialogues': [],
             'characters_found': {},
             'total_replicas': 0,
-            'success': False
+            'success': False,
+            'cancelled': False
         }
 
-        # Собираем динамический словарь персонажей
+        def reading_progress(value, text):
+            progress_callback(value * 0.9, text)
+
+        # Пишем во временный файл рядом с итоговым, чтобы при ошибке не затереть старый результат
+        output_path = Path(output_path)
+        part_path = _part_path(output_path)
+        dialogues = []
+        count = 0
+        keep = None if keep_dialogues else PREVIEW_SIZE
+        stats = DialogueStats() if self.analytics else None
         try:
-            with open(input_path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
-                total_lines = len(lines)
-                
-            for i, line in enumerate(lines):
-                m = self.char_pattern.match(line)
-                if m:
-                    tag, name = m.groups()
-                    dynamic_mapping[tag] = name
-                    
-                if progress_callback and i % 100 == 0:
-                    progress = (i / total_lines) * 0.3
-                    progress_callback(progress, "🔍 Поиск персонажей...")
-                    
+            writer = get_writer(self.output_format)(part_path, with_names)
+            write = writer.write
+            if profile is not None:
+                profile.files += 1
+                profile.bytes += _input_size(input_path, selection)
+                write = profile.timed_call(write, "write")
+                before = dict(profile.stages)
+                loop_start = time.perf_counter()
+            try:
+                for record in self._iter_records(input_path, with_names, characters,
+                                                 reading_progress if progress_callback else None, selection,
+                                                 profile):
+                    if cancel_token is not None and cancel_token.is_set():
+                        raise ExtractionCancelled()
+                    write(record, source_name)
+                    count += 1
+                    if stats is not None:
+                        stats.add(record, source_name)
+                    if keep is None or count <= keep:
+                        dialogues.append(record.format(with_names))
+            finally:
+                close_start = time.perf_counter()
+                writer.close()
+
+            if progress_callback:
+                progress_callback(0.9, "💾 Сохранение результата...")
+            os.replace(part_path, output_path)
+            if profile is not None:
+                stages = profile.stages
+                # Разбор — всё время цикла, кроме чтения строк и записи реплик
+                stages['dialogues'] += (close_start - loop_start - (stages['read'] - before['read'])
+                                        - (stages['write'] - before['write']))
+                stages['write'] += time.perf_counter() - close_start
+                profile.replicas += count
         except Exception as e:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            results['cancelled'] = isinstance(e, ExtractionCancelled)
+            if not results['cancelled']:
+                results['error'] = f"{type(e).__name__}: {e}"
             return results
 
         # Итоговый словарь (пользовательские теги имеют приоритет)
-        mapping = {**static_mapping, **dynamic_mapping, **self.custom_mapping}
-        results['characters_found'] = mapping
+        results['characters_found'] = {**self.pack_mapping, **characters, **self.custom_mapping}
+        results['dialogues'] = dialogues
+        results['total_replicas'] = count
+        results['success'] = True
+        if profile is not None:
+            results['profile'] = profile.to_dict()
+        if stats is not None:
+            results['stats'] = stats.to_dict()
 
-        dialogues = []
-        current_speaker = None
-        current_text = []
+        if progress_callback:
+            progress_callback(1.0, "✅ Готово!")
 
-        def save_current_dialogue():
-            if current_text:
-                full_text = " ".join(current_text).strip()
-                if full_text and not self._should_skip_line(full_text):
-                    if with_names and current_speaker:
-                        name = mapping.get(current_speaker, current_speaker)
-                        dialogues.append(f"{name}: {full_text}")
-                    else:
-                        dialogues.append(full_text)
+        return results
 
-        # Обработка диалогов
-        try:
-            with open(input_path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
-                total_lines = len(lines)
-                
-            for i, line in enumerate(lines):
-                m = self.dialogue_pattern.match(line)
+    def scan_characters(self, input_path: Union[Path, ArchiveMember]) -> Dict[str, str]:
+        """Собирает только определения Character(...) из файла"""
+        characters = {}
+        if self.use_lexer:
+            match = lambda line: DialogueLexer.char_pattern.match(line.lstrip())
+        else:
+            match = self.char_pattern.match
+        if _is_compiled(input_path):
+            try:
+                statements = self._load_compiled(input_path)
+            except Exception:
+                # Повреждённый файл попадёт в список неудачных на этапе извлечения
+                return characters
+            for kind, tag, name, *_ in rpyc_reader.iter_tokens(statements):
+                if kind == 'character':
+                    characters[tag] = name
+            return characters
+        with self._open_source(input_path) as source:
+            for _, _, raw in source.iter_candidate_lines((b"Character",)):
+                m = match(source.decode(raw))
                 if m:
-                    speaker, text = m.groups()
-                    
-                    if self._should_skip_line(text):
-                        continue
+                    tag, name = m.groups()
+                    characters[tag] = name
+        return characters
 
-                    # Если сменился говорящий или закончилась многострочная реплика
-                    if speaker != current_speaker and current_text:
-                        save_current_dialogue()
-                        current_text = []
+    def extract_directory(self, input_dir: Path, output_path: Path, with_names: bool = True,
+                          merge: bool = True, workers: Optional[int] = None, progress_callback=None,
+                          cancel_token: Optional[threading.Event] = None, labels: Optional[List[str]] = None,
+                          reachable: bool = False) -> Dict:
+        """Пакетное извлечение из всех .rpy файлов папки.
 
-                    current_speaker = speaker
-                    
-                    # Обработка многострочных реплик
-                    if line.rstrip().endswith('\\'):
-                        current_text.append(text.rstrip('\\').strip())
-                    else:
-                        current_text.append(text)
-                        save_current_dialogue()
-                        current_text = []
-                        current_speaker = None
+        Сначала со всех файлов собираются определения персонажей, затем
+        каждый файл обрабатывается отдельным процессом. При merge=True
+        результат склеивается в output_path в порядке путей, иначе
+        output_path считается папкой и для каждого скрипта пишется свой .txt.
 
-                if progress_callback and i % 100 == 0:
-                    progress = 0.3 + (i / total_lines) * 0.6
-                    progress_callback(progress, f"📖 Обработка строк... {i}/{total_lines}")
+        Скрипты из .rpa архивов читаются прямо из архива. Как и в самом
+        Ren'Py, файл, лежащий рядом с архивом, перекрывает одноимённый
+        файл из архива. Скомпилированный .rpyc берётся, только если
+        рядом нет исходного .rpy.
 
-            # Последняя реплика
-            save_current_dialogue()
+        labels и reachable — как у extract_script; переходы между файлами
+        учитываются, а файлы без выбранных меток не читаются вовсе.
+        """
+        found, failed = self._game_scripts(Path(input_dir))
+        return self._extract_batch([source for _, source in found], [name for name, _ in found], output_path,
+                                   with_names, merge, workers, progress_callback, failed, cancel_token,
+                                   labels, reachable)
 
-        except Exception as e:
+    def extract_archive(self, archive_path: Path, output_path: Path, with_names: bool = True,
+                        merge: bool = True, workers: Optional[int] = None, progress_callback=None,
+                        cancel_token: Optional[threading.Event] = None, labels: Optional[List[str]] = None,
+                        reachable: bool = False) -> Dict:
+        """Извлечение из всех скриптов одного .rpa архива без распаковки на диск"""
+        try:
+            members = self._archive_scripts(archive_path)
+        except Exception:
+            return self._extract_batch([], [], output_path, with_names, merge, workers, progress_callback,
+                                       [str(archive_path)])
+        return self._extract_batch(members, [member.name for member in members], output_path, with_names,
+                                   merge, workers, progress_callback, (), cancel_token, labels, reachable)
+
+    @staticmethod
+    def _game_scripts(input_dir: Path) -> Tuple[List[Tuple[str, Union[Path, ArchiveMember]]], List[str]]:
+        """Скрипты папки игры как (путь относительно папки, источник) по порядку путей и нечитаемые архивы"""
+        # Путь без расширения → (путь с расширением, источник); первым записывается более приоритетный
+        scripts = {}
+        for pattern in ("*.rpy", "*.rpyc"):
+            for path in sorted(input_dir.rglob(pattern)):
+                name = path.relative_to(input_dir).as_posix()
+                scripts.setdefault(name.rsplit('.', 1)[0], (name, path))
+        failed = []
+        for archive in sorted(input_dir.rglob("*.rpa")):
+            try:
+                members = script_members(archive, (".rpy", ".rpyc"))
+            except Exception:
+                failed.append(str(archive))
+                continue
+            base = archive.parent.relative_to(input_dir)
+            for member in members:
+                name = (base / member.name).as_posix()
+                scripts.setdefault(name.rsplit('.', 1)[0], (name, member))
+        return sorted(scripts.values(), key=lambda item: item[0]), failed
+
+    @staticmethod
+    def _archive_scripts(archive_path: Path) -> List[ArchiveMember]:
+        members = script_members(archive_path, (".rpy", ".rpyc"))
+        # .rpyc нужен, только если исходника нет в том же архиве
+        sources = {member.name for member in members if member.name.lower().endswith(".rpy")}
+        return [member for member in members if member.name[:-1] not in sources]
+
+    def _extract_batch(self, files: List[Union[Path, ArchiveMember]], names: List[str], output_path: Path,
+                       with_names: bool = True, merge: bool = True, workers: Optional[int] = None,
+                       progress_callback=None, failed: List[str] = (),
+                       cancel_token: Optional[threading.Event] = None, labels: Optional[List[str]] = None,
+                       reachable: bool = False) -> Dict:
+        """Общая часть пакетного режима; names — пути скриптов относительно игры для вывода по файлам.
+
+        Все файлы сначала пишутся во временную папку рядом с результатом и
+        переносятся на место только в конце, поэтому после ошибки или
+        отмены не остаётся недописанных файлов. Об отмене рабочие процессы
+        узнают через multiprocessing.Event и бросают текущий файл.
+
+        В профиле пакетного режима время этапов разбора — сумма по всем
+        файлам (и процессам), а скорость считается по общему времени.
+        """
+        # Пул процессов нужен только в пакетном режиме, не тянем его при старте
+        import multiprocessing
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        def cancelled():
+            return cancel_token is not None and cancel_token.is_set()
+
+        output_path = Path(output_path)
+        results = {
+            'dialogues': [],
+            'characters_found': {},
+            'total_replicas': 0,
+            'files': 0,
+            'failed': list(failed),
+            'mapping_pack': None,
+            'success': False,
+            'cancelled': False
+        }
+
+        if not files:
             return results
+        workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+        profile = ExtractionProfile() if self.profiling else None
+        stats = DialogueStats() if self.analytics else None
+
+        # Этап 1: персонажи со всей игры (более поздние файлы перекрывают ранние)
+        if progress_callback:
+            progress_callback(0.0, f"🔍 Поиск персонажей в {len(files)} файлах...")
+        scan_start = time.perf_counter()
+        found_per_file = [None] * len(files)
+        defs_keys = []
+        if self.cache is not None:
+            for i, path in enumerate(files):
+                key = self.cache.make_key(self._source_digest(path), PARSER_VERSION, "characters",
+                                          self.use_lexer, self.encoding)
+                defs_keys.append(key)
+                found_per_file[i] = self.cache.get_characters(key)
+        missing = [i for i, found in enumerate(found_per_file) if found is None]
+        if workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                scanned = pool.map(_scan_characters_worker, [files[i] for i in missing],
+                                   chunksize=max(1, len(missing) // (workers * 4)))
+                for i, found in zip(missing, scanned):
+                    found_per_file[i] = found
+        else:
+            for i in missing:
+                found_per_file[i] = self.scan_characters(files[i])
+        if self.cache is not None:
+            for i in missing:
+                self.cache.put_characters(defs_keys[i], found_per_file[i])
+            # Рабочие процессы прочитают свежий индекс и не станут заново хэшировать файлы
+            self.cache.save_index()
+
+        characters = {}
+        for found in found_per_file:
+            characters.update(found)
+        # Набор тегов выбирается до запуска пула: рабочие процессы получают его вместе с разборщиком
+        results['mapping_pack'] = self.select_mapping_pack(files)
+        if profile is not None:
+            profile.stages['characters'] += time.perf_counter() - scan_start
+
+        # Выборка меток: файлы, где нет ни одной нужной метки, дальше не читаются
+        selections = [None] * len(files)
+        if labels:
+            if progress_callback:
+                progress_callback(0.1, "🗺 Поиск меток...")
+            selections, missing = self._select_labels(files, labels, reachable)
+            results['labels'] = sorted(set().union(*(selection.names for selection in selections)))
+            results['menus'] = sum(len(selection.menus) for selection in selections)
+            results['missing_labels'] = missing
+            if not results['labels']:
+                results['error'] = f"Метки не найдены: {', '.join(missing)}"
+                return results
+        chosen = [i for i, selection in enumerate(selections) if selection is None or selection.names]
+
+        # Этап 2: реплики, каждый файл сначала во временную папку
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        work_dir = Path(tempfile.mkdtemp(prefix=".alice-", dir=output_path.parent))
+        targets = [work_dir / f"{i:06d}.txt" for i in range(len(files))]
+        part_path = _part_path(output_path)
 
-        # Сохранение результата
+        tasks = [(files[i], targets[i], names[i], selections[i]) for i in chosen]
+        # Файлы вне выборки меток считаются обработанными без реплик
+        outcomes = [{'success': True, 'total_replicas': 0, 'dialogues': [], 'skipped': True} for _ in files]
         try:
+            if cancelled():
+                raise ExtractionCancelled()
+            if workers > 1:
+                worker_cancel = multiprocessing.Event()
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                         initargs=(self, characters, with_names, worker_cancel)) as pool:
+                    futures = {pool.submit(_extract_file_worker, task): i for i, task in zip(chosen, tasks)}
+                    pending = set(futures)
+                    done = 0
+                    while pending:
+                        finished, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL,
+                                                 return_when=FIRST_COMPLETED)
+                        if cancelled():
+                            # Ещё не начатые файлы снимаем, начатые бросаются по флагу в рабочих процессах
+                            worker_cancel.set()
+                            for future in pending:
+                                future.cancel()
+                            raise ExtractionCancelled()
+                        for future in finished:
+                            outcomes[futures[future]] = future.result()
+                        done += len(finished)
+                        if progress_callback and finished:
+                            progress_callback(0.2 + done / len(tasks) * 0.7,
+                                              f"📖 Обработано файлов: {done}/{len(tasks)}")
+            else:
+                for done, (i, (path, target, name, selection)) in enumerate(zip(chosen, tasks), 1):
+                    outcomes[i] = self._extract_one(path, target, with_names, characters=dict(characters),
+                                                    cancel_token=cancel_token, source_name=name,
+                                                    selection=selection)
+                    if outcomes[i]['cancelled']:
+                        raise ExtractionCancelled()
+                    outcomes[i]['dialogues'] = outcomes[i]['dialogues'][:PREVIEW_SIZE]
+                    if progress_callback:
+                        progress_callback(0.2 + done / len(tasks) * 0.7,
+                                          f"📖 Обработано файлов: {done}/{len(tasks)}")
+
             if progress_callback:
                 progress_callback(0.9, "💾 Сохранение результата...")
-                
-            dialogues_output = "\n\n".join(dialogues)
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(dialogues_output)
-                
-            results['dialogues'] = dialogues
-            results['total_replicas'] = len(dialogues)
-            results['success'] = True
-            
+            writer = get_writer(self.output_format)
+            if cancelled():
+                raise ExtractionCancelled()
+            if merge:
+                merge_start = time.perf_counter()
+                writer.merge([target for target, outcome in zip(targets, outcomes)
+                              if outcome['success'] and outcome['total_replicas']], part_path)
+                os.replace(part_path, output_path)
+                if profile is not None:
+                    profile.stages['write'] += time.perf_counter() - merge_start
+            else:
+                for name, target, outcome in zip(names, targets, outcomes):
+                    if outcome['success'] and not outcome.get('skipped'):
+                        final = (output_path / name).with_suffix(writer.suffix)
+                        final.parent.mkdir(parents=True, exist_ok=True)
+                        os.replace(target, final)
+        except Exception as e:
+            results['cancelled'] = isinstance(e, ExtractionCancelled)
+            if not results['cancelled']:
+                results['error'] = f"{type(e).__name__}: {e}"
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            return results
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            if self.cache is not None:
+                self._maintain_cache()
+
+        for path, outcome in zip(files, outcomes):
+            if not outcome['success']:
+                results['failed'].append(str(path))
+                continue
+            results['total_replicas'] += outcome['total_replicas']
+            if profile is not None:
+                profile.merge(outcome.get('profile'))
+            if stats is not None:
+                stats.merge(outcome.get('stats'))
+            if len(results['dialogues']) < PREVIEW_SIZE:
+                results['dialogues'].extend(outcome['dialogues'][:PREVIEW_SIZE - len(results['dialogues'])])
+
+        results['characters_found'] = {**self.pack_mapping, **characters, **self.custom_mapping}
+        results['files'] = len(tasks)
+        results['success'] = len(results['failed']) < len(files) + len(failed)
+        if profile is not None:
+            results['profile'] = profile.to_dict()
+        if stats is not None:
+            results['stats'] = stats.to_dict()
+
+        if progress_callback:
+            progress_callback(1.0, "✅ Готово!")
+
+        return results
+
+    def extract(self, input_path: Path, output_path: Path, with_names: bool = True, merge: bool = True,
+                workers: Optional[int] = None, progress_callback=None,
+                cancel_token: Optional[threading.Event] = None, labels: Optional[List[str]] = None,
+                reachable: bool = False) -> Dict:
+        """Извлечение из файла, .rpa архива или папки — по тому, что передано"""
+        input_path = Path(input_path)
+        if input_path.is_dir() or input_path.suffix.lower() == '.rpa':
+            extract = self.extract_directory if input_path.is_dir() else self.extract_archive
+            return extract(input_path, output_path, with_names=with_names, merge=merge, workers=workers,
+                           progress_callback=progress_callback, cancel_token=cancel_token,
+                           labels=labels, reachable=reachable)
+        return self.extract_script(input_path, output_path, with_names=with_names,
+                                   progress_callback=progress_callback, cancel_token=cancel_token,
+                                   labels=labels, reachable=reachable)
+
+    def iter_game(self, input_path: Path, with_names: bool = True,
+                  cancel_token: Optional[threading.Event] = None) -> Iterator[Tuple[str, DialogueRecord]]:
+        """Реплики файла, .rpa архива или папки по порядку, без записи итогового файла.
+
+        Выдаёт пары (путь скрипта в игре, реплика). Персонажи и набор тегов
+        выбираются как в extract, файлы читаются по очереди в этом процессе
+        (через кэш разбора, если он есть). Нечитаемые файлы пропускаются;
+        в конце генератор возвращает {'files', 'failed', 'mapping_pack'}.
+        """
+        input_path = Path(input_path)
+        failed = []
+        if input_path.is_dir():
+            found, failed = self._game_scripts(input_path)
+            files, names = [source for _, source in found], [name for name, _ in found]
+        elif input_path.suffix.lower() == '.rpa':
+            files = self._archive_scripts(input_path)
+            names = [member.name for member in files]
+        else:
+            files, names = [input_path], [input_path.name]
+        pack_id = self.select_mapping_pack(files)
+        characters = {}
+        if len(files) > 1:
+            # Как в пакетном режиме: персонажи со всей игры, более поздние файлы перекрывают ранние
+            for path in files:
+                characters.update(self.scan_characters(path))
+        for path, name in zip(files, names):
+            try:
+                for record in self._iter_records(path, with_names, dict(characters)):
+                    if cancel_token is not None and cancel_token.is_set():
+                        raise ExtractionCancelled()
+                    yield name, record
+            except ExtractionCancelled:
+                raise
+            except Exception:
+                failed.append(str(path))
+        if self.cache is not None:
+            self._maintain_cache()
+        return {'files': len(files), 'failed': failed, 'mapping_pack': pack_id}
+
+    def index_game(self, input_path: Path, index_path: Optional[Path] = None, game: Optional[str] = None,
+                   with_names: bool = True, workers: Optional[int] = None, progress_callback=None,
+                   cancel_token: Optional[threading.Event] = None) -> Dict:
+        """Заносит реплики игры в поисковый указатель вместо записи итогового файла.
+
+        Реплики извлекаются во временную базу SQLite и одной транзакцией
+        заменяют прежние строки этой игры в указателе. По умолчанию игра
+        называется по папке (для папки game/ — по родительской).
+        """
+        input_path = Path(input_path)
+        index_path = Path(index_path or default_index_path())
+        game = game or _game_name(input_path)
+
+        def extraction_progress(value, text):
+            progress_callback(value * 0.9, text)
+
+        work_dir = Path(tempfile.mkdtemp(prefix=".alice-index-"))
+        output_format = self.output_format
+        self.output_format = "sqlite"
+        try:
+            results = self.extract(input_path, work_dir / "dialogues.sqlite", with_names,
+                                   progress_callback=extraction_progress if progress_callback else None,
+                                   workers=workers, cancel_token=cancel_token)
+            cancelled = cancel_token is not None and cancel_token.is_set()
+            if cancelled or not results['success']:
+                results['success'] = False
+                results['cancelled'] = results['cancelled'] or cancelled
+                return results
             if progress_callback:
-                progress_callback(1.0, "✅ Готово!")
-            
+                progress_callback(0.9, f"📇 Заносим «{game}» в указатель...")
+            try:
+                with SearchIndex(index_path) as index:
+                    index.replace_game(game, work_dir / "dialogues.sqlite")
+            except Exception:
+                results['success'] = False
+                return results
+        finally:
+            self.output_format = output_format
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        results['indexed'] = game
+        results['index_path'] = str(index_path)
+        if progress_callback:
+            progress_callback(1.0, "✅ Готово!")
+        return results
+
+    def compare_versions(self, old_path: Path, new_path: Path, output_path: Path, report_format: str = "text",
+                         with_names: bool = True, workers: Optional[int] = None, progress_callback=None,
+                         cancel_token: Optional[threading.Event] = None) -> Dict:
+        """Отчёт о добавленных, удалённых, изменённых и перенесённых репликах между версиями.
+
+        Обе версии (файл, .rpa архив или папка) извлекаются обычным путём —
+        с кэшем и пакетным режимом — во временные базы SQLite, после чего
+        реплики выравниваются dialogue_diff. Отчёт — text или json.
+        """
+        results = {
+            'dialogues': [],
+            'characters_found': {},
+            'total_replicas': 0,
+            'old_replicas': 0,
+            'changes': {},
+            'mapping_pack': None,
+            'success': False,
+            'cancelled': False
+        }
+        work_dir = Path(tempfile.mkdtemp(prefix=".alice-diff-"))
+        output_format = self.output_format
+        self.output_format = "sqlite"
+        versions = []
+        try:
+            for step, path in enumerate((old_path, new_path)):
+                def extraction_progress(value, text, step=step):
+                    progress_callback((step + value) * 0.45, text)
+
+                db_path = work_dir / f"{step}.sqlite"
+                extracted = self.extract(Path(path), db_path, with_names,
+                                         progress_callback=extraction_progress if progress_callback else None,
+                                         workers=workers, cancel_token=cancel_token)
+                cancelled = cancel_token is not None and cancel_token.is_set()
+                if cancelled or not extracted['success']:
+                    extracted['success'] = False
+                    extracted['cancelled'] = extracted['cancelled'] or cancelled
+                    return extracted
+                results['characters_found'].update(extracted['characters_found'])
+                results['mapping_pack'] = extracted.get('mapping_pack')
+                db = sqlite3.connect(db_path)
+                try:
+                    versions.append([dialogue_diff.DiffRecord(*row) for row in db.execute(
+                        "SELECT file, line, label, tag, name, text FROM dialogues ORDER BY id")])
+                finally:
+                    db.close()
+        finally:
+            self.output_format = output_format
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        if progress_callback:
+            progress_callback(0.9, "🔀 Сравниваем версии...")
+        old, new = versions
+        changes = dialogue_diff.diff_records(old, new)
+        output_path = Path(output_path)
+        part_path = _part_path(output_path)
+        try:
+            results['changes'] = dialogue_diff.write_report(changes, part_path, report_format, len(old), len(new))
+            os.replace(part_path, output_path)
         except Exception as e:
-            pass
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            results['error'] = f"{type(e).__name__}: {e}"
+            return results
+
+        results['old_replicas'] = len(old)
+        results['total_replicas'] = len(new)
+        results['dialogues'] = [f"{dialogue_diff.MARKS[change.kind]} {(change.new or change.old).format()}"
+                                for change in changes[:PREVIEW_SIZE]]
+        results['success'] = True
+        if progress_callback:
+            progress_callback(1.0, "✅ Готово!")
+        return results
+
+    def align_translation(self, game_dir: Path, language: str, output_path: Path, with_names: bool = True,
+                          include_untranslated: bool = True, progress_callback=None,
+                          cancel_token: Optional[threading.Event] = None) -> Dict:
+        """Оригинал и перевод из game/tl/<language>/ парами в output_path.
+
+        Пары сопоставляются по идентификатору перевода Ren'Py (см.
+        translation.align); формат — self.output_format. Непереведённые
+        реплики идут в конце с пустым переводом, если include_untranslated.
+        """
+        game_dir = Path(game_dir)
+        output_path = Path(output_path)
+        results = {
+            'dialogues': [],
+            'characters_found': {},
+            'total_replicas': 0,
+            'translated': 0,
+            'untranslated': 0,
+            'orphaned': 0,
+            'mapping_pack': None,
+            'success': False,
+            'cancelled': False
+        }
+        if not (game_dir / "tl" / language).is_dir():
+            return results
+
+        if progress_callback:
+            progress_callback(0.0, "🔍 Поиск персонажей...")
+        characters = {}
+        originals = translation.original_files(game_dir)
+        for path in originals:
+            characters.update(self.scan_characters(path))
+        results['mapping_pack'] = self.select_mapping_pack(originals)
+        mapping = {**self.pack_mapping, **characters, **self.custom_mapping}
+
+        def resolve(tag):
+            return mapping.get(tag, tag) if with_names else None
+
+        def counted(lines):
+            for line in lines:
+                if cancel_token is not None and cancel_token.is_set():
+                    raise ExtractionCancelled()
+                if not line.original:
+                    results['orphaned'] += 1
+                elif line.translated is None:
+                    results['untranslated'] += 1
+                else:
+                    results['translated'] += 1
+                if len(results['dialogues']) < PREVIEW_SIZE and line.translated is not None:
+                    results['dialogues'].append(f"{line.original} → {line.translated}")
+                yield line
+
+        if progress_callback:
+            progress_callback(0.2, f"🌐 Сопоставление с переводом «{language}»...")
+        part_path = _part_path(output_path)
+        try:
+            lines = translation.align(game_dir, language, self.encoding, include_untranslated, cancel_token)
+            results['total_replicas'] = translation.write_aligned(counted(lines), part_path, self.output_format,
+                                                                  resolve)
+            if cancel_token is not None and cancel_token.is_set():
+                raise ExtractionCancelled()
+            os.replace(part_path, output_path)
+        except Exception as e:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            results['cancelled'] = isinstance(e, ExtractionCancelled)
+            if not results['cancelled']:
+                results['error'] = f"{type(e).__name__}: {e}"
+            return results
 
+        results['characters_found'] = mapping
+        results['success'] = True
+        if progress_callback:
+            progress_callback(1.0, "✅ Готово!")
         return results
 
     def _should_skip_line(self, text: str) -> bool:
         """Проверяет, нужно ли пропустить строку"""
-        skip_patterns = [
-            r'\.(png|jpg|jpeg|mp3|ogg|wav)',
-            "persistent.", "MatrixColor", "mods/",
-            r'^show\s+', r'^hide\s+', r'^scene\s+',
-            r'^play\s+', r'^stop\s+', r'^queue\s+',
-            r'^with\s+', r'^pause\s+'
-        ]
-        text_lower = text.lower()
-        return any(re.search(pattern, text_lower, re.IGNORECASE) for pattern in skip_patterns)
+        return self.skip_rules.search(text) is not None
+
+
+def _part_path(output_path: Path) -> Path:
+    """Временный файл рядом с итоговым, свой у каждого пишущего потока.
+
+    Задания окна и службы — потоки одного процесса, и с общим именем
+    <вывод>.part два задания с одним выводом писали бы в один файл.
+    Файл не создаётся заранее (как в tempfile.mkstemp), чтобы итоговый
+    получил обычные права, а не 0600.
+    """
+    return output_path.with_name(f"{output_path.name}.{os.getpid()}-{threading.get_ident()}.part")
+
+
+def _output_target(input_path: Path, output_path: Path, merge: bool) -> Path:
+    """Куда писать результат: для отдельных файлов папки или архива путь сохранения становится папкой.
+
+    Окно и CLI предлагают путь файла (диалоги.txt); папкой становится
+    он же без расширения, а не папка с именем «диалоги.txt».
+    """
+    if not merge and (input_path.is_dir() or input_path.suffix.lower() == '.rpa'):
+        return output_path.with_suffix('')
+    return output_path
+
+
+def _same_or_inside(path: Path, target: Path) -> bool:
+    """path — это target (уже resolve) или файл внутри папки target"""
+    path = path.resolve()
+    return path == target or target in path.parents
+
+
+def _game_name(input_path: Path) -> str:
+    """Имя игры для указателя: папка game/ называется по родительской, файл — по имени без расширения"""
+    input_path = Path(input_path).resolve()
+    if input_path.is_dir():
+        return input_path.parent.name if input_path.name.lower() == "game" else input_path.name
+    return input_path.stem
+
+
+def _input_size(input_path: Union[Path, ArchiveMember], selection: Optional[LabelSelection] = None) -> int:
+    """Сколько байтов скрипта читает извлечение: весь файл или только диапазоны выбранных меток"""
+    if selection is not None and selection.ranges:
+        return sum(end - start for start, end, _ in selection.ranges)
+    if isinstance(input_path, ArchiveMember):
+        return input_path.length
+    try:
+        return Path(input_path).stat().st_size
+    except OSError:
+        return 0
+
+
+def _is_compiled(input_path: Union[Path, ArchiveMember]) -> bool:
+    name = input_path.name if isinstance(input_path, ArchiveMember) else str(input_path)
+    return name.lower().endswith(".rpyc")
+
+
+# Состояние рабочего процесса для пакетного режима
+_batch_parser = None
+_batch_characters = {}
+_batch_with_names = True
+_batch_cancel = None
+
+
+def _scan_characters_worker(path: Path) -> Dict[str, str]:
+    return RenPyParser().scan_characters(path)
+
+
+def _init_batch_worker(parser: "RenPyParser", characters: Dict[str, str], with_names: bool, cancel=None):
+    global _batch_parser, _batch_characters, _batch_with_names, _batch_cancel
+    # Парсер приходит копией со всеми настройками: теги, правила пропуска, кэш
+    _batch_parser = parser
+    _batch_characters = characters
+    _batch_with_names = with_names
+    _batch_cancel = cancel
+
+
+def _extract_file_worker(task) -> Dict:
+    path, target, name, selection = task
+    result = _batch_parser._extract_one(path, target, _batch_with_names, characters=dict(_batch_characters),
+                                        cancel_token=_batch_cancel, source_name=name, selection=selection)
+    # Обратно в основной процесс отдаём только начало, а не все реплики файла
+    result['dialogues'] = result['dialogues'][:PREVIEW_SIZE]
+    result['characters_found'] = {}
+    return result
+
+
+class ExtractionJob:
+    """Задание очереди окна: что и куда извлекать, снимок настроек парсера и флаг отмены"""
+
+    def __init__(self, job_id: int, input_path: Path, output_path: Path, with_names: bool, merge: bool,
+                 parser: RenPyParser, index_path: Optional[Path] = None, labels: Optional[List[str]] = None,
+                 reachable: bool = False):
+        self.job_id = job_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.with_names = with_names
+        self.merge = merge
+        # Копия парсера: изменения тегов и правил в окне не влияют на уже поставленные задания
+        self.parser = parser
+        # Если задан — реплики заносятся в поисковый указатель, а не в файл
+        self.index_path = index_path
+        # Только эти метки (и достижимые из них при reachable)
+        self.labels = labels
+        self.reachable = reachable
+        self.cancel_token = threading.Event()
+        self.future = None
+        self.finished = False
+
+    def target(self) -> Optional[Path]:
+        """Файл или папка, куда задание пишет результат; None — задание пишет в указатель"""
+        if self.index_path is not None:
+            return None
+        return _output_target(self.input_path, self.output_path, self.merge)
+
+    def run(self, progress_callback=None) -> Dict:
+        if self.index_path is not None:
+            return self.parser.index_game(self.input_path, self.index_path, with_names=self.with_names,
+                                          progress_callback=progress_callback, cancel_token=self.cancel_token)
+        return self.parser.extract(self.input_path, self.target(), with_names=self.with_names, merge=self.merge,
+                                   progress_callback=progress_callback, cancel_token=self.cancel_token,
+                                   labels=self.labels, reachable=self.reachable)
+
+
+class ResultViewer:
+    """Окно просмотра всего результата.
+
+    В Text лежат только реплики, которые помещаются на экран; полоса
+    прокрутки считает в репликах, а не в строках виджета, и при
+    прокрутке страницы файла подгружаются по мере надобности
+    (см. result_file). Поэтому результат на миллионы реплик
+    открывается сразу и листается без задержек.
+    """
+
+    def __init__(self, root, theme, path: Path, output_format: Optional[str] = None):
+        self.path = Path(path)
+        self.records = open_results(path, output_format)
+        self.closed = False
+        self.first = 0
+        colors = theme.COLORS
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"📜 {Path(path).name} — {len(self.records)} реплик")
+        self.window.geometry("900x650")
+        self.window.configure(bg=colors['bg_dark'])
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        controls = tk.Frame(self.window, bg=colors['bg_medium'])
+        controls.pack(fill='x', padx=10, pady=10)
+        tk.Label(controls, text="№ реплики:", bg=colors['bg_medium'], fg=colors['text_cream'],
+                 font=('Arial', 10)).pack(side='left')
+        self.number_entry = tk.Entry(controls, bg=colors['bg_light'], fg=colors['text_cream'], font=('Arial', 10),
+                                     width=10, insertbackground=colors['text_cream'])
+        self.number_entry.pack(side='left', padx=(5, 5))
+        self.number_entry.bind('<Return>', lambda event: self.go_to_number())
+        ttk.Button(controls, text="➡ ПЕРЕЙТИ", command=self.go_to_number,
+                   style='Accent.TButton').pack(side='left', padx=(0, 20))
+        tk.Label(controls, text="Персонаж:", bg=colors['bg_medium'], fg=colors['text_cream'],
+                 font=('Arial', 10)).pack(side='left')
+        self.speaker_entry = tk.Entry(controls, bg=colors['bg_light'], fg=colors['text_cream'], font=('Arial', 10),
+                                      width=20, insertbackground=colors['text_cream'])
+        self.speaker_entry.pack(side='left', padx=(5, 5))
+        self.speaker_entry.bind('<Return>', lambda event: self.find_speaker())
+        ttk.Button(controls, text="🎭 СЛЕДУЮЩАЯ РЕПЛИКА", command=self.find_speaker,
+                   style='Accent.TButton').pack(side='left')
+
+        self.status_label = tk.Label(self.window, bg=colors['bg_dark'], fg=colors['text_warm'], font=('Arial', 9))
+        self.status_label.pack(fill='x', padx=10)
+
+        body = tk.Frame(self.window, bg=colors['bg_dark'])
+        body.pack(fill='both', expand=True, padx=10, pady=10)
+        self.font = tkfont.Font(family='Arial', size=10)
+        self.text = tk.Text(body, bg=colors['bg_light'], fg=colors['text_cream'], font=self.font,
+                            wrap=tk.WORD, state='disabled', cursor='arrow')
+        self.text.tag_configure('number', foreground=colors['accent_amber'])
+        self.text.tag_configure('found', background=colors['accent_burnt'])
+        self.scrollbar = ttk.Scrollbar(body, orient='vertical', command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.text.pack(side='left', fill='both', expand=True)
+
+        for widget in (self.text, self.scrollbar):
+            widget.bind('<MouseWheel>', self.on_wheel)
+            widget.bind('<Button-4>', lambda event: self.scroll_by(-3))
+            widget.bind('<Button-5>', lambda event: self.scroll_by(3))
+        self.window.bind('<Prior>', lambda event: self.scroll_by(-self.visible_count()))
+        self.window.bind('<Next>', lambda event: self.scroll_by(self.visible_count()))
+        self.window.bind('<Home>', lambda event: self.show(0))
+        self.window.bind('<End>', lambda event: self.show(len(self.records)))
+        self.text.bind('<Configure>', lambda event: self.render())
+        self.render()
+
+    def visible_count(self) -> int:
+        """Сколько реплик помещается на экран (длинные переносятся, поэтому это верхняя граница)"""
+        height = self.text.winfo_height()
+        if height <= 1:
+            height = int(self.text.cget('height')) * self.font.metrics('linespace')
+        return max(1, height // self.font.metrics('linespace'))
+
+    def show(self, first: int, highlight: Optional[int] = None):
+        total = len(self.records)
+        self.first = max(0, min(first, total - self.visible_count() // 2))
+        self.render(highlight)
+
+    def scroll_by(self, records: int):
+        self.show(self.first + records)
+
+    def on_scroll(self, *args):
+        """Команды полосы прокрутки: moveto доля, scroll n units|pages"""
+        if args[0] == 'moveto':
+            self.show(int(float(args[1]) * len(self.records)))
+        elif args[0] == 'scroll':
+            step = self.visible_count() if args[2] == 'pages' else 1
+            self.scroll_by(int(args[1]) * step)
+
+    def on_wheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+        return 'break'
+
+    def render(self, highlight: Optional[int] = None):
+        total = len(self.records)
+        rows = self.records.records(self.first, self.visible_count())
+        self.text.config(state='normal')
+        self.text.delete('1.0', tk.END)
+        for row in rows:
+            self.text.insert(tk.END, f"{row.number + 1:>9}  ", 'number')
+            self.text.insert(tk.END, row.format() + "\n", 'found' if row.number == highlight else ())
+        self.text.config(state='disabled')
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + len(rows)) / total)
+            self.status_label.config(text=f"Реплики {self.first + 1}–{self.first + len(rows)} из {total}")
+        else:
+            self.scrollbar.set(0, 1)
+            self.status_label.config(text="В летописи нет реплик")
+
+    def go_to_number(self):
+        try:
+            number = int(self.number_entry.get().strip()) - 1
+        except ValueError:
+            self.status_label.config(text="Введите номер реплики")
+            return
+        number = max(0, min(number, len(self.records) - 1))
+        self.show(number, highlight=number)
+
+    def find_speaker(self):
+        """Следующая реплика персонажа после верхней на экране; дойдя до конца, поиск идёт с начала"""
+        speaker = self.speaker_entry.get().strip()
+        if not speaker:
+            return
+        found = self.records.find_speaker(speaker, self.first)
+        if found is None:
+            found = self.records.find_speaker(speaker, -1)
+        if found is None:
+            self.status_label.config(text=f"Реплик персонажа «{speaker}» нет")
+            return
+        self.show(found, highlight=found)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.records.close()
+        self.window.destroy()
 
 
 class ModernRenPyParserGUI:
     def __init__(self):
+        _load_tkinter()
+        from concurrent.futures import ThreadPoolExecutor
+
         self.parser = RenPyParser()
+        # Сообщения о прогрессе и результаты из потоков заданий
+        self.progress_queue = queue.Queue()
+        self.job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+        self.jobs = {}
+        self.next_job_id = 1
+        # Открытые окна просмотра: они держат файл результата открытым
+        self.viewers = []
+        self._search_index = None
+        self.draining = False
         self.theme = AliceDvacheskayaTheme()
         self.setup_gui()
         
@@ -303,6 +1709,11 @@ class ModernRenPyParserGUI:
                                           style='Accent.TButton')
         self.browse_input_btn.pack(side='right')
         
+        self.browse_dir_btn = ttk.Button(input_subframe, text="📁 ПАПКА", 
+                                        command=self.browse_input_dir,
+                                        style='Accent.TButton')
+        self.browse_dir_btn.pack(side='right', padx=(0, 10))
+        
         # Выходной файл
         output_frame = tk.Frame(file_frame, bg=self.theme.COLORS['bg_medium'])
         output_frame.pack(fill='x', pady=8)
@@ -339,6 +1750,96 @@ class ModernRenPyParserGUI:
                                          font=('Arial', 10))
         self.names_check.pack(anchor='w', padx=10, pady=5)
         
+        self.merge_var = tk.BooleanVar(value=True)
+        self.merge_check = tk.Checkbutton(settings_frame, text="Для папки: собрать всё в один файл (иначе — .txt на каждый скрипт)",
+                                         variable=self.merge_var,
+                                         bg=self.theme.COLORS['bg_medium'],
+                                         fg=self.theme.COLORS['text_cream'],
+                                         selectcolor=self.theme.COLORS['accent_rust'],
+                                         activebackground=self.theme.COLORS['bg_medium'],
+                                         activeforeground=self.theme.COLORS['text_cream'],
+                                         font=('Arial', 10))
+        self.merge_check.pack(anchor='w', padx=10, pady=5)
+        
+        self.cache_var = tk.BooleanVar(value=True)
+        self.cache_check = tk.Checkbutton(settings_frame, text="Запоминать разобранные скрипты (повторный запуск читает только изменённые)",
+                                         variable=self.cache_var,
+                                         bg=self.theme.COLORS['bg_medium'],
+                                         fg=self.theme.COLORS['text_cream'],
+                                         selectcolor=self.theme.COLORS['accent_rust'],
+                                         activebackground=self.theme.COLORS['bg_medium'],
+                                         activeforeground=self.theme.COLORS['text_cream'],
+                                         font=('Arial', 10))
+        self.cache_check.pack(anchor='w', padx=10, pady=5)
+        
+        self.profile_var = tk.BooleanVar(value=False)
+        self.profile_check = tk.Checkbutton(settings_frame, text="Замерять этапы и считать пропущенные строки",
+                                         variable=self.profile_var,
+                                         bg=self.theme.COLORS['bg_medium'],
+                                         fg=self.theme.COLORS['text_cream'],
+                                         selectcolor=self.theme.COLORS['accent_rust'],
+                                         activebackground=self.theme.COLORS['bg_medium'],
+                                         activeforeground=self.theme.COLORS['text_cream'],
+                                         font=('Arial', 10))
+        self.profile_check.pack(anchor='w', padx=10, pady=5)
+        
+        self.stats_var = tk.BooleanVar(value=False)
+        self.stats_check = tk.Checkbutton(settings_frame, text="Считать строки и слова персонажей (по файлам и меткам)",
+                                       variable=self.stats_var,
+                                       bg=self.theme.COLORS['bg_medium'],
+                                       fg=self.theme.COLORS['text_cream'],
+                                       selectcolor=self.theme.COLORS['accent_rust'],
+                                       activebackground=self.theme.COLORS['bg_medium'],
+                                       activeforeground=self.theme.COLORS['text_cream'],
+                                       font=('Arial', 10))
+        self.stats_check.pack(anchor='w', padx=10, pady=5)
+        
+        format_frame = tk.Frame(settings_frame, bg=self.theme.COLORS['bg_medium'])
+        format_frame.pack(anchor='w', padx=10, pady=5)
+        
+        tk.Label(format_frame, text="Формат летописи:",
+                bg=self.theme.COLORS['bg_medium'], fg=self.theme.COLORS['text_cream'],
+                font=('Arial', 10)).pack(side='left')
+        
+        self.format_var = tk.StringVar(value="text")
+        self.format_combo = ttk.Combobox(format_frame, textvariable=self.format_var,
+                                         values=list(WRITERS), state='readonly', width=10)
+        self.format_combo.pack(side='left', padx=(10, 0))
+        
+        tk.Label(format_frame, text="Набор тегов:",
+                bg=self.theme.COLORS['bg_medium'], fg=self.theme.COLORS['text_cream'],
+                font=('Arial', 10)).pack(side='left', padx=(20, 0))
+        
+        # Показываем названия, а разборщику передаём id; сами наборы читаются только при выборе
+        self.pack_choices = {"определить по игре": "auto", "без набора": None,
+                             **{info.name: pack_id for pack_id, info in mapping_packs.available().items()}}
+        self.pack_var = tk.StringVar(value="определить по игре")
+        self.pack_combo = ttk.Combobox(format_frame, textvariable=self.pack_var,
+                                       values=list(self.pack_choices), state='readonly', width=22)
+        self.pack_combo.pack(side='left', padx=(10, 0))
+        
+        labels_frame = tk.Frame(settings_frame, bg=self.theme.COLORS['bg_medium'])
+        labels_frame.pack(fill='x', padx=10, pady=5)
+        
+        tk.Label(labels_frame, text="Только метки (через запятую):",
+                bg=self.theme.COLORS['bg_medium'], fg=self.theme.COLORS['text_cream'],
+                font=('Arial', 10)).pack(side='left')
+        
+        self.labels_entry = tk.Entry(labels_frame, bg=self.theme.COLORS['bg_light'],
+                                    fg=self.theme.COLORS['text_cream'], font=('Arial', 10),
+                                    width=30, insertbackground=self.theme.COLORS['text_cream'])
+        self.labels_entry.pack(side='left', fill='x', expand=True, padx=(10, 10))
+        
+        self.reachable_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(labels_frame, text="и всё, что из них достижимо",
+                      variable=self.reachable_var,
+                      bg=self.theme.COLORS['bg_medium'],
+                      fg=self.theme.COLORS['text_cream'],
+                      selectcolor=self.theme.COLORS['accent_rust'],
+                      activebackground=self.theme.COLORS['bg_medium'],
+                      activeforeground=self.theme.COLORS['text_cream'],
+                      font=('Arial', 10)).pack(side='left')
+        
         # Секция тегов
         tags_frame = ttk.LabelFrame(main_frame, text=" 🎭 МАСКИ ПЕРСОНАЖЕЙ ", padding=15)
         tags_frame.pack(fill='x', pady=10)
@@ -381,6 +1882,9 @@ class ModernRenPyParserGUI:
         ttk.Button(tags_buttons_frame, text="📂 Загрузить теги", 
                   command=self.load_tags, style='Accent.TButton').pack(side='left')
         
+        ttk.Button(tags_buttons_frame, text="🚫 Правила пропуска", 
+                  command=self.load_skip_rules, style='Accent.TButton').pack(side='left', padx=(10, 0))
+        
         # Главная кнопка
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill='x', pady=20)
@@ -389,7 +1893,64 @@ class ModernRenPyParserGUI:
                                     command=self.run_parser,
                                     style='Accent.TButton')
         self.run_button.config(style='Large.TButton')
-        self.run_button.pack(pady=10)
+        self.run_button.pack(side='left', expand=True, pady=10)
+        
+        self.index_button = ttk.Button(button_frame, text="📇 В УКАЗАТЕЛЬ",
+                                      command=lambda: self.run_parser(index=True),
+                                      style='Accent.TButton')
+        self.index_button.pack(side='left', pady=10)
+        
+        # Очередь заданий
+        jobs_frame = ttk.LabelFrame(main_frame, text=" ⏳ ОЧЕРЕДЬ ЗАКЛИНАНИЙ ", padding=10)
+        jobs_frame.pack(fill='x', pady=5)
+        
+        self.jobs_tree = ttk.Treeview(jobs_frame, columns=('input', 'status'), show='headings', height=4)
+        self.jobs_tree.heading('input', text="Свиток")
+        self.jobs_tree.heading('status', text="Состояние")
+        self.jobs_tree.column('input', width=450)
+        self.jobs_tree.column('status', width=400)
+        self.jobs_tree.pack(side='left', fill='x', expand=True)
+        
+        jobs_buttons_frame = tk.Frame(jobs_frame, bg=self.theme.COLORS['bg_medium'])
+        jobs_buttons_frame.pack(side='right', fill='y', padx=(10, 0))
+        
+        ttk.Button(jobs_buttons_frame, text="⛔ Отменить",
+                  command=self.cancel_selected_jobs, style='Accent.TButton').pack(fill='x', pady=(0, 5))
+        
+        ttk.Button(jobs_buttons_frame, text="🧹 Убрать готовые",
+                  command=self.clear_finished_jobs, style='Accent.TButton').pack(fill='x')
+        
+        # Поиск по указателю
+        search_frame = ttk.LabelFrame(main_frame, text=" 🔎 ПОИСК ПО ЛЕТОПИСЯМ ", padding=10)
+        search_frame.pack(fill='x', pady=5)
+        
+        search_input_frame = tk.Frame(search_frame, bg=self.theme.COLORS['bg_medium'])
+        search_input_frame.pack(fill='x')
+        
+        self.search_entry = tk.Entry(search_input_frame, bg=self.theme.COLORS['bg_light'],
+                                    fg=self.theme.COLORS['text_cream'], font=('Arial', 10),
+                                    width=50, insertbackground=self.theme.COLORS['text_cream'])
+        self.search_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        self.search_entry.bind('<Return>', lambda event: self.search_dialogues())
+        
+        self.search_game_var = tk.StringVar(value=ALL_GAMES)
+        self.search_game_combo = ttk.Combobox(search_input_frame, textvariable=self.search_game_var,
+                                              values=[ALL_GAMES], state='readonly', width=20,
+                                              postcommand=self.refresh_search_games)
+        self.search_game_combo.pack(side='left', padx=(0, 10))
+        
+        ttk.Button(search_input_frame, text="🔍 НАЙТИ",
+                  command=self.search_dialogues, style='Accent.TButton').pack(side='left')
+        
+        self.search_tree = ttk.Treeview(search_frame, columns=('place', 'speaker', 'text'),
+                                        show='headings', height=5)
+        self.search_tree.heading('place', text="Где")
+        self.search_tree.heading('speaker', text="Кто")
+        self.search_tree.heading('text', text="Реплика")
+        self.search_tree.column('place', width=220)
+        self.search_tree.column('speaker', width=120)
+        self.search_tree.column('text', width=500)
+        self.search_tree.pack(fill='x', pady=(5, 0))
         
         # Прогресс бар
         progress_frame = ttk.Frame(main_frame)
@@ -409,6 +1970,17 @@ class ModernRenPyParserGUI:
         results_frame = ttk.LabelFrame(main_frame, text=" 📖 ЛЕТОПИСЬ РЕЗУЛЬТАТОВ ", padding=15)
         results_frame.pack(fill='both', expand=True, pady=10)
         
+        # Весь результат открывается в отдельном окне, здесь — только начало
+        self.viewer_btn = ttk.Button(results_frame, text="📜 ЧИТАТЬ ВСЮ ЛЕТОПИСЬ",
+                                     command=self.open_viewer, style='Accent.TButton', state='disabled')
+        self.viewer_btn.pack(anchor='e', padx=5)
+        self.viewed_result = None
+        
+        self.stats_btn = ttk.Button(results_frame, text="📊 СОХРАНИТЬ СТАТИСТИКУ",
+                                    command=self.save_stats, state='disabled')
+        self.stats_btn.pack(anchor='e', padx=5, pady=(5, 0))
+        self.last_stats = None
+        
         self.result_text = scrolledtext.ScrolledText(results_frame,
                                                     bg=self.theme.COLORS['bg_light'],
                                                     fg=self.theme.COLORS['text_cream'],
@@ -424,9 +1996,11 @@ class ModernRenPyParserGUI:
     def browse_input_file(self):
         """Обзор входного файла"""
         filename = filedialog.askopenfilename(
-            title="Выберите свиток истории (.rpy файл)",
+            title="Выберите свиток истории (.rpy, .rpyc или .rpa архив)",
             filetypes=[
-                ("Ren'Py files", "*.rpy"),
+                ("Ren'Py files", "*.rpy *.rpyc *.rpa"),
+                ("Ren'Py scripts", "*.rpy *.rpyc"),
+                ("Ren'Py archives", "*.rpa"),
                 ("All files", "*.*")
             ]
         )
@@ -434,16 +2008,26 @@ class ModernRenPyParserGUI:
             self.input_entry.delete(0, tk.END)
             self.input_entry.insert(0, filename)
             
+    def browse_input_dir(self):
+        """Обзор папки с игрой или модом"""
+        dirname = filedialog.askdirectory(title="Выберите папку с игрой (например, game/)")
+        if dirname:
+            self.input_entry.delete(0, tk.END)
+            self.input_entry.insert(0, dirname)
+            
     def browse_output_file(self):
         """Обзор выходного файла"""
         filename = filedialog.asksaveasfilename(
             title="Сохранить летопись как...",
-            defaultextension=".txt",
+            defaultextension=get_writer(self.format_var.get()).suffix,
             filetypes=[
                 ("Text files", "*.txt"),
+                ("JSON Lines", "*.jsonl"),
+                ("CSV", "*.csv"),
+                ("SQLite", "*.sqlite"),
                 ("All files", "*.*")
             ],
-            initialfile="диалоги.txt"
+            initialfile="диалоги" + get_writer(self.format_var.get()).suffix
         )
         if filename:
             self.output_entry.delete(0, tk.END)
@@ -482,14 +2066,118 @@ class ModernRenPyParserGUI:
         if filename and self.parser.load_custom_mapping(Path(filename)):
             messagebox.showinfo("📂 Коллекция загружена", "Маски готовы к использованию")
             
-    def update_progress(self, value, text):
-        """Обновление прогресса"""
-        self.progress_var.set(value * 100)
-        self.progress_label.config(text=text)
-        self.root.update_idletasks()
+    def load_skip_rules(self):
+        """Загрузка правил пропуска строк из файла"""
+        filename = filedialog.askopenfilename(
+            title="Загрузить правила пропуска...",
+            filetypes=[("JSON files", "*.json")]
+        )
+        if filename:
+            if self.parser.load_skip_rules(Path(filename)):
+                rules = self.parser.skip_rules
+                messagebox.showinfo("🚫 Правила загружены",
+                                    f"Подстрок: {len(rules.contains)}, команд: {len(rules.prefixes)}")
+            else:
+                messagebox.showwarning("💫 Внимание!", "Не удалось прочитать правила, используются стандартные")
+            
+    def update_progress(self, job_id, value, text):
+        """Прогресс из потока задания: только кладём в очередь, виджеты трогает главный поток"""
+        self.progress_queue.put(('progress', job_id, value, text))
+
+    def drain_progress(self):
+        """Забирает накопившиеся сообщения из очереди в главном потоке Tk"""
+        latest = {}
+        finished = []
+        while True:
+            try:
+                event = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'done':
+                finished.append(event[1:])
+            else:
+                latest[event[1]] = event
+        # Из пачки сообщений каждого задания показываем только последнее
+        for _, job_id, value, text in latest.values():
+            job = self.jobs.get(job_id)
+            if job is None or job.finished:
+                continue
+            status = "⏹ Отмена..." if job.cancel_token.is_set() else f"{value * 100:3.0f}% {text}"
+            self.jobs_tree.set(job_id, 'status', status)
+            self.progress_var.set(value * 100)
+            self.progress_label.config(text=f"#{job_id}: {text}")
+        for job_id, result in finished:
+            job = self.jobs[job_id]
+            job.finished = True
+            if result.get('cancelled'):
+                self.jobs_tree.set(job_id, 'status', "⛔ Отменено")
+            elif result['success']:
+                self.jobs_tree.set(job_id, 'status', f"✅ Реплик: {result['total_replicas']}")
+            else:
+                self.jobs_tree.set(job_id, 'status', "💫 Ошибка")
+            self.show_results(result, job)
+        if any(not job.finished for job in self.jobs.values()):
+            self.root.after(PROGRESS_POLL_MS, self.drain_progress)
+        else:
+            self.draining = False
+            self.progress_label.config(text="Готов к великой алхимии...")
+
+    def cancel_selected_jobs(self):
+        """Отмена выбранных заданий: ещё не начатые снимаются сразу, идущие — при ближайшей проверке"""
+        for item in self.jobs_tree.selection():
+            job = self.jobs.get(int(item))
+            if job is None or job.finished:
+                continue
+            job.cancel_token.set()
+            if job.future.cancel():
+                job.finished = True
+                self.jobs_tree.set(item, 'status', "⛔ Отменено")
+            else:
+                self.jobs_tree.set(item, 'status', "⏹ Отмена...")
+
+    def clear_finished_jobs(self):
+        for job_id, job in list(self.jobs.items()):
+            if job.finished:
+                self.jobs_tree.delete(job_id)
+                del self.jobs[job_id]
         
-    def run_parser(self):
-        """Запуск парсера"""
+    def search_index(self) -> Optional[SearchIndex]:
+        """Указатель для поиска из окна; открывается при первом обращении"""
+        if self._search_index is None:
+            if not default_index_path().exists():
+                return None
+            self._search_index = SearchIndex(default_index_path())
+        return self._search_index
+
+    def refresh_search_games(self):
+        index = self.search_index()
+        games = list(index.games()) if index is not None else []
+        self.search_game_combo.config(values=[ALL_GAMES] + games)
+
+    def search_dialogues(self):
+        """Поиск по указателю: лучшие совпадения с местом в скриптах"""
+        query = self.search_entry.get().strip()
+        self.search_tree.delete(*self.search_tree.get_children())
+        if not query:
+            return
+        index = self.search_index()
+        if index is None:
+            messagebox.showinfo("🔎 Указатель пуст", "Сначала занесите игру в указатель кнопкой «В УКАЗАТЕЛЬ»")
+            return
+        game = self.search_game_var.get()
+        started = time.perf_counter()
+        try:
+            hits = index.search(query, game=None if game == ALL_GAMES else game, limit=SEARCH_LIMIT)
+        except Exception as e:
+            messagebox.showwarning("💫 Внимание!", f"Не удалось выполнить поиск:\n{e}")
+            return
+        for i, hit in enumerate(hits):
+            self.search_tree.insert('', tk.END, iid=i, values=(hit.location(), hit.name or hit.tag or "", hit.snippet))
+        elapsed = (time.perf_counter() - started) * 1000
+        self.progress_label.config(text=f"🔎 Найдено: {len(hits)} за {elapsed:.0f} мс")
+        
+    def run_parser(self, index: bool = False):
+        """Запуск парсера; index=True — занести реплики в поисковый указатель, а не в файл"""
         input_file = self.input_entry.get().strip()
         output_file = self.output_entry.get().strip()
         
@@ -497,7 +2185,7 @@ class ModernRenPyParserGUI:
             messagebox.showerror("🔮 Ошибка", "Выберите свиток истории (.rpy файл)!")
             return
             
-        if not output_file:
+        if not output_file and not index:
             messagebox.showerror("🔮 Ошибка", "Укажите путь для сохранения летописи!")
             return
             
@@ -506,37 +2194,89 @@ class ModernRenPyParserGUI:
             messagebox.showerror("🔮 Свиток не найден", f"Файл не существует:\n{input_file}")
             return
             
-        # Блокируем кнопку на время обработки
-        self.run_button.config(state='disabled')
-        self.result_text.config(state='normal')
-        self.result_text.delete('1.0', tk.END)
-        self.result_text.insert('1.0', "🕯️ Зажигаю свечи алхимии...\n\n")
-        self.root.update_idletasks()
-        
-        def parse_wrapper():
-            result = self.parser.extract_script(
-                Path(input_file), 
-                Path(output_file),
-                with_names=self.names_var.get(),
-                progress_callback=self.update_progress
-            )
-            
-            # Возвращаемся в основной поток для обновления UI
-            self.root.after(0, lambda: self.show_results(result))
+        if self.cache_var.get():
+            if self.parser.cache is None:
+                self.parser.cache = ExtractionCache(default_cache_dir())
+        else:
+            self.parser.cache = None
             
-        # Запускаем в отдельном потоке
-        thread = threading.Thread(target=parse_wrapper)
-        thread.daemon = True
-        thread.start()
+        # Настройки читаем здесь: переменные Tk нельзя трогать из другого потока
+        self.parser.output_format = self.format_var.get()
+        self.parser.profiling = self.profile_var.get()
+        self.parser.analytics = self.stats_var.get()
+        self.parser.mapping_pack = self.pack_choices[self.pack_var.get()]
+        job = ExtractionJob(self.next_job_id, Path(input_file), Path(output_file),
+                            self.names_var.get(), self.merge_var.get(), copy.deepcopy(self.parser),
+                            index_path=default_index_path() if index else None,
+                            labels=[label.strip() for label in self.labels_entry.get().split(',') if label.strip()],
+                            reachable=self.reachable_var.get())
+        target = job.target()
+        if target is not None:
+            # Два задания с одним выводом затёрли бы результат друг друга
+            target = target.resolve()
+            for other in self.jobs.values():
+                if not other.finished and other.target() is not None and other.target().resolve() == target:
+                    messagebox.showerror("🔮 Летопись занята",
+                                         f"В {target} уже пишет заклинание #{other.job_id}.\n"
+                                         f"Дождитесь его или укажите другой путь сохранения.")
+                    return
+            # Окно просмотра держит файл открытым (и отображённым в память), а на Windows
+            # открытый файл нельзя заменить — задание не смогло бы записать результат
+            for viewer in self.viewers:
+                if _same_or_inside(viewer.path, target):
+                    viewer.close()
+            self.viewers = [viewer for viewer in self.viewers if not viewer.closed]
+        self.next_job_id += 1
+        self.jobs[job.job_id] = job
+        self.jobs_tree.insert('', tk.END, iid=job.job_id, values=(input_file, "⏳ В очереди"))
+
+        def run_job():
+            try:
+                result = job.run(lambda value, text: self.update_progress(job.job_id, value, text))
+            except Exception:
+                result = {'success': False}
+            # Результат уходит в главный поток через ту же очередь
+            self.progress_queue.put(('done', job.job_id, result))
+
+        # Задания выполняются ограниченным пулом потоков, окно опрашивает очередь сообщений
+        job.future = self.job_pool.submit(run_job)
+        if not self.draining:
+            self.draining = True
+            self.root.after(PROGRESS_POLL_MS, self.drain_progress)
         
-    def show_results(self, result: Dict):
+    def show_results(self, result: Dict, job: ExtractionJob):
         """Показ результатов"""
-        self.run_button.config(state='normal')
+        self.result_text.config(state='normal')
         self.result_text.delete('1.0', tk.END)
+
+        if result.get('cancelled'):
+            self.result_text.insert('1.0', f"⛔ Заклинание #{job.job_id} отменено, летопись не записана.\n")
+            self.result_text.config(state='disabled')
+            return
+        
+        self.viewed_result = None
+        if result['success'] and 'indexed' not in result:
+            output_path = Path(job.output_path)
+            if output_path.is_file():
+                self.viewed_result = (output_path, job.parser.output_format)
+        self.viewer_btn.config(state='normal' if self.viewed_result else 'disabled')
+        self.last_stats = result.get('stats') if result['success'] else None
+        self.stats_btn.config(state='normal' if self.last_stats else 'disabled')
         
         if result['success']:
             result_display = "✨ АЛХИМИЯ СОВЕРШЕНА! ✨\n\n"
-            result_display += f"📖 Извлечено реплик: {result['total_replicas']}\n\n"
+            result_display += f"📖 Извлечено реплик: {result['total_replicas']}\n"
+            if 'labels' in result:
+                result_display += f"🗺 Меток: {len(result['labels'])}, меню: {result.get('menus', 0)}\n"
+                for label in result['missing_labels'][:5]:
+                    result_display += f"   ⚠ Метка не найдена: {label}\n"
+            if 'files' in result:
+                result_display += f"📚 Обработано свитков: {result['files']}\n"
+                for failed in result['failed'][:5]:
+                    result_display += f"   ⚠ Не удалось прочитать: {failed}\n"
+            if result.get('mapping_pack'):
+                result_display += f"🧩 Набор тегов: {mapping_packs.available()[result['mapping_pack']].name}\n"
+            result_display += "\n"
             result_display += "🎭 Распознанные лики:\n"
             
             for tag, name in list(result['characters_found'].items())[:10]:
@@ -545,23 +2285,34 @@ class ModernRenPyParserGUI:
             if len(result['characters_found']) > 10:
                 result_display += f"   ... и ещё {len(result['characters_found']) - 10} персонажей\n"
                 
-            result_display += f"\n💾 Летопись сохранена: {self.output_entry.get()}\n\n"
+            if 'indexed' in result:
+                saved_to = f"поисковый указатель, игра «{result['indexed']}»"
+            else:
+                saved_to = job.output_path
+            result_display += f"\n💾 Летопись сохранена: {saved_to}\n\n"
             
             if result['dialogues']:
                 result_display += "📜 Первые строки летописи:\n\n"
                 for i, dialogue in enumerate(result['dialogues'][:5], 1):
                     result_display += f"{i}. {dialogue}\n\n"
                     
+            if 'stats' in result:
+                result_display += self.format_stats(result['stats'])
+            if 'profile' in result:
+                result_display += self.format_profile(result['profile'])
+                
             self.result_text.insert('1.0', result_display)
             
             # Показываем уведомление об успехе
             messagebox.showinfo("🎉 АЛХИМИЯ УСПЕШНА!", 
                               f"Диалоги успешно извлечены!\n\n"
                               f"Извлечено реплик: {result['total_replicas']}\n"
-                              f"Сохранено в: {self.output_entry.get()}")
+                              f"Сохранено в: {saved_to}")
             
         else:
             error_text = "💫 Заклинание не сработало...\n\n"
+            if result.get('error'):
+                error_text += f"{result['error']}\n\n"
             error_text += "Возможные причины:\n"
             error_text += "• Свиток повреждён или запечатан\n"
             error_text += "• Это не настоящий свиток Ren'Py\n"
@@ -571,15 +2322,298 @@ class ModernRenPyParserGUI:
             
         self.result_text.config(state='disabled')
         
+    def open_viewer(self):
+        """Весь последний результат в окне просмотра"""
+        if self.viewed_result is None:
+            return
+        path, output_format = self.viewed_result
+        for job in self.jobs.values():
+            if not job.finished and job.target() is not None and _same_or_inside(path, job.target().resolve()):
+                messagebox.showinfo("⏳ Летопись переписывается",
+                                    f"В {path} сейчас пишет заклинание #{job.job_id}.\n"
+                                    f"Откройте летопись, когда оно закончит.")
+                return
+        self.viewers = [viewer for viewer in self.viewers if not viewer.closed]
+        try:
+            self.viewers.append(ResultViewer(self.root, self.theme, path, output_format))
+        except (OSError, ValueError, sqlite3.Error) as e:
+            messagebox.showerror("🔮 Ошибка", f"Не удалось открыть летопись:\n{e}")
+
+    def save_stats(self):
+        """Статистика последнего результата в JSON или CSV"""
+        if self.last_stats is None:
+            return
+        filename = filedialog.asksaveasfilename(
+            title="Сохранить статистику",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")]
+        )
+        if not filename:
+            return
+        try:
+            write_stats(self.last_stats, Path(filename))
+        except OSError as e:
+            messagebox.showerror("🔮 Ошибка", f"Не удалось сохранить статистику:\n{e}")
+            return
+        messagebox.showinfo("📊 Статистика", f"Статистика сохранена:\n{filename}")
+
+    @staticmethod
+    def format_stats(stats: Dict) -> str:
+        """Сводка статистики для окна результатов"""
+        total = stats['total']
+        text = (f"📊 Статистика: {total['lines']} строк, {total['words']} слов, "
+                f"файлов {len(stats['files'])}, меток {len(stats['labels'])}\n")
+        text += f"   повествование: {total['narration_lines']} строк ({total['narration_share']:.0%})\n"
+        characters = sorted(total['characters'], key=lambda row: -row['lines'])
+        for row in characters[:8]:
+            text += f"   • {row['name']} ({row['tag']}): {row['lines']} строк, {row['words']} слов ({row['share']:.0%})\n"
+        if len(characters) > 8:
+            text += f"   ... и ещё {len(characters) - 8} персонажей\n"
+        order = ", ".join(row['name'] for row in total['characters'][:8])
+        text += f"   порядок появления: {order}\n\n"
+        return text
+
+    @staticmethod
+    def format_profile(profile: Dict) -> str:
+        """Замеры извлечения для окна результатов"""
+        stages = profile['stages']
+        text = f"⏱ Замеры ({profile['wall']:.2f} с):\n"
+        text += (f"   чтение {stages['read']:.2f} с, персонажи {stages['characters']:.2f} с, "
+                 f"разбор {stages['dialogues']:.2f} с, запись {stages['write']:.2f} с\n")
+        lines_per_sec = f"{profile['lines_per_sec']:,.0f}".replace(",", " ")
+        text += f"   {lines_per_sec} строк/с, {profile['bytes_per_sec'] / (1024 * 1024):.1f} МБ/с\n"
+        if profile['cached_files']:
+            text += f"   из кэша: {profile['cached_files']} из {profile['files']} файлов\n"
+        text += (f"   строк-кандидатов {profile['lines']}, совпало {profile['matched']}, "
+                 f"склеено {profile['merged']}, пропущено {profile['skipped_total']}\n")
+        for rule, count in list(profile['skipped'].items())[:5]:
+            text += f"   • {rule}: {count}\n"
+        return text
+
     def run(self):
         """Запуск приложения"""
         self.root.mainloop()
+        # Окно закрыто: отменяем оставшиеся задания, чтобы не ждать их и не оставлять недописанных файлов
+        for job in self.jobs.values():
+            job.cancel_token.set()
+        self.job_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="main.py --cli",
+        description="Извлечение диалогов из Ren'Py скриптов без окна.",
+    )
+    parser.add_argument("input", type=Path, nargs="?",
+                        help=".rpy/.rpyc файл, .rpa архив или папка с игрой")
+    parser.add_argument("-o", "--output", type=Path,
+                        help="итоговый .txt (с --per-file — папка для файлов: расширение отбрасывается)")
+    parser.add_argument("--no-names", dest="with_names", action="store_false",
+                        help="не подставлять имена говорящих")
+    parser.add_argument("-m", "--mapping", type=Path,
+                        help="JSON со своими тегами персонажей {тег: имя}")
+    parser.add_argument("--pack", default="auto", metavar="НАБОР",
+                        help="набор тегов известной игры: его id, auto — определить по скриптам (по умолчанию),"
+                             " none — без набора")
+    parser.add_argument("--skip-rules", type=Path,
+                        help='JSON с правилами пропуска {"contains": [...], "prefixes": [...], "remove": [...]}')
+    parser.add_argument("--per-file", dest="merge", action="store_false",
+                        help="для папки или архива: отдельный .txt на каждый скрипт")
+    parser.add_argument("-j", "--workers", type=int,
+                        help="число процессов для папки или архива (по умолчанию — по числу ядер)")
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS), default="text",
+                        help="формат результата (по умолчанию text)")
+    parser.add_argument("-l", "--label", dest="labels", action="append", metavar="МЕТКА",
+                        help="извлечь только эту метку (можно указать несколько раз)")
+    parser.add_argument("--reachable", action="store_true",
+                        help="с --label: добавить все метки, куда из них ведут jump, call и проваливание")
+    parser.add_argument("--compare", type=Path, metavar="СТАРАЯ",
+                        help="сравнить input со старой версией игры и записать в -o отчёт об изменениях")
+    parser.add_argument("--report", choices=dialogue_diff.REPORT_FORMATS, default="text",
+                        help="с --compare: формат отчёта (по умолчанию text)")
+    parser.add_argument("-t", "--translation", metavar="ЯЗЫК",
+                        help="для папки игры: оригинал и перевод из tl/ЯЗЫК парами")
+    parser.add_argument("--encoding", help="кодировка скриптов (по умолчанию определяется сама)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="не использовать кэш разбора")
+    parser.add_argument("--cache-dir", type=Path, help="папка кэша разбора")
+    parser.add_argument("-q", "--quiet", action="store_true", help="не выводить прогресс")
+    parser.add_argument("--profile", type=Path, metavar="ФАЙЛ",
+                        help="записать в JSON время этапов и счётчики строк (совпавшие, пропущенные по правилам, склеенные)")
+    parser.add_argument("--stats", type=Path, metavar="ФАЙЛ",
+                        help="записать строки и слова по персонажам для игры, файлов и меток (JSON, для .csv — CSV)")
+    search = parser.add_argument_group("поисковый указатель")
+    search.add_argument("--index", type=Path, nargs="?", const=default_index_path(),
+                        help="занести реплики в указатель вместо записи файла (по умолчанию — общий указатель)")
+    search.add_argument("--game", help="имя игры в указателе (по умолчанию — по имени папки)")
+    search.add_argument("--search", metavar="ЗАПРОС",
+                        help="найти реплики в указателе; «слово*» ищет по началу слова")
+    search.add_argument("--speaker", help="с --search: только реплики персонажа (тег или имя)")
+    search.add_argument("--limit", type=int, default=20, help="с --search: сколько реплик выводить")
+    service = parser.add_argument_group("служба извлечения (см. extraction_service)")
+    service.add_argument("--serve", action="store_true",
+                         help="не извлекать, а ждать запросов JSON; теги, правила и кэш — из параметров выше")
+    service.add_argument("--socket", type=Path, help="с --serve: путь Unix-сокета")
+    service.add_argument("--port", type=int,
+                         help="с --serve: слушать 127.0.0.1:ПОРТ вместо Unix-сокета "
+                              "(запросы — с ключом из файла service-token)")
+    service.add_argument("--jobs", type=int, help="с --serve: сколько заданий выполнять одновременно")
+    return parser
+
+
+def run_cli(argv: List[str]) -> int:
+    """Запуск без окна; возвращает код завершения процесса"""
+    arg_parser = build_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.search is not None:
+        return run_search(args)
+    if args.input is None and not args.serve:
+        arg_parser.error("не указан входной файл или папка")
+    if args.output is None and not args.index and not args.serve:
+        arg_parser.error("нужен -o/--output или --index")
+    parser = RenPyParser()
+    if args.mapping and not parser.load_custom_mapping(args.mapping):
+        print(f"Не удалось прочитать теги: {args.mapping}", file=sys.stderr)
+        return 2
+    if args.skip_rules and not parser.load_skip_rules(args.skip_rules):
+        print(f"Не удалось прочитать правила пропуска: {args.skip_rules}", file=sys.stderr)
+        return 2
+    if args.pack not in ("auto", "none") and args.pack not in mapping_packs.available():
+        known = ", ".join(sorted(mapping_packs.available())) or "нет"
+        print(f"Неизвестный набор тегов: {args.pack} (есть: {known})", file=sys.stderr)
+        return 2
+    if not args.serve and not args.input.exists():
+        print(f"Файл не существует: {args.input}", file=sys.stderr)
+        return 2
+    parser.mapping_pack = None if args.pack == "none" else args.pack
+    parser.encoding = args.encoding
+    parser.output_format = args.format
+    parser.profiling = args.profile is not None
+    parser.analytics = args.stats is not None
+    if args.cache:
+        parser.cache = ExtractionCache(args.cache_dir or default_cache_dir())
+    if args.serve:
+        return run_service(parser, args)
+
+    shown = [-1]
+
+    def progress(value, text):
+        percent = int(value * 100)
+        if percent != shown[0]:
+            shown[0] = percent
+            print(f"\r{percent:3d}% {text:<50}", end="", file=sys.stderr, flush=True)
+
+    callback = None if args.quiet else progress
+    if args.compare:
+        if not args.compare.exists():
+            print(f"Файл не существует: {args.compare}", file=sys.stderr)
+            return 2
+        result = parser.compare_versions(args.compare, args.input, args.output, args.report,
+                                         with_names=args.with_names, workers=args.workers,
+                                         progress_callback=callback)
+    elif args.translation:
+        if not args.input.is_dir():
+            print("Для --translation нужна папка игры (с подпапкой tl)", file=sys.stderr)
+            return 2
+        result = parser.align_translation(args.input, args.translation, args.output, with_names=args.with_names,
+                                          progress_callback=callback)
+    elif args.index:
+        result = parser.index_game(args.input, args.index, args.game, with_names=args.with_names,
+                                   workers=args.workers, progress_callback=callback)
+    else:
+        args.output = _output_target(args.input, args.output, args.merge)
+        result = parser.extract(args.input, args.output, with_names=args.with_names, merge=args.merge,
+                                workers=args.workers, progress_callback=callback, labels=args.labels,
+                                reachable=args.reachable)
+    if callback:
+        print(file=sys.stderr)
+
+    if not result['success']:
+        print("Не удалось извлечь диалоги", file=sys.stderr)
+        if result.get('error'):
+            print(f"  {result['error']}", file=sys.stderr)
+        for failed in result.get('failed', []):
+            print(f"  не удалось прочитать: {failed}", file=sys.stderr)
+        return 1
+    for label in result.get('missing_labels', []):
+        print(f"  метка не найдена: {label}", file=sys.stderr)
+    if 'labels' in result:
+        print(f"Меток: {len(result['labels'])}, меню: {result.get('menus', 0)}")
+    if result.get('mapping_pack'):
+        print(f"Набор тегов: {mapping_packs.available()[result['mapping_pack']].name}")
+    print(f"Извлечено реплик: {result['total_replicas']}")
+    if 'changes' in result:
+        changes = result['changes']
+        print(f"Было реплик: {result['old_replicas']}. Добавлено: {changes['added']}, удалено: {changes['removed']}, "
+              f"изменено: {changes['changed']}, перенесено: {changes['moved']}")
+    if 'translated' in result:
+        print(f"С переводом: {result['translated']}, без перевода: {result['untranslated']}, "
+              f"перевод без оригинала: {result['orphaned']}")
+    if 'files' in result:
+        print(f"Обработано файлов: {result['files']}")
+        for failed in result['failed']:
+            print(f"  не удалось прочитать: {failed}", file=sys.stderr)
+    if args.index:
+        print(f"Занесено в указатель: {result['indexed']} ({result['index_path']})")
+    else:
+        print(f"Сохранено в: {args.output}")
+    if args.profile is not None and 'profile' in result:
+        with open(args.profile, 'w', encoding='utf-8') as f:
+            json.dump(result['profile'], f, ensure_ascii=False, indent=2)
+        print(f"Замеры: {args.profile}")
+    if args.stats is not None and 'stats' in result:
+        write_stats(result['stats'], args.stats)
+        print(f"Статистика: {args.stats}")
+    return 0
+
+
+def run_search(args) -> int:
+    """--search: поиск по указателю и вывод найденного с местом в скриптах"""
+    index_path = args.index or default_index_path()
+    if not index_path.exists():
+        print(f"Указатель не найден: {index_path}", file=sys.stderr)
+        return 2
+    with SearchIndex(index_path) as index:
+        hits = index.search(args.search, game=args.game, speaker=args.speaker, limit=args.limit)
+    for hit in hits:
+        speaker = f"{hit.name or hit.tag}: " if hit.tag else ""
+        print(f"{hit.location()}  {speaker}{hit.snippet}")
+    if not hits:
+        print("Ничего не найдено", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_service(parser: RenPyParser, args) -> int:
+    """--serve: локальная служба с уже настроенным parser до запроса shutdown или Ctrl+C"""
+    # asyncio и сокеты нужны только службе
+    import extraction_service
+
+    socket_path = None
+    if args.port is None:
+        socket_path = args.socket or extraction_service.default_socket_path()
+    port = extraction_service.DEFAULT_PORT if args.port is None else args.port
+    try:
+        extraction_service.serve_forever(
+            parser, socket_path, port, args.jobs or extraction_service.DEFAULT_JOBS,
+            ready=lambda address: print(f"Служба ждёт запросов: {address}", file=sys.stderr, flush=True))
+    except OSError as e:
+        print(f"Не удалось запустить службу: {e}", file=sys.stderr)
+        return 2
+    return 0
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    if getattr(sys, 'frozen', False):
+        # В собранном .exe дочерние процессы пула запускаются через этот же файл
+        import multiprocessing
+        multiprocessing.freeze_support()
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--cli":
+        sys.exit(run_cli(argv[1:]))
     app = ModernRenPyParserGUI()
     app.run()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
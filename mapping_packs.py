@@ -0,0 +1,130 @@
+"""Наборы тегов персонажей для известных игр.
+
+Набор — JSON-файл {"name": ..., "tags": {тег: имя}}. Наборы лежат в
+папке mapping_packs рядом с программой и в пользовательской папке
+(user_packs_dir); в каждой папке index.json перечисляет наборы с их
+файлами и отпечатками. При старте ничего не читается: index.json —
+при первом обращении к списку, сам набор — только когда он выбран.
+Набор из пользовательской папки перекрывает встроенный с тем же id.
+
+Отпечаток — доли тегов в репликах игры; в нём перечислены все теги
+набора. detect сравнивает частоты тегов из небольшой выборки скриптов с
+отпечатками (косинусная близость) и выбирает самый похожий набор, если
+сходство достаточно велико. По слишком малой выборке (короткий скрипт,
+маленький мод) подходит только набор, которому известны все её теги.
+"""
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional
+
+# В собранном PyInstaller exe данные распакованы в sys._MEIPASS
+BUILTIN_DIR = Path(getattr(sys, "_MEIPASS", Path(__file__).resolve().parent)) / "mapping_packs"
+INDEX_NAME = "index.json"
+# Меньше сходство — игра считается незнакомой
+MIN_SIMILARITY = 0.5
+# Меньше реплик в выборке — частотам верить нельзя: набор подходит, только если знает все теги
+MIN_SAMPLE_LINES = 20
+
+# Реплика с тегом: «    dv smile "..."» — тег и, может быть, атрибуты перед строкой
+_SAY_TAG = re.compile(rb'^[ \t]*([A-Za-z_]\w*)(?:[ \t]+[\w-]+)*[ \t]*"', re.MULTILINE)
+
+
+class PackInfo(NamedTuple):
+    """Запись index.json: где лежит набор и его отпечаток"""
+    pack_id: str
+    name: str
+    path: Path
+    fingerprint: Dict[str, float]
+
+
+def user_packs_dir() -> Path:
+    """Папка пользовательских наборов для текущей ОС"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(base) / "alice-alchemy-table" / "packs"
+
+
+_index: Optional[Dict[str, PackInfo]] = None
+_loaded: Dict[str, Dict[str, str]] = {}
+
+
+def _read_index(folder: Path) -> Dict[str, PackInfo]:
+    try:
+        with open(folder / INDEX_NAME, encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    packs = {}
+    for pack_id, entry in entries.items():
+        try:
+            packs[pack_id] = PackInfo(pack_id, entry.get("name", pack_id), folder / entry["file"],
+                                      {tag: float(weight) for tag, weight in entry.get("fingerprint", {}).items()})
+        except (AttributeError, KeyError, TypeError, ValueError):
+            continue
+    return packs
+
+
+def available() -> Dict[str, PackInfo]:
+    """Все известные наборы по id (читает только index.json, один раз)"""
+    global _index
+    if _index is None:
+        _index = {**_read_index(BUILTIN_DIR), **_read_index(user_packs_dir())}
+    return _index
+
+
+def reload():
+    """Забывает прочитанные индексы и наборы, например после добавления своего набора"""
+    global _index
+    _index = None
+    _loaded.clear()
+
+
+def load(pack_id: str) -> Dict[str, str]:
+    """Теги набора {тег: имя}; файл читается при первом обращении"""
+    tags = _loaded.get(pack_id)
+    if tags is None:
+        info = available().get(pack_id)
+        if info is None:
+            raise ValueError(f"Неизвестный набор тегов: {pack_id}")
+        with open(info.path, encoding="utf-8") as f:
+            tags = json.load(f)["tags"]
+        _loaded[pack_id] = tags
+    return tags
+
+
+def fingerprint_tags(data: bytes, exclude: Iterable[str] = ()) -> Counter:
+    """Сколько раз каждый тег говорит в куске скрипта; exclude — ключевые слова Ren'Py"""
+    exclude = frozenset(exclude)
+    counts = Counter(m.decode("ascii") for m in _SAY_TAG.findall(data))
+    for word in exclude.intersection(counts):
+        del counts[word]
+    return counts
+
+
+def similarity(counts: Dict[str, int], fingerprint: Dict[str, float]) -> float:
+    """Косинусная близость частот тегов и отпечатка набора"""
+    dot = sum(count * fingerprint.get(tag, 0.0) for tag, count in counts.items())
+    norm = math.sqrt(sum(c * c for c in counts.values())) * math.sqrt(sum(w * w for w in fingerprint.values()))
+    return dot / norm if norm else 0.0
+
+
+def detect(counts: Dict[str, int], min_similarity: float = MIN_SIMILARITY) -> Optional[str]:
+    """id самого похожего набора или None, если похожих нет"""
+    if not counts:
+        return None
+    small = sum(counts.values()) < MIN_SAMPLE_LINES
+    best, best_score = None, 0.0 if small else min_similarity
+    for pack_id, info in available().items():
+        if small and not all(tag in info.fingerprint for tag in counts):
+            continue
+        score = similarity(counts, info.fingerprint)
+        if score >= best_score:
+            best, best_score = pack_id, score
+    return best
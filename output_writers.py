@@ -0,0 +1,207 @@
+"""Форматы итогового файла.
+
+Писатель получает реплики по одной и сразу пишет их на диск. Текст
+остаётся форматом по умолчанию; JSONL, CSV и SQLite сохраняют тег,
+имя, текст, файл, строку и метку каждой реплики. Свой формат
+добавляется через register_writer.
+
+Записи с другим набором полей (например, пары оригинал/перевод) пишутся
+теми же писателями: им передаются fields, функция row, возвращающая
+значения полей записи, и имя таблицы SQLite. Текст берётся из
+record.format(with_names).
+"""
+import csv
+import json
+import shutil
+import sqlite3
+from json.encoder import encode_basestring
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Type
+
+# Порядок полей в структурированных форматах
+FIELDS = ("file", "line", "label", "tag", "name", "text")
+# Буфер записи текстовых форматов
+OUTPUT_BUFFER = 1024 * 1024
+
+# Строка JSONL собирается по шаблону: так втрое быстрее, чем json.dumps от словаря
+_JSONL_ROW = '{"file": %s, "line": %d, "label": %s, "tag": %s, "name": %s, "text": %s}\n'
+# Типы столбцов SQLite; остальные — TEXT
+_COLUMN_TYPES = {"line": "INTEGER", "tl_line": "INTEGER"}
+
+
+def _json_str(value) -> str:
+    return "null" if value is None else encode_basestring(value)
+
+
+_json_object = json.JSONEncoder(ensure_ascii=False).encode
+
+
+class OutputWriter:
+    """Текстовый формат: «Имя: реплика», реплики через пустую строку"""
+
+    suffix = ".txt"
+
+    def __init__(self, path: Path, with_names: bool = True, fields: Sequence[str] = FIELDS,
+                 row: Optional[Callable] = None, table: str = "dialogues"):
+        self.path = Path(path)
+        self.with_names = with_names
+        self.fields = tuple(fields)
+        self.table = table
+        if row is not None:
+            # row(record, source) -> значения fields
+            self._row = row
+        self.count = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "w", encoding="utf-8", buffering=OUTPUT_BUFFER)
+
+    def _row(self, record, source: str) -> tuple:
+        name = record.name if self.with_names and record.speaker else None
+        return source, record.line, record.label, record.speaker, name, record.text
+
+    def write(self, record, source: str):
+        if self.count:
+            self._file.write("\n\n")
+        self._file.write(record.format(self.with_names))
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    @classmethod
+    def merge(cls, parts: List[Path], output_path: Path):
+        """Склеивает непустые части пакетного режима в один файл"""
+        with open(output_path, "wb") as out:
+            for i, part in enumerate(parts):
+                if i:
+                    out.write(b"\n\n")
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+
+
+class JsonlWriter(OutputWriter):
+    """Одна реплика — один JSON-объект в строке"""
+
+    suffix = ".jsonl"
+
+    def _open(self):
+        super()._open()
+        if self.fields != FIELDS:
+            # Шаблон строки годится только для реплик
+            self.write = self._write_object
+
+    def write(self, record, source: str):
+        source, line, label, tag, name, text = self._row(record, source)
+        self._file.write(_JSONL_ROW % (encode_basestring(source), line, _json_str(label),
+                                       _json_str(tag), _json_str(name), encode_basestring(text)))
+        self.count += 1
+
+    def _write_object(self, record, source: str):
+        self._file.write(_json_object(dict(zip(self.fields, self._row(record, source)))))
+        self._file.write("\n")
+        self.count += 1
+
+    @classmethod
+    def merge(cls, parts: List[Path], output_path: Path):
+        with open(output_path, "wb") as out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+
+
+class CsvWriter(OutputWriter):
+    """CSV с заголовком; BOM нужен, чтобы Excel узнал UTF-8"""
+
+    suffix = ".csv"
+
+    def _open(self):
+        self._file = open(self.path, "w", encoding="utf-8-sig", newline="", buffering=OUTPUT_BUFFER)
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self.fields)
+
+    def write(self, record, source: str):
+        self._csv.writerow(self._row(record, source))
+        self.count += 1
+
+    @classmethod
+    def merge(cls, parts: List[Path], output_path: Path):
+        if not parts:
+            cls(output_path).close()
+            return
+        with open(output_path, "wb") as out:
+            for i, part in enumerate(parts):
+                with open(part, "rb") as f:
+                    if i:
+                        # Заголовок (вместе с BOM) нужен только один раз
+                        f.readline()
+                    shutil.copyfileobj(f, out)
+
+
+class SqliteWriter(OutputWriter):
+    """Таблица dialogues в базе SQLite; вставка пачками в одной транзакции"""
+
+    suffix = ".sqlite"
+    BATCH_SIZE = 5000
+
+    def _open(self):
+        self.path.unlink(missing_ok=True)
+        self._db = sqlite3.connect(self.path)
+        # Файл пишется во временный и подменяется целиком, журнал не нужен
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        columns = ", ".join(f"{field} {_COLUMN_TYPES.get(field, 'TEXT')}" for field in self.fields)
+        self._db.execute(f"CREATE TABLE {self.table} (id INTEGER PRIMARY KEY, {columns})")
+        self._insert = (f"INSERT INTO {self.table} ({', '.join(self.fields)})"
+                        f" VALUES ({', '.join('?' * len(self.fields))})")
+        self._batch = []
+
+    def write(self, record, source: str):
+        self._batch.append(self._row(record, source))
+        self.count += 1
+        if len(self._batch) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self._db.executemany(self._insert, self._batch)
+        self._batch = []
+
+    def close(self):
+        if self._batch:
+            self._flush()
+        self._db.commit()
+        self._db.close()
+
+    @classmethod
+    def merge(cls, parts: List[Path], output_path: Path):
+        cls(output_path).close()
+        db = sqlite3.connect(output_path)
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        for part in parts:
+            db.execute("ATTACH DATABASE ? AS part", (str(part),))
+            db.execute("INSERT INTO dialogues (file, line, label, tag, name, text)"
+                       " SELECT file, line, label, tag, name, text FROM part.dialogues ORDER BY id")
+            db.commit()
+            db.execute("DETACH DATABASE part")
+        db.close()
+
+
+WRITERS: Dict[str, Type[OutputWriter]] = {
+    "text": OutputWriter,
+    "jsonl": JsonlWriter,
+    "csv": CsvWriter,
+    "sqlite": SqliteWriter,
+}
+
+
+def register_writer(name: str, writer: Type[OutputWriter]):
+    """Добавляет свой формат вывода"""
+    WRITERS[name] = writer
+
+
+def get_writer(name: str) -> Type[OutputWriter]:
+    try:
+        return WRITERS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный формат вывода: {name}") from None
@@ -0,0 +1,264 @@
+"""Чтение итогового файла по номеру реплики — для просмотра результата в окне.
+
+Файл не читается целиком. Для text, jsonl и csv строится грубый
+указатель: начало каждого куска примерно в CHUNK_SIZE байт и номер
+первой реплики в нём (реплики в куске считаются bytes.count, без
+цикла на Python). Реплика по номеру находится поиском от начала её
+куска, соседние реплики читаются страницами по PAGE_SIZE, а несколько
+последних страниц держатся в памяти. Результат в SQLite читается
+запросами по id.
+"""
+import abc
+import bisect
+import csv
+import json
+import mmap
+import os
+import sqlite3
+from collections import OrderedDict
+from json.encoder import encode_basestring
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+
+from output_writers import WRITERS
+
+CHUNK_SIZE = 1024 * 1024
+PAGE_SIZE = 200
+# Сколько страниц держать в памяти
+CACHED_PAGES = 8
+
+
+class ViewRecord(NamedTuple):
+    """Реплика для показа; number — номер в файле, с нуля"""
+    number: int
+    tag: Optional[str]
+    name: Optional[str]
+    text: str
+    file: Optional[str] = None
+    line: Optional[int] = None
+
+    def format(self) -> str:
+        where = f"[{self.file}:{self.line}] " if self.file else ""
+        speaker = self.name or self.tag
+        return f"{where}{speaker}: {self.text}" if speaker else f"{where}{self.text}"
+
+    def spoken_by(self, speaker: str) -> bool:
+        if self.tag is None and self.name is None:
+            # В текстовом формате имя — часть строки
+            return self.text.startswith(f"{speaker}: ")
+        return speaker in (self.tag, self.name)
+
+
+class _PagedRecords(abc.ABC):
+    """Общая часть: страницы поверх _read_page; find_speaker у каждого формата свой"""
+
+    total = 0
+
+    def __init__(self):
+        self._pages = OrderedDict()
+
+    def __len__(self):
+        return self.total
+
+    @abc.abstractmethod
+    def _read_page(self, page: int) -> List[ViewRecord]:
+        """Реплики страницы page (PAGE_SIZE штук, у последней — меньше)"""
+
+    def _page(self, page: int) -> List[ViewRecord]:
+        records = self._pages.get(page)
+        if records is None:
+            records = self._read_page(page)
+            self._pages[page] = records
+            if len(self._pages) > CACHED_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page)
+        return records
+
+    def records(self, start: int, count: int) -> List[ViewRecord]:
+        """Реплики с номера start (не больше count)"""
+        start = max(0, start)
+        end = min(self.total, start + count)
+        result = []
+        while start < end:
+            page, offset = divmod(start, PAGE_SIZE)
+            chunk = self._page(page)[offset:offset + end - start]
+            if not chunk:
+                break
+            result.extend(chunk)
+            start += len(chunk)
+        return result
+
+    def record(self, number: int) -> Optional[ViewRecord]:
+        records = self.records(number, 1)
+        return records[0] if records else None
+
+    @abc.abstractmethod
+    def find_speaker(self, speaker: str, after: int = -1) -> Optional[int]:
+        """Номер следующей после after реплики персонажа (тег или имя) или None"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordFile(_PagedRecords):
+    """Реплики файла в формате text, jsonl или csv"""
+
+    def __init__(self, path: Union[str, Path], output_format: str = "text"):
+        super().__init__()
+        self.path = Path(path)
+        self.output_format = output_format
+        self._file = open(self.path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.separator, start = self._layout()
+        self._starts = []
+        self._firsts = []
+        self.total = self._build(start)
+
+    def _layout(self):
+        """Разделитель реплик и смещение первой реплики"""
+        data = self._data
+        if self.output_format == "csv":
+            # csv.writer заканчивает строки \r\n; первая строка — заголовок
+            header_end = data.find(b"\r\n")
+            return b"\r\n", self.size if header_end < 0 else header_end + 2
+        if self.output_format == "jsonl":
+            return b"\n", 0
+        # Текст пишется с переводом строк ОС: на Windows реплики разделены \r\n\r\n
+        return (b"\r\n\r\n" if b"\r\n" in data[:65536] else b"\n\n"), 0
+
+    def _build(self, start: int) -> int:
+        data, sep, size = self._data, self.separator, self.size
+        total = 0
+        pos = start
+        while pos < size:
+            end = size
+            if pos + CHUNK_SIZE < size:
+                found = data.find(sep, pos + CHUNK_SIZE)
+                if found >= 0:
+                    # Кусок кончается сразу после разделителя: следующий начинается с реплики
+                    end = found + len(sep)
+            self._starts.append(pos)
+            self._firsts.append(total)
+            total += data[pos:end].count(sep)
+            pos = end
+        if size > start and data[size - len(sep):size] != sep:
+            # Последняя реплика без разделителя в конце
+            total += 1
+        return total
+
+    def offset(self, number: int) -> int:
+        """Смещение начала реплики в файле"""
+        k = bisect.bisect_right(self._firsts, number) - 1
+        pos = self._starts[k]
+        find, sep = self._data.find, self.separator
+        for _ in range(number - self._firsts[k]):
+            pos = find(sep, pos) + len(sep)
+        return pos
+
+    def number_at(self, pos: int) -> int:
+        """Номер реплики, в которой находится байт pos"""
+        k = bisect.bisect_right(self._starts, pos) - 1
+        return self._firsts[k] + self._data[self._starts[k]:pos].count(self.separator)
+
+    def _parse(self, number: int, raw: bytes) -> ViewRecord:
+        if self.output_format == "jsonl":
+            row = json.loads(raw)
+            return ViewRecord(number, row["tag"], row["name"], row["text"], row["file"], row["line"])
+        if self.output_format == "csv":
+            file, line, _, tag, name, text = next(csv.reader([raw.decode("utf-8", "replace")]))
+            return ViewRecord(number, tag or None, name or None, text, file, int(line) if line else None)
+        return ViewRecord(number, None, None, raw.decode("utf-8", "replace").replace("\r\n", "\n"))
+
+    def _read_page(self, page: int) -> List[ViewRecord]:
+        first = page * PAGE_SIZE
+        count = min(PAGE_SIZE, self.total - first)
+        if count <= 0:
+            return []
+        data, sep = self._data, self.separator
+        pos = self.offset(first)
+        records = []
+        for number in range(first, first + count):
+            end = data.find(sep, pos)
+            if end < 0:
+                end = self.size
+            records.append(self._parse(number, data[pos:end]))
+            pos = end + len(sep)
+        return records
+
+    def find_speaker(self, speaker: str, after: int = -1) -> Optional[int]:
+        """Номер следующей после after реплики персонажа (тег или имя) или None"""
+        number = after + 1
+        if self.output_format == "text":
+            # Имя стоит в начале реплики: ищем его сразу после разделителя
+            if number <= 0:
+                first = self.record(0)
+                if first is not None and first.spoken_by(speaker):
+                    return 0
+                number = 1
+            needle = self.separator + f"{speaker}: ".encode("utf-8")
+            shift = len(self.separator)
+        else:
+            # В jsonl и csv ищем само имя и проверяем найденную реплику
+            needle = (encode_basestring(speaker) if self.output_format == "jsonl" else speaker).encode("utf-8")
+            shift = 0
+        while number < self.total:
+            # Для текста поиск начинается с разделителя перед репликой number
+            found = self._data.find(needle, self.offset(number) - shift)
+            if found < 0:
+                return None
+            number = self.number_at(found + shift)
+            record = self.record(number)
+            if record is not None and record.spoken_by(speaker):
+                return number
+            number += 1
+        return None
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class SqliteRecords(_PagedRecords):
+    """Реплики результата в формате sqlite: номер реплики — её id по порядку"""
+
+    def __init__(self, path: Union[str, Path]):
+        super().__init__()
+        self.path = Path(path)
+        self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        first, self.total = self._db.execute("SELECT MIN(id), COUNT(*) FROM dialogues").fetchone()
+        # Писатель нумерует строки подряд, так что номер реплики = id - first
+        self._first_id = first or 1
+
+    def _read_page(self, page: int) -> List[ViewRecord]:
+        first = self._first_id + page * PAGE_SIZE
+        rows = self._db.execute("SELECT id, tag, name, text, file, line FROM dialogues"
+                                " WHERE id >= ? AND id < ? ORDER BY id", (first, first + PAGE_SIZE))
+        return [ViewRecord(row_id - self._first_id, *rest) for row_id, *rest in rows]
+
+    def find_speaker(self, speaker: str, after: int = -1) -> Optional[int]:
+        row = self._db.execute("SELECT MIN(id) FROM dialogues WHERE id > ? AND (tag = ? OR name = ?)",
+                               (self._first_id + after, speaker, speaker)).fetchone()
+        return row[0] - self._first_id if row[0] is not None else None
+
+    def close(self):
+        self._db.close()
+
+
+def open_results(path: Union[str, Path], output_format: Optional[str] = None) -> _PagedRecords:
+    """Реплики итогового файла; формат по умолчанию определяется по расширению"""
+    path = Path(path)
+    if output_format is None:
+        suffixes = {writer.suffix: name for name, writer in WRITERS.items()}
+        output_format = suffixes.get(path.suffix.lower(), "text")
+    if output_format == "sqlite":
+        return SqliteRecords(path)
+    return RecordFile(path, output_format)
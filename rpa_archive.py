@@ -0,0 +1,93 @@
+"""Чтение архивов Ren'Py (.rpa) без распаковки.
+
+Поддерживаются RPA-2.0 и RPA-3.0. Читается только индекс в конце архива
+и нужные скрипты, картинки и звук не трогаются.
+"""
+import io
+import pickle
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, NamedTuple, Union
+
+
+class _IndexUnpickler(pickle.Unpickler):
+    """Индекс архива — это словарь списков кортежей; любые классы запрещены"""
+
+    def find_class(self, module, name):
+        # Так протоколы 2 и ниже сохраняют bytes из Python 3
+        if (module, name) == ("_codecs", "encode"):
+            return _latin1_encode
+        if name == "bytes" and module in ("builtins", "__builtin__"):
+            return bytes
+        raise pickle.UnpicklingError(f"В индексе архива недопустим объект {module}.{name}")
+
+
+def _latin1_encode(text, encoding="latin-1"):
+    return text.encode("latin-1")
+
+
+class ArchiveMember(NamedTuple):
+    """Файл внутри архива. Лёгкий и сериализуемый — можно отдать в рабочий процесс"""
+    archive: Path
+    name: str
+    offset: int
+    length: int
+    prefix: bytes = b""
+
+    def read(self) -> bytes:
+        """Содержимое файла: один seek и одно чтение из архива"""
+        with open(self.archive, "rb") as f:
+            f.seek(self.offset)
+            return self.prefix + f.read(self.length - len(self.prefix))
+
+    def __str__(self):
+        return f"{self.archive}/{self.name}"
+
+
+def read_index(archive_path: Union[str, Path]) -> Dict[str, ArchiveMember]:
+    """Читает индекс архива: имя файла → ArchiveMember"""
+    archive_path = Path(archive_path)
+    with open(archive_path, "rb") as f:
+        header = f.readline(256)
+        fields = header.split()
+        try:
+            if header.startswith(b"RPA-3.0 "):
+                offset = int(fields[1], 16)
+                key = int(fields[2], 16)
+            elif header.startswith(b"RPA-2.0 "):
+                offset = int(fields[1], 16)
+                key = 0
+            else:
+                raise ValueError(f"Неподдерживаемый формат архива: {header[:16]!r}")
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"{archive_path}: {e}") from None
+        f.seek(offset)
+        raw_index = _IndexUnpickler(io.BytesIO(zlib.decompress(f.read())), encoding="latin-1").load()
+
+    members = {}
+    for name, chunks in raw_index.items():
+        if isinstance(name, bytes):
+            name = name.decode("utf-8", "replace")
+        # Ren'Py всегда пишет файл одним куском
+        chunk = chunks[0]
+        prefix = chunk[2] if len(chunk) > 2 else b""
+        if isinstance(prefix, str):
+            prefix = prefix.encode("latin-1")
+        members[name] = ArchiveMember(archive_path, name, chunk[0] ^ key, chunk[1] ^ key, prefix)
+    return members
+
+
+def script_members(archive_path: Union[str, Path], suffixes=(".rpy",)) -> List[ArchiveMember]:
+    """Скрипты из архива в порядке имён.
+
+    Имена с выходом за пределы папки игры пропускаются: по ним строятся
+    пути выходных файлов.
+    """
+    members = read_index(archive_path)
+    return [members[name] for name in sorted(members)
+            if name.lower().endswith(suffixes) and _is_safe_name(name)]
+
+
+def _is_safe_name(name: str) -> bool:
+    path = PurePosixPath(name.replace("\\", "/"))
+    return not path.is_absolute() and ".." not in path.parts and ":" not in name
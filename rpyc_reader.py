@@ -0,0 +1,287 @@
+"""Реплики из скомпилированных скриптов Ren'Py (.rpyc) без декомпиляции.
+
+.rpyc — это сжатый zlib pickle дерева разбора. Вместо классов Ren'Py
+подставляются пустые заглушки, поэтому при загрузке не выполняется
+никакой код игры, а сам Ren'Py не нужен. Из дерева берутся только
+реплики, пункты меню и определения Character(...).
+"""
+import io
+import pickle
+import re
+import struct
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+_RPC2_MAGIC = b"RENPY RPC2"
+
+_character_call = re.compile(r'Character\s*\(\s*(?:_\(\s*)?[uU]?[\'"]([^\'"]+)[\'"]')
+_character_assign = re.compile(r'^\s*(\w+)\s*=\s*' + _character_call.pattern)
+
+
+class _Node:
+    """Заглушка для любого класса Ren'Py: просто хранит присланное состояние"""
+
+    def __init__(self, *args, **kwargs):
+        self._args = args
+
+    def __setstate__(self, state):
+        # Узлы Ren'Py сохраняются как (версия, {слоты}); PyCode — как (версия, source, location, mode, ...)
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+        elif isinstance(state, tuple):
+            for part in state:
+                if isinstance(part, dict):
+                    self.__dict__.update(part)
+            self._state = state
+
+
+class _Expr(str):
+    """Заглушка для PyExpr — строки с выражением Python"""
+
+    def __new__(cls, value="", *args):
+        return super().__new__(cls, value)
+
+    def __setstate__(self, state):
+        pass
+
+
+class _List(list):
+    def __setstate__(self, state):
+        pass
+
+
+class _Dict(dict):
+    def __setstate__(self, state):
+        pass
+
+
+class _Set(set):
+    def __setstate__(self, state):
+        pass
+
+
+_CONTAINERS = {"RevertableList": _List, "RevertableDict": _Dict, "RevertableSet": _Set}
+_BUILTINS = {"set": set, "frozenset": frozenset, "bytes": bytes, "object": object}
+
+
+def _reconstructor(cls, base, state):
+    # copy_reg._reconstructor из pickle Python 2
+    return cls.__new__(cls)
+
+
+def _latin1_encode(text, encoding="latin-1"):
+    return text.encode("latin-1")
+
+
+class _AstUnpickler(pickle.Unpickler):
+    """Пропускает только классы Ren'Py (как заглушки) и безопасные встроенные типы"""
+
+    def __init__(self, file):
+        super().__init__(file, encoding="utf-8", errors="surrogateescape")
+        self._stubs = {}
+
+    def find_class(self, module, name):
+        if module == "renpy" or module.startswith("renpy.") or module == "store" or module.startswith("store."):
+            if name in _CONTAINERS:
+                return _CONTAINERS[name]
+            if name == "PyExpr":
+                return _Expr
+            key = (module, name)
+            if key not in self._stubs:
+                self._stubs[key] = type(name, (_Node,), {"__module__": module})
+            return self._stubs[key]
+        if module in ("builtins", "__builtin__") and name in _BUILTINS:
+            return _BUILTINS[name]
+        if module == "collections" and name == "OrderedDict":
+            return dict
+        if module in ("copy_reg", "copyreg") and name == "_reconstructor":
+            return _reconstructor
+        if module == "_codecs" and name == "encode":
+            return _latin1_encode
+        raise pickle.UnpicklingError(f"В .rpyc недопустим объект {module}.{name}")
+
+
+def load_statements(data: bytes) -> List:
+    """Список верхнеуровневых узлов из содержимого .rpyc"""
+    if data.startswith(_RPC2_MAGIC):
+        # Таблица слотов: (номер, начало, длина), до нулевого номера; дерево лежит в слоте 1
+        pos = len(_RPC2_MAGIC)
+        chunk = None
+        while pos + 12 <= len(data):
+            slot, start, length = struct.unpack("<III", data[pos:pos + 12])
+            if slot == 0:
+                break
+            if slot == 1:
+                chunk = data[start:start + length]
+            pos += 12
+        if chunk is None:
+            raise ValueError("В .rpyc нет слота с деревом разбора")
+    else:
+        # Старый формат RPC1: весь файл — один сжатый pickle
+        chunk = data
+    _, statements = _AstUnpickler(io.BytesIO(zlib.decompress(chunk))).load()
+    return statements
+
+
+def _source(code) -> str:
+    """Текст кода из заглушки PyCode"""
+    source = getattr(code, "source", None)
+    if source is None:
+        state = getattr(code, "_state", ())
+        source = next((part for part in state if isinstance(part, str)), "")
+    return str(source)
+
+
+def iter_tokens(statements: List, label: Optional[str] = None
+                ) -> Iterator[Tuple[str, Optional[str], str, int, Optional[str]]]:
+    """Лексемы в том же виде, что у DialogueLexer: (kind, speaker, text, line, label).
+
+    Обход идёт в порядке исходного текста: блоки меток, меню, условий,
+    init и translate разворачиваются на месте. Номер строки у пункта меню —
+    номер строки самого menu. Пункты именованного меню относятся к его
+    имени, как и у DialogueLexer.
+    """
+    menu_label = None
+    for node in statements:
+        kind = type(node).__name__
+        line = getattr(node, "linenumber", 0)
+        named, menu_label = menu_label, None
+
+        if kind == "Say":
+            who = getattr(node, "who", None)
+            what = getattr(node, "what", None)
+            if isinstance(what, str):
+                # Ren'Py уже превратил \n в перевод строки; в .rpy он остаётся экранированным
+                text = what.replace("\n", "\\n")
+                if who == "extend":
+                    yield "extend", None, text, line, label
+                else:
+                    yield "say", str(who) if who else None, text, line, label
+            continue
+        if kind == "Menu":
+            owner = named or label
+            for item in getattr(node, "items", ()):
+                caption, block = item[0], item[2] if len(item) > 2 else None
+                if isinstance(caption, str):
+                    # Пункт без блока — подпись меню, она выводится как обычная реплика
+                    yield ("say" if block is None else "choice"), None, caption, line, owner
+                if block:
+                    yield from iter_tokens(block, owner)
+            continue
+        if kind == "Label":
+            menu_label = _menu_name(node)
+            yield from iter_tokens(getattr(node, "block", None) or (), getattr(node, "name", label))
+            continue
+        if kind in ("Define", "Default"):
+            m = _character_call.match(_source(getattr(node, "code", None)).strip())
+            if m:
+                yield "character", getattr(node, "varname", ""), m.group(1), line, label
+            continue
+        if kind in ("Python", "EarlyPython"):
+            source = _source(getattr(node, "code", None))
+            if "Character" in source:
+                for text in source.splitlines():
+                    m = _character_assign.match(text)
+                    if m:
+                        yield "character", m.group(1), m.group(2), line, label
+            continue
+        if kind in ("TranslateString", "TranslateBlock", "TranslateEarlyBlock", "UserStatement", "Screen"):
+            continue
+
+        # Вложенные блоки: init/translate (block) и if/while (entries)
+        block = getattr(node, "block", None)
+        if isinstance(block, list):
+            yield from iter_tokens(block, label)
+        for entry in getattr(node, "entries", None) or ():
+            if isinstance(entry, (tuple, list)) and entry and isinstance(entry[-1], list):
+                yield from iter_tokens(entry[-1], label)
+
+
+def _blocks(node) -> Iterator[List]:
+    """Вложенные списки узлов: блок (label, init, translate), ветви if/while и пункты меню"""
+    block = getattr(node, "block", None)
+    if isinstance(block, list):
+        yield block
+    for entry in getattr(node, "entries", None) or ():
+        if isinstance(entry, (tuple, list)) and entry and isinstance(entry[-1], list):
+            yield entry[-1]
+    for item in getattr(node, "items", None) or ():
+        if isinstance(item, (tuple, list)) and len(item) > 2 and isinstance(item[2], list):
+            yield item[2]
+
+
+def _menu_name(node) -> Optional[str]:
+    """Имя меню, если узел — метка от `menu имя:` (Ren'Py ставит пустую Label перед Menu)"""
+    if type(node).__name__ == "Label" and not getattr(node, "block", None):
+        return str(getattr(node, "name", "")) or None
+    return None
+
+
+def _menus(statements: List, menus: List[list]):
+    """Меню в блоке метки как [смещение (нет), строка, имя], не заходя во вложенные метки"""
+    named = None
+    for node in statements:
+        kind = type(node).__name__
+        if kind == "Label":
+            named = _menu_name(node)
+            continue
+        if kind == "Menu":
+            menus.append([None, getattr(node, "linenumber", 0), named])
+        named = None
+        for block in _blocks(node):
+            _menus(block, menus)
+
+
+def _targets(statements: List, global_label: str, targets: List[str]):
+    """Цели jump/call в блоке метки, не заходя во вложенные метки"""
+    for node in statements:
+        kind = type(node).__name__
+        if kind == "Label":
+            continue
+        if kind in ("Jump", "Call") and not getattr(node, "expression", False):
+            target = getattr(node, "target" if kind == "Jump" else "label", None)
+            if isinstance(target, str) and target:
+                targets.append(global_label + target if target.startswith(".") else target)
+        for block in _blocks(node):
+            _targets(block, global_label, targets)
+
+
+def label_flow(statements: List) -> List[Tuple[str, List[str], bool, int, List[list]]]:
+    """Метки в порядке файла: (имя, цели jump/call, проваливается ли блок, строка, меню).
+
+    Блок проваливается в следующую метку, если его последняя инструкция
+    не jump и не return. Именованное меню всегда проваливается — обратно
+    в метку, внутри которой стоит (см. LabelIndex.from_flow).
+    """
+    flow = []
+    global_label = [""]
+
+    def visit(nodes):
+        for i, node in enumerate(nodes):
+            if type(node).__name__ != "Label":
+                for block in _blocks(node):
+                    visit(block)
+                continue
+            name = str(getattr(node, "name", ""))
+            if not name.startswith("."):
+                global_label[0] = name.split(".")[0]
+            else:
+                name = global_label[0] + name
+            block = getattr(node, "block", None) or []
+            if _menu_name(node) and i + 1 < len(nodes) and type(nodes[i + 1]).__name__ == "Menu":
+                # Цели именованного меню — переходы из его пунктов; обходится меню вместе с родителем
+                targets = []
+                _targets([nodes[i + 1]], global_label[0], targets)
+                flow.append((name, targets, True, getattr(node, "linenumber", 0), []))
+                continue
+            targets = []
+            _targets(block, global_label[0], targets)
+            menus = []
+            _menus(block, menus)
+            last = type(block[-1]).__name__ if block else None
+            flow.append((name, targets, last not in ("Jump", "Return"), getattr(node, "linenumber", 0),
+                         menus))
+            visit(block)
+
+    visit(statements)
+    return flow
@@ -0,0 +1,258 @@
+"""Кэш разбора скриптов на диске.
+
+Записи адресуются хэшем содержимого файла, поэтому повторный запуск
+по большой игре заново разбирает только изменившиеся скрипты.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def default_cache_dir() -> Path:
+    """Папка кэша по умолчанию для текущей ОС"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "alice-alchemy-table"
+
+
+def _temp_file(path: Path):
+    """Открывает для записи уникальный временный файл рядом с path.
+
+    Имя уникально для каждого писателя, а не только для процесса: задания
+    службы и GUI идут потоками одного процесса и могут писать одну запись.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    return open(fd, 'w', encoding='utf-8'), Path(tmp_path)
+
+
+def _replace(tmp_path: Path, path: Path):
+    """Переименовывает временный файл в запись; при неудаче убирает его"""
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # На Windows запись, которую сейчас читает другое задание, заменить нельзя
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def mapping_digest(mapping: Dict[str, str]) -> str:
+    """Короткий отпечаток словаря тегов"""
+    data = json.dumps(mapping, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Кэш реплик и определений Character(...) по хэшу содержимого.
+
+    Каждая запись — отдельный файл, который пишется во временный файл и
+    переименовывается, так что кэшем могут пользоваться несколько
+    процессов сразу. Время последнего обращения хранится в mtime записи
+    и используется для вытеснения по возрасту и размеру.
+    """
+
+    INDEX_NAME = "stat-index.json"
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 512 * 1024 * 1024, max_age_days: float = 30):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        self._stat_index = None
+
+    def __getstate__(self):
+        # В рабочие процессы уходят только настройки, индекс они читают сами
+        state = self.__dict__.copy()
+        state['_stat_index'] = None
+        return state
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _load_index(self) -> Dict[str, list]:
+        if self._stat_index is None:
+            try:
+                with open(self.cache_dir / self.INDEX_NAME, 'r', encoding='utf-8') as f:
+                    self._stat_index = json.load(f)
+            except (OSError, ValueError):
+                self._stat_index = {}
+        return self._stat_index
+
+    def save_index(self):
+        """Сохраняет индекс размеров и дат файлов"""
+        if self._stat_index is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        f, tmp_path = _temp_file(self.cache_dir / self.INDEX_NAME)
+        with f:
+            json.dump(self._stat_index, f, ensure_ascii=False, separators=(",", ":"))
+        _replace(tmp_path, self.cache_dir / self.INDEX_NAME)
+
+    def digest(self, path: Path) -> str:
+        """Хэш содержимого файла.
+
+        Если размер и mtime не изменились с прошлого раза, файл не читается.
+        """
+        path = Path(path)
+        st = path.stat()
+        index = self._load_index()
+        key = str(path.resolve())
+        known = index.get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+
+        h = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        index[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return index[key][2]
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Ключ записи из хэша файла и всех настроек, влияющих на результат"""
+        h = hashlib.sha1()
+        for part in parts:
+            h.update(str(part).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _touch(self, path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _get_json(self, key: str):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._touch(path)
+        return value
+
+    def _put_json(self, key: str, value):
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f, tmp_path = _temp_file(path)
+        with f:
+            json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+        _replace(tmp_path, path)
+
+    def get_characters(self, key: str) -> Optional[Dict[str, str]]:
+        return self._get_json(key)
+
+    def put_characters(self, key: str, characters: Dict[str, str]):
+        self._put_json(key, characters)
+
+    def get_label_index(self, key: str) -> Optional[Dict]:
+        """Указатель меток (LabelIndex.to_dict) или None"""
+        return self._get_json(key)
+
+    def put_label_index(self, key: str, index: Dict):
+        self._put_json(key, index)
+
+    def has_records(self, key: str) -> bool:
+        return self._entry_path(key).exists()
+
+    def iter_records(self, key: str) -> Iterator[list]:
+        """Построчно читает реплики записи.
+
+        Определения персонажей лежат последней строкой и возвращаются
+        отдельным значением генератора (StopIteration.value).
+        """
+        path = self._entry_path(key)
+        characters = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                if isinstance(row, dict):
+                    characters = row
+                    break
+                yield row
+        self._touch(path)
+        return characters
+
+    def record_writer(self, key: str) -> "CacheEntryWriter":
+        return CacheEntryWriter(self._entry_path(key))
+
+    def evict(self) -> Tuple[int, int]:
+        """Удаляет старые записи и самые давно использованные сверх лимита.
+
+        Возвращает (удалено записей, освобождено байт).
+        """
+        if not self.cache_dir.exists():
+            return 0, 0
+        now = time.time()
+        entries = []
+        removed = freed = 0
+        for sub in self.cache_dir.iterdir():
+            if not sub.is_dir():
+                continue
+            for path in sub.iterdir():
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                # Брошенные временные файлы и устаревшие записи
+                if path.suffix == '.tmp' and now - st.st_mtime > 3600 or now - st.st_mtime > self.max_age:
+                    try:
+                        path.unlink()
+                        removed += 1
+                        freed += st.st_size
+                    except OSError:
+                        pass
+                    continue
+                if path.suffix == '.tmp':
+                    # Свежий временный файл ещё пишет другое задание
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                freed += size
+        return removed, freed
+
+
+class CacheEntryWriter:
+    """Потоково пишет реплики в запись кэша; запись появляется только после finish()"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file, self.tmp_path = _temp_file(path)
+
+    def add(self, row: List):
+        self._file.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+        self._file.write("\n")
+
+    def finish(self, characters: Dict[str, str]):
+        self.add(characters)
+        self._file.close()
+        _replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,199 @@
+"""Чтение скриптов на уровне байтов.
+
+Файл отображается в память (mmap) и режется на строки без декодирования;
+декодируются только строки, которые действительно нужны разбору.
+Кодировка определяется по BOM или по небольшому образцу.
+"""
+import codecs
+import io
+import mmap
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+# Сколько байт смотреть при определении кодировки
+SAMPLE_SIZE = 64 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+
+def detect_encoding(sample: bytes) -> Tuple[str, int]:
+    """Определяет кодировку по началу файла.
+
+    Возвращает (кодировка, длина BOM). Без BOM проверяется UTF-16 по
+    нулевым байтам, затем UTF-8, затем однобайтовые кириллические
+    кодировки по распределению старших байтов.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+
+    # UTF-16 без BOM: нулевые байты через один (нули допустимы и в UTF-8, поэтому проверяем раньше)
+    if sample:
+        even_zeros = sample[0::2].count(0)
+        odd_zeros = sample[1::2].count(0)
+        half = len(sample) / 2
+        if odd_zeros > half * 0.3 and even_zeros < half * 0.05:
+            return "utf-16-le", 0
+        if even_zeros > half * 0.3 and odd_zeros < half * 0.05:
+            return "utf-16-be", 0
+
+    try:
+        sample.decode("utf-8")
+        return "utf-8", 0
+    except UnicodeDecodeError as e:
+        # Образец мог оборвать многобайтовый символ на конце
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return "utf-8", 0
+
+    # В cp1251 строчные буквы занимают E0-FF, в koi8-r — C0-DF; в тексте строчных больше
+    upper_half = sum(sample.count(b) for b in range(0xE0, 0x100))
+    lower_half = sum(sample.count(b) for b in range(0xC0, 0xE0))
+    if upper_half + lower_half < len(sample) * 0.01:
+        return "cp1252", 0
+    return ("cp1251", 0) if upper_half >= lower_half else ("koi8-r", 0)
+
+
+class ScriptSource:
+    """Байтовый источник строк скрипта: файл через mmap или данные в памяти.
+
+    Строки отдаются как (номер, смещение, байты) в кодировке line_encoding.
+    Для кодировок, совместимых с ASCII, это исходные байты файла; UTF-16/32
+    сначала перекодируются в UTF-8, чтобы поиск кавычек по байтам работал.
+    """
+
+    def __init__(self, data: Union[bytes, mmap.mmap], name: str = "<memory>",
+                 encoding: Optional[str] = None, _file=None):
+        self.name = name
+        self._file = _file
+        sample = bytes(data[:SAMPLE_SIZE])
+        detected, bom = detect_encoding(sample)
+        self.encoding = encoding or detected
+        self.bom_length = bom if not encoding or encoding == detected else 0
+
+        if codecs.lookup(self.encoding).name.startswith(("utf-16", "utf-32")):
+            # Строки в многобайтовых кодировках нельзя резать по b"\n"
+            text = bytes(data[self.bom_length:]).decode(self.encoding, "ignore")
+            self._close_data(data)
+            data = text.encode("utf-8")
+            self.bom_length = 0
+            self.line_encoding = "utf-8"
+        else:
+            self.line_encoding = self.encoding
+        self._data = data
+        self.size = len(data)
+
+    @classmethod
+    def open(cls, path: Union[str, Path], encoding: Optional[str] = None) -> "ScriptSource":
+        f = open(path, "rb")
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл нельзя отобразить в память
+            data = b""
+        return cls(data, str(path), encoding, _file=f)
+
+    def _close_data(self, data):
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    def close(self):
+        self._close_data(self._data)
+        self._data = b""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def data(self) -> Union[bytes, mmap.mmap]:
+        """Всё содержимое (mmap или bytes) для поиска по файлу целиком без копирования"""
+        return self._data
+
+    def read(self, start: int = 0, end: Optional[int] = None) -> bytes:
+        return bytes(self._data[start:end])
+
+    def iter_lines(self, start: int = 0, end: Optional[int] = None,
+                   first_line: int = 1) -> Iterator[Tuple[int, int, bytes]]:
+        """Строки в диапазоне байтов [start, end) без декодирования"""
+        data = self._data
+        if isinstance(data, mmap.mmap):
+            reader = data
+            reader.seek(max(start, self.bom_length))
+        else:
+            reader = io.BytesIO(data)
+            reader.seek(max(start, self.bom_length))
+        offset = reader.tell()
+        readline = reader.readline
+        lineno = first_line
+        if end is None or end >= self.size:
+            for raw in iter(readline, b""):
+                yield lineno, offset, raw
+                offset += len(raw)
+                lineno += 1
+            return
+        stop = end
+        while offset < stop:
+            raw = readline()
+            if not raw:
+                break
+            yield lineno, offset, raw
+            offset += len(raw)
+            lineno += 1
+
+    def iter_candidate_lines(self, markers: Tuple[bytes, ...], need_all=None, start: int = 0,
+                             first_line: int = 1, end: Optional[int] = None) -> Iterator[Tuple[int, int, bytes]]:
+        """Только строки, содержащие хотя бы один из маркеров (например, кавычку).
+
+        Промежутки между ними пропускаются через bytes.find, без разбора по
+        строкам в Python. Пока need_all() возвращает True (например, внутри
+        многострочной строки), строки отдаются подряд. Если задан end,
+        отдаются только строки, начинающиеся до него; first_line — номер
+        строки, с которой начинается start.
+        """
+        data = self._data
+        size = self.size if end is None else min(end, self.size)
+        find = data.find
+        rfind = data.rfind
+        pos = max(start, self.bom_length)
+        lineno = first_line
+        # Первый маркер ищется на каждом шаге, остальные (редкие) кэшируются:
+        # позиция ближайшего вхождения пересчитывается, только когда осталась позади
+        primary = markers[0]
+        rare = list(markers[1:])
+        rare_next = [find(marker, pos, size) for marker in rare]
+        next_rare = min((n for n in rare_next if n >= 0), default=size)
+        while pos < size:
+            if need_all is not None and need_all():
+                line_start = pos
+            else:
+                if next_rare < pos:
+                    for i, n in enumerate(rare_next):
+                        if 0 <= n < pos:
+                            rare_next[i] = find(rare[i], pos, size)
+                    next_rare = min((n for n in rare_next if n >= 0), default=size)
+                hit = find(primary, pos, size)
+                if hit < 0 or next_rare < hit:
+                    if next_rare >= size:
+                        return
+                    hit = next_rare
+                line_start = rfind(b"\n", pos, hit) + 1 or pos
+                if line_start > pos:
+                    lineno += data[pos:line_start].count(b"\n")
+            nl = find(b"\n", line_start)
+            pos = self.size if nl < 0 else nl + 1
+            yield lineno, line_start, data[line_start:pos]
+            lineno += 1
+
+    def decode(self, raw: bytes) -> str:
+        return raw.decode(self.line_encoding, "ignore")
@@ -0,0 +1,155 @@
+"""Поисковый указатель по извлечённым репликам.
+
+Реплики всех игр лежат в одной базе SQLite: таблица dialogues хранит
+игру, файл, строку, метку, тег, имя и текст, а полнотекстовый индекс
+FTS5 строится по тексту и имени. Переиндексация игры заменяет только
+её строки, остальные игры не трогаются.
+"""
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Union
+
+# Сколько слов вокруг совпадения показывать в выдержке
+SNIPPET_WORDS = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dialogues (
+    id INTEGER PRIMARY KEY, game TEXT NOT NULL, file TEXT, line INTEGER,
+    label TEXT, tag TEXT, name TEXT, text TEXT);
+CREATE INDEX IF NOT EXISTS dialogues_game ON dialogues (game);
+CREATE VIRTUAL TABLE IF NOT EXISTS dialogues_fts USING fts5(
+    text, name, content='dialogues', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+"""
+
+
+def default_index_path() -> Path:
+    """Указатель по умолчанию: общий для всех игр, в папке данных пользователя"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / "alice-alchemy-table" / "search.sqlite"
+
+
+def fts_query(text: str) -> str:
+    """Запрос из строки поиска: каждое слово ищется как есть, «слово*» — по началу.
+
+    Кавычки и операторы FTS5 в словах экранируются, поэтому любая
+    введённая строка даёт корректный запрос.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class SearchHit(NamedTuple):
+    """Найденная реплика и место, откуда она взята"""
+    game: str
+    file: str
+    line: int
+    label: Optional[str]
+    tag: Optional[str]
+    name: Optional[str]
+    text: str
+    # Текст с совпадениями в [скобках], обрезанный вокруг них
+    snippet: str
+
+    def location(self) -> str:
+        return f"{self.game}: {self.file}:{self.line}"
+
+
+class SearchIndex:
+    """Поисковый указатель в одном файле SQLite"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        # WAL: окно может искать, пока задание в другом потоке заносит новую игру
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _delete_game(self, game: str):
+        # У индекса с внешним содержимым строки удаляются командой 'delete' со старыми значениями
+        self._db.execute("INSERT INTO dialogues_fts (dialogues_fts, rowid, text, name)"
+                         " SELECT 'delete', id, text, name FROM dialogues WHERE game = ?", (game,))
+        self._db.execute("DELETE FROM dialogues WHERE game = ?", (game,))
+
+    def _index_new_rows(self, after_id: int):
+        self._db.execute("INSERT INTO dialogues_fts (rowid, text, name)"
+                         " SELECT id, text, name FROM dialogues WHERE id > ?", (after_id,))
+
+    def _last_id(self) -> int:
+        return self._db.execute("SELECT COALESCE(MAX(id), 0) FROM dialogues").fetchone()[0]
+
+    def replace_game(self, game: str, results_path: Union[str, Path]) -> int:
+        """Заменяет реплики игры репликами из результата в формате sqlite (см. output_writers).
+
+        Всё делается одной транзакцией: при ошибке в указателе остаётся
+        прежняя версия игры. Возвращает число занесённых реплик.
+        """
+        db = self._db
+        db.execute("ATTACH DATABASE ? AS results", (str(results_path),))
+        try:
+            with db:
+                self._delete_game(game)
+                last_id = self._last_id()
+                count = db.execute(
+                    "INSERT INTO dialogues (game, file, line, label, tag, name, text)"
+                    " SELECT ?, file, line, label, tag, name, text FROM results.dialogues ORDER BY id",
+                    (game,)).rowcount
+                self._index_new_rows(last_id)
+        finally:
+            db.execute("DETACH DATABASE results")
+        return count
+
+    def remove_game(self, game: str):
+        with self._db:
+            self._delete_game(game)
+
+    def games(self) -> Dict[str, int]:
+        """Игры в указателе и число реплик в каждой"""
+        return dict(self._db.execute("SELECT game, COUNT(*) FROM dialogues GROUP BY game ORDER BY game"))
+
+    def search(self, query: str, game: Optional[str] = None, speaker: Optional[str] = None,
+               label: Optional[str] = None, limit: int = 50) -> List[SearchHit]:
+        """Реплики по запросу, самые подходящие первыми (ранжирование bm25).
+
+        speaker сравнивается и с тегом, и с именем персонажа.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        sql = ["SELECT d.game, d.file, d.line, d.label, d.tag, d.name, d.text,"
+               f" snippet(dialogues_fts, 0, '[', ']', '…', {SNIPPET_WORDS})"
+               " FROM dialogues_fts JOIN dialogues d ON d.id = dialogues_fts.rowid"
+               " WHERE dialogues_fts MATCH ?"]
+        params = [match]
+        if game:
+            sql.append("AND d.game = ?")
+            params.append(game)
+        if speaker:
+            sql.append("AND (d.tag = ? OR d.name = ?)")
+            params += [speaker, speaker]
+        if label:
+            sql.append("AND d.label = ?")
+            params.append(label)
+        sql.append("ORDER BY rank LIMIT ?")
+        params.append(limit)
+        return [SearchHit(*row) for row in self._db.execute(" ".join(sql), params)]
@@ -0,0 +1,82 @@
+"""Указатель меток: многострочные строки, меню и выборочное извлечение"""
+from pathlib import Path
+
+from label_index import LabelIndex, LabelSelection, select_labels
+from main import RenPyParser
+from script_source import ScriptSource
+
+# Внутри route_b — многострочная реплика, продолжение которой идёт без отступа
+# и похоже на label/jump; блок route_b на ней не заканчивается
+SCRIPT = b'''label start:
+    "Hello"
+    jump route_b
+
+label route_b:
+    a "This is a long
+string that goes on
+label fake:
+    jump unrelated
+and ends here."
+    menu choice:
+        "One":
+            pass
+        "Two":
+            jump start
+    menu:
+        "X":
+            pass
+    a """Triple
+label also_fake:
+"""
+    return
+
+label unrelated:
+    "Nope"
+'''
+
+
+def test_multiline_string_does_not_end_label():
+    index = LabelIndex.build(SCRIPT)
+    assert index.names() == ['start', 'route_b', 'choice', 'unrelated']
+    route_b = index.labels[1]
+    assert route_b[2] == SCRIPT.index(b'label unrelated')
+    assert 'fake' not in index.edges and 'unrelated' not in index.edges.get('route_b', [])
+
+
+def test_reachable_ignores_jump_inside_string():
+    selections, missing = select_labels([LabelIndex.build(SCRIPT)], ['start'], reachable=True)
+    assert missing == []
+    assert selections[0].names == {'start', 'route_b', 'choice'}
+
+
+def test_menus_nested_in_label():
+    index = LabelIndex.build(SCRIPT)
+    assert [(line, name) for _, line, name in index.menus['route_b']] == [(11, 'choice'), (16, None)]
+    # Именованное меню выбирается как метка и возвращается в свою метку
+    assert index.falls['choice'] == 'route_b'
+    assert index.selection(['choice']).menus == (11,)
+    assert index.selection(['route_b']).menus == (11, 16)
+    restored = LabelIndex.from_dict(index.to_dict())
+    assert restored.menus == index.menus
+
+
+def test_extract_label_keeps_whole_string(tmp_path: Path):
+    script = tmp_path / "script.rpy"
+    script.write_bytes(SCRIPT)
+    result = RenPyParser().extract_script(script, tmp_path / "out.txt", labels=['route_b'],
+                                          keep_dialogues=True)
+    assert result['success']
+    assert result['dialogues'][0] == (
+        "a: This is a long string that goes on label fake: jump unrelated and ends here.")
+    assert result['menus'] == 2
+
+
+def test_lexer_restarts_for_each_range():
+    data = b'label a:\n    "open\n\nlabel b:\n    "b"\n\nlabel c:\n    "c text"\n'
+    cut = data.index(b'\n\nlabel b') + 1
+    c = data.index(b'label c')
+    # Строка, не закрытая к концу первого диапазона, дописывается там же и не поглощает второй
+    selection = LabelSelection(frozenset({'a', 'c'}), ((0, cut, 1), (c, len(data), 7)))
+    tokens = RenPyParser()._lexer_statements(ScriptSource(data), selection=selection)
+    assert [(text, label) for kind, _, text, _, label in tokens if kind == 'say'] == [
+        ('open', 'a'), ('c text', 'c')]
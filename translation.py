@@ -0,0 +1,278 @@
+"""Сопоставление реплик оригинала с переводом из game/tl/<язык>/.
+
+Ren'Py находит перевод реплики по идентификатору: имя метки и первые
+8 hex-знаков md5 от кода инструкции (вместе с предшествующими voice и
+т.п.). Здесь эти идентификаторы вычисляются так же, реплики оригинала
+складываются в словарь по идентификатору, а файлы перевода читаются
+потоково: каждый блок translate находит свой оригинал одним поиском в
+словаре, без попарного сравнения строк.
+"""
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from dialogue_lexer import DialogueLexer
+from output_writers import get_writer
+from script_source import ScriptSource
+
+# Блоки, внутри которых строки в кавычках — не реплики
+_SKIP_BLOCKS = re.compile(r'(?:init\b.*\b)?(?:python|screen|style|transform|layeredimage|image|testcase)\b.*:$')
+# Инструкции, которые Ren'Py переводит вместе со следующей репликой
+_TRANSLATABLE = re.compile(r'(?:voice\b|nvl\s+clear\b|window\s+(?:show|hide|auto)\b)')
+_TRANSLATE = re.compile(r'translate\s+(\w+)\s+([\w.]+)\s*:')
+_EXPLICIT_ID = re.compile(r'\bid\s+(\w+)')
+
+
+class AlignedLine(NamedTuple):
+    """Реплика оригинала и её перевод (None, если перевода нет)"""
+    identifier: str
+    file: str
+    line: int
+    label: Optional[str]
+    tag: Optional[str]
+    original: str
+    translated: Optional[str] = None
+    tl_file: Optional[str] = None
+    tl_line: Optional[int] = None
+    # Имя персонажа по тегу; заполняется при записи
+    name: Optional[str] = None
+
+    def format(self, with_names: bool = True) -> str:
+        original = f"{self.name}: {self.original}" if with_names and self.name else self.original
+        return f"{original}\n→ {self.translated if self.translated is not None else '(нет перевода)'}"
+
+
+def _dequote(m) -> str:
+    c = m.group(1)
+    if c == "{":
+        return "{{"
+    if c == "[":
+        return "[["
+    if c == "%":
+        return "%%"
+    if c == "n":
+        return "\n"
+    if c[0] == "u" and len(c) > 1:
+        return chr(int(c[1:], 16))
+    return c
+
+
+def renpy_string(raw: str) -> str:
+    """Значение строки так, как его видит Ren'Py: пробелы схлопнуты, экранирование раскрыто"""
+    raw = re.sub(r'[ \n]+', ' ', raw)
+    return re.sub(r'\\(u[0-9a-fA-F]{1,4}|.)', _dequote, raw)
+
+
+def encode_say_string(s: str) -> str:
+    """Как renpy.translation.encode_say_string: строка обратно в код инструкции"""
+    s = s.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    s = re.sub(r'(?<= ) ', '\\ ', s)
+    return '"' + s + '"'
+
+
+def display_text(raw: str) -> str:
+    """Текст для вывода — как у основного разбора: пробелы схлопнуты, кавычки раскрыты, \\n оставлен как есть"""
+    return DialogueLexer.unescape(" ".join(raw.split()))
+
+
+def _statements(source: ScriptSource) -> Iterator[Tuple[int, int, str]]:
+    """Логические строки файла (номер, отступ, текст) — склейка строк из DialogueLexer"""
+    return DialogueLexer().statements(source.iter_lines(), source.line_encoding)
+
+
+def _say_code(who: Optional[str], attributes: List[str], what: str, rest: str) -> str:
+    parts = []
+    if who:
+        parts.append(who)
+    parts.extend(attributes)
+    parts.append(encode_say_string(what))
+    if rest:
+        parts.append(" ".join(rest.split()))
+    return " ".join(parts)
+
+
+def _tag(who: Optional[str]) -> Optional[str]:
+    if who and who[0] in '"\'':
+        return display_text(who[1:-1])
+    return who
+
+
+def iter_original(source: ScriptSource, file: str, identifiers: Dict[str, int],
+                  choices: Optional[Dict[str, Tuple[str, int, Optional[str]]]] = None) -> Iterator[AlignedLine]:
+    """Реплики оригинала с идентификаторами перевода.
+
+    identifiers — общий на всю игру счётчик уже выданных идентификаторов:
+    одинаковые реплики под одной меткой получают суффиксы _1, _2, как в
+    Ren'Py. Файлы нужно передавать в порядке загрузки (по именам).
+    В choices складываются пункты меню: текст → (файл, строка, метка).
+    """
+    label = None
+    global_label = None
+    skip_indent = None
+    group = []
+    for lineno, indent, text in _statements(source):
+        if skip_indent is not None:
+            if indent > skip_indent:
+                continue
+            skip_indent = None
+        if text.startswith("label ") or text.startswith("label\t"):
+            group = []
+            name = re.match(r'label\s+([\w.]+)', text)
+            if name:
+                name = name.group(1)
+                if name.startswith("."):
+                    name = (global_label or "") + name
+                else:
+                    global_label = name.split(".")[0]
+                if not name.startswith("_") and not re.search(r'\bhide\s*:', text):
+                    label = name
+            continue
+        if _SKIP_BLOCKS.match(text) or text.startswith("translate "):
+            group = []
+            skip_indent = indent
+            continue
+        if _TRANSLATABLE.match(text):
+            group.append(" ".join(text.split()))
+            continue
+        say = DialogueLexer.parse_say(text)
+        if say is None or say.kind == 'choice':
+            group = []
+            if say is not None and choices is not None:
+                choices.setdefault(display_text(say.raw), (file, lineno, label))
+            continue
+        _, who, attributes, raw, rest, quote = say
+        # Тройные кавычки Ren'Py делит на отдельные реплики по абзацам
+        paragraphs = raw.split("\n\n") if len(quote) == 3 else [raw]
+        for paragraph in paragraphs:
+            what = renpy_string(paragraph.strip() if len(quote) == 3 else paragraph)
+            if not what:
+                continue
+            code = group + [_say_code(who, attributes, what, _EXPLICIT_ID.sub("", rest))]
+            group = []
+            explicit = _EXPLICIT_ID.search(rest)
+            if explicit:
+                identifier = explicit.group(1)
+            else:
+                md5 = hashlib.md5()
+                for statement in code:
+                    md5.update(statement.encode("utf-8") + b"\r\n")
+                base = (label + "_" if label else "") + md5.hexdigest()[:8]
+                identifier = base.replace(".", "_")
+                count = identifiers.get(identifier, 0)
+                identifiers[identifier] = count + 1
+                if count:
+                    identifier = f"{identifier}_{count}"
+            yield AlignedLine(identifier, file, lineno, label, _tag(who), display_text(paragraph))
+
+
+def iter_translated(source: ScriptSource, language: str) -> Iterator[Tuple[str, Optional[str], str, int]]:
+    """Переводы из файла tl: (идентификатор, тег, текст, строка).
+
+    Блоки translate <язык> strings дают пары old/new; идентификатором у
+    них служит сам исходный текст с префиксом "strings:".
+    """
+    block = None
+    block_indent = 0
+    old = None
+    for lineno, indent, text in _statements(source):
+        if indent == 0:
+            block = None
+            m = _TRANSLATE.match(text)
+            if m and m.group(1) == language:
+                block = m.group(2)
+                block_indent = indent
+                old = None
+            continue
+        if block is None or indent <= block_indent:
+            continue
+        if block == "strings":
+            if text.startswith("old "):
+                old = display_text(text[4:].strip()[1:-1])
+            elif text.startswith("new ") and old is not None:
+                yield "strings:" + old, None, display_text(text[4:].strip()[1:-1]), lineno
+                old = None
+            continue
+        say = DialogueLexer.parse_say(text)
+        if say is not None and say.kind != 'choice':
+            yield block, _tag(say.who), display_text(say.raw), lineno
+
+
+def original_files(game_dir: Path) -> List[Path]:
+    """Скрипты игры без папки tl в порядке загрузки Ren'Py"""
+    return sorted((path for path in game_dir.rglob("*.rpy")
+                   if path.relative_to(game_dir).parts[0] != "tl"),
+                  key=lambda path: path.relative_to(game_dir).as_posix())
+
+
+def translation_files(game_dir: Path, language: str) -> List[Path]:
+    return sorted((game_dir / "tl" / language).rglob("*.rpy"))
+
+
+def align(game_dir: Path, language: str, encoding: Optional[str] = None,
+          include_untranslated: bool = True, cancel_token=None) -> Iterator[AlignedLine]:
+    """Пары оригинал/перевод: сначала в порядке файлов перевода, затем непереведённые.
+
+    Оригинал целиком помещается в словарь (идентификатор → реплика), а
+    файлы перевода читаются потоково. Найденные реплики из словаря
+    удаляются, так что остаток — это непереведённые строки.
+    """
+    game_dir = Path(game_dir)
+    originals = {}
+    identifiers = {}
+    choices = {}
+    for path in original_files(game_dir):
+        with ScriptSource.open(path, encoding) as source:
+            for line in iter_original(source, path.relative_to(game_dir).as_posix(), identifiers, choices):
+                originals[line.identifier] = line
+        if cancel_token is not None and cancel_token.is_set():
+            return
+
+    for path in translation_files(game_dir, language):
+        tl_file = path.relative_to(game_dir).as_posix()
+        with ScriptSource.open(path, encoding) as source:
+            for identifier, tag, text, lineno in iter_translated(source, language):
+                if identifier.startswith("strings:"):
+                    # Пункты меню и прочие old/new переводятся по самому тексту
+                    original = identifier[len("strings:"):]
+                    file, line_no, label = choices.get(original, ("", 0, None))
+                    yield AlignedLine(identifier, file, line_no, label, None, original, text, tl_file, lineno)
+                    continue
+                line = originals.pop(identifier, None)
+                if line is None:
+                    # Перевод без оригинала (реплика удалена или изменена)
+                    yield AlignedLine(identifier, "", 0, None, tag, "", text, tl_file, lineno)
+                    continue
+                yield line._replace(translated=text, tl_file=tl_file, tl_line=lineno)
+        if cancel_token is not None and cancel_token.is_set():
+            return
+    if include_untranslated:
+        yield from originals.values()
+
+
+# Поля пары оригинал/перевод в структурированных форматах
+ALIGNED_FIELDS = ("identifier", "file", "line", "label", "tag", "name", "original", "translated",
+                  "tl_file", "tl_line")
+
+
+def _aligned_row(line: AlignedLine, source: str) -> tuple:
+    return (line.identifier, line.file, line.line, line.label, line.tag, line.name, line.original,
+            line.translated, line.tl_file, line.tl_line)
+
+
+def write_aligned(lines: Iterator[AlignedLine], path: Path, output_format: str = "text",
+                  resolve=None) -> int:
+    """Пишет пары в файл по мере поступления; resolve(тег) → имя персонажа.
+
+    Пишет писатель формата из output_writers.WRITERS: в тексте оригинал и
+    перевод идут друг под другом, в структурированных форматах — поля
+    ALIGNED_FIELDS (в SQLite — таблица aligned). Возвращает число пар.
+    """
+    resolve = resolve or (lambda tag: tag)
+    writer = get_writer(output_format)(path, fields=ALIGNED_FIELDS, row=_aligned_row, table="aligned")
+    try:
+        for line in lines:
+            writer.write(line._replace(name=resolve(line.tag) if line.tag else None), line.file)
+    finally:
+        writer.close()
+    return writer.count